@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+"""
+This module measures the latency of the buzzer API with simulated buzzers.
+Presses are injected into simulated USB devices at a given rate and the time
+until they arrive at the callback of BuzzerReader or BuzzerReaderPoller is
+measured. With the option '--gui' the whole chain up to the handling of the
+press by QuestionViewPanel is measured.
+
+Usage:
+
+    python3 -m buzzer.benchmark --devices 1,4,12 --rate 10 --duration 5
+
+The GUI is run with the offscreen platform of Qt, so no display is needed.
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import threading
+import collections
+
+from buzzer import simulation
+simulation.install_fake_usb_modules()
+from buzzer import buzzer
+from buzzer import debounce
+
+
+logger = logging.getLogger('pyPardy.buzzer')
+
+
+# all reader classes that can be benchmarked
+READER_CLASSES = collections.OrderedDict([('reader', buzzer.BuzzerReader),
+                                          ('poller', buzzer.BuzzerReaderPoller)])
+# time in seconds to wait for outstanding presses after the injection ended
+GRACE_PERIOD = 0.5
+
+
+class LatencyProbe(object):
+    """Stores the injection time of all presses and calculates the latency
+    when a press arrives at the end of the measured chain."""
+    def __init__(self):
+        self.__injected = collections.defaultdict(collections.deque)
+        self.__lock = threading.Lock()
+        self.latencies = []
+        self.received = 0
+
+    def on_injected(self, buzzer_id, timestamp):
+        with self.__lock:
+            self.__injected[buzzer_id].append(timestamp)
+
+    def take_injection(self, buzzer_id):
+        """Returns the injection time of the oldest press of the given buzzer
+        that has not arrived yet or None."""
+        with self.__lock:
+            injected = self.__injected[buzzer_id]
+            return injected.popleft() if injected else None
+
+    def add_latency(self, injection_time, now):
+        """Registers the arrival of a press that was injected at the given
+        time."""
+        if injection_time is None:
+            return
+        with self.__lock:
+            self.latencies.append(now - injection_time)
+            self.received += 1
+
+    def on_received(self, buzzer_id):
+        """Registers the arrival of the oldest press of the given buzzer."""
+        now = buzzer.get_timestamp()
+        self.add_latency(self.take_injection(buzzer_id), now)
+
+
+def percentile(values, percent):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = int(round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def inject_presses(devices, rate, duration, probe):
+    """Presses all devices round robin, so that every device is pressed
+    'rate' times per second.
+
+    :returns: number of presses that were lost inside the devices
+    """
+    interval = 1 / (rate * len(devices))
+    start = time.perf_counter()
+    count = 0
+    lost = 0
+    while True:
+        next_press = start + count * interval
+        if next_press - start >= duration:
+            break
+        delay = next_press - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        device = devices[count % len(devices)]
+        injection_time = buzzer.get_timestamp()
+        if device.press():
+            probe.on_injected(device.device_id, injection_time)
+        else:
+            lost += 1
+        count += 1
+    return lost
+
+
+def run_benchmark(reader_name, number_of_devices, rate, duration, gui=None):
+    """Runs one benchmark and returns its results as dictionary.
+
+    :param reader_name: key from READER_CLASSES
+    :param number_of_devices: number of simulated buzzers
+    :param rate: presses per second and device
+    :param duration: duration of the injection in seconds
+    :param gui: instance of GuiChain, if the whole chain should be measured
+    """
+    reader_class = READER_CLASSES[reader_name]
+    context, devices = simulation.create_simulated_buzzers(
+        number_of_devices, has_hotplug=(reader_class is buzzer.BuzzerReader))
+    probe = LatencyProbe()
+    if gui:
+        reader = gui.connect(lambda callback: reader_class(callback, context=context),
+                             probe)
+    else:
+        reader = reader_class(lambda press: probe.on_received(press.buzzer_id),
+                              context=context)
+    # give the poller the chance to find all devices
+    time.sleep(0.05)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if gui:
+        lost = gui.run_while(inject_presses, devices, rate, duration, probe)
+        gui.process_events(GRACE_PERIOD)
+    else:
+        lost = inject_presses(devices, rate, duration, probe)
+        time.sleep(GRACE_PERIOD)
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    if gui:
+        lost_arbitration = gui.lost_arbitration
+        debounced = gui.disconnect()
+    else:
+        reader.stop()
+        reader.join()
+        lost_arbitration = 0
+        debounced = 0
+    injected = sum(d.injected_presses for d in devices)
+    return {'reader': reader_name,
+            'devices': number_of_devices,
+            'rate': rate,
+            'injected': injected,
+            'received': probe.received,
+            'lost arbitration': lost_arbitration,
+            'debounced': debounced,
+            'dropped': injected - probe.received - debounced,
+            'lost in device': lost,
+            'p50 (ms)': percentile(probe.latencies, 50) * 1000,
+            'p99 (ms)': percentile(probe.latencies, 99) * 1000,
+            'cpu (%)': cpu_time / wall_time * 100}
+
+
+class GuiChain(object):
+    """Builds the Qt part of the chain (BuzzerConnector -> QuestionViewPanel)
+    with the offscreen platform of Qt. The panel is connected to the
+    connector the same way as in the game and handles every press with its
+    slot on_buzzer_pressed(). The game writes no score journal, so the
+    journal of real games is not touched.
+
+    Every press that leaves the debouncer is delivered by the connector,
+    either as winner or as loser of the arbitration. To find the injection
+    time of a delivered press, the raw presses of the reader run through a
+    second debouncer with the same settings as the one of the connector.
+    """
+    def __init__(self):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        import gettext
+        gettext.install('pyPardy', './locale')
+        from PyQt4 import QtGui
+        self.app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv)
+        from data import game
+        from data.model import Round, Topic, Question
+        from gui import game as game_ui
+        from gui import helper
+        self.helper = helper
+        self.game_data = game.Game()
+        self.game_data.current_round_data = Round('Benchmark', [Topic('Benchmark', [
+            Question('Which team has pressed its buzzer first?', 'The fastest team.')])])
+        self.game_data.current_topic = 0
+        self.game_data.current_question = 0
+        self.panel = game_ui.QuestionViewPanel(None, self.game_data, 1024, 768)
+        self.connector = None
+        self.__lock = threading.Lock()
+
+    def connect(self, reader_factory, probe):
+        self.probe = probe
+        self.lost_arbitration = 0
+        self.mirror_debouncer = None
+        if self.helper.DEBOUNCE_BUZZER:
+            self.mirror_debouncer = debounce.BuzzerDebouncer(self.helper.DEBOUNCE_POLICY,
+                                                             self.helper.DEBOUNCE_INTERVAL)
+        self.injection_times = {}
+        self.delivered = collections.defaultdict(collections.deque)
+
+        def create_reader(callback):
+            def on_press(press):
+                self.on_raw_press(press)
+                callback(press)
+            return reader_factory(on_press)
+        self.connector = self.helper.BuzzerConnector(create_reader)
+        # the panel gets the connector from get_buzzer_connector() when it is
+        # activated, like in the game
+        self.helper.STATIC_INSTANCE_OF_BUZZER_CONNECTOR = self.connector
+        self.panel.activate()
+        while self.panel.buzzer_connector is None:
+            self.app.processEvents()
+        # connected after the panel, so the press has been handled by the
+        # panel when the probe is called
+        self.connector.buzzing_ordered.connect(self.on_buzzer_pressed)
+        return self.connector.buzzer_reader
+
+    def disconnect(self):
+        """Stops the connector and returns the number of presses that were
+        suppressed by its debouncer."""
+        debounced = sum(self.connector.get_suppressed_presses().values())
+        self.connector.buzzing_ordered.disconnect(self.on_buzzer_pressed)
+        self.panel.release()
+        self.helper.STATIC_INSTANCE_OF_BUZZER_CONNECTOR = None
+        self.connector.close_connection()
+        self.connector = None
+        return debounced
+
+    def close(self):
+        self.panel.dispose()
+        self.game_data.close()
+
+    def on_raw_press(self, press):
+        """Is called in the reader thread for every press before it is given
+        to the connector."""
+        injection_time = self.probe.take_injection(press.buzzer_id)
+        with self.__lock:
+            self.injection_times[press] = injection_time
+            if self.mirror_debouncer is None:
+                self.add_delivered(press)
+            elif self.mirror_debouncer.process(press):
+                self.add_delivered(press)
+
+    def add_delivered(self, press):
+        self.delivered[press.buzzer_id].append(self.injection_times.pop(press))
+
+    def take_delivered(self, buzzer_id):
+        with self.__lock:
+            if not self.delivered[buzzer_id] and self.mirror_debouncer is not None:
+                # presses held back by trailing edge debouncing
+                for press in self.mirror_debouncer.poll(buzzer.get_timestamp()):
+                    self.add_delivered(press)
+            if self.delivered[buzzer_id]:
+                return self.delivered[buzzer_id].popleft()
+            return None
+
+    def on_buzzer_pressed(self, buzzer_id, ordered_presses):
+        self.panel.repaint()
+        now = buzzer.get_timestamp()
+        for index, (press_buzzer_id, delta) in enumerate(ordered_presses):
+            self.probe.add_latency(self.take_delivered(press_buzzer_id), now)
+            if index > 0:
+                self.lost_arbitration += 1
+        # let the panel accept the next press, like for a new question
+        if self.panel.last_buzzed_team != -1:
+            self.panel.activate()
+
+    def process_events(self, duration):
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            self.app.processEvents()
+            time.sleep(0.0005)
+
+    def run_while(self, function, *args):
+        """Calls function in another thread and processes Qt events until it
+        has finished. Returns the result of the function."""
+        result = []
+        thread = threading.Thread(target=lambda: result.append(function(*args)))
+        thread.start()
+        while thread.is_alive():
+            self.app.processEvents()
+            time.sleep(0.0005)
+        return result[0]
+
+
+def print_results(results):
+    columns = ['reader', 'devices', 'rate', 'injected', 'received', 'lost arbitration',
+               'debounced', 'dropped', 'lost in device', 'p50 (ms)', 'p99 (ms)', 'cpu (%)']
+    print(' | '.join('{:>16}'.format(c) for c in columns))
+    for result in results:
+        values = []
+        for c in columns:
+            value = result[c]
+            if isinstance(value, float):
+                values.append('{:>16.3f}'.format(value))
+            else:
+                values.append('{:>16}'.format(value))
+        print(' | '.join(values))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the latency of the buzzer API with simulated buzzers.')
+    parser.add_argument('--readers', default=','.join(READER_CLASSES),
+                        help='comma separated list of readers to benchmark')
+    parser.add_argument('--devices', default='1,4,12',
+                        help='comma separated list of device counts')
+    parser.add_argument('--rate', type=float, default=10,
+                        help='presses per second and device')
+    parser.add_argument('--duration', type=float, default=3,
+                        help='duration of each benchmark in seconds')
+    parser.add_argument('--gui', action='store_true',
+                        help='measure the whole chain up to TeamViewPanel')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args(argv)
+    gui = GuiChain() if args.gui else None
+    results = []
+    try:
+        for reader_name in args.readers.split(','):
+            for number_of_devices in args.devices.split(','):
+                results.append(run_benchmark(reader_name, int(number_of_devices),
+                                             args.rate, args.duration, gui))
+    finally:
+        if gui:
+            gui.close()
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,8 @@
 
 """
 This module handles all low level USB access. To use this just create an
-instance of BuzzerReader with a callback as an argument.
+instance of BuzzerReader with a callback as an argument. The callback gets a
+BuzzerPress for every press of a buzzer.
 """
 
 import threading
@@ -12,6 +13,8 @@ import usb1
 import libusb1
 import logging
 
+from buzzer.press import BuzzerPress, get_timestamp
+
 
 logger = logging.getLogger('pyPardy.buzzer')
 
@@ -38,25 +41,104 @@ USBDEV_PRODUCT      = 0x05DC
 BUZZER_MAGIC_MARKER = 0xa5
 # Interface to claim
 INTERFACE = 0
+# Interrupt endpoint that reports button presses
+ENDPOINT = 1
 # timeout for USB connection
 USB_TIMEOUT = 250
+# maximum interval in seconds for scanning the bus when hotplug is not
+# available
+POLLING_INTERVAL = 0.5
+# interval in seconds for scanning the bus after a device was added or removed
+MINIMUM_POLLING_INTERVAL = 0.1
+# factor to increase the scan interval after each scan without changes
+POLLING_BACKOFF_FACTOR = 1.5
+# number of attempts to read the device id of a newly arrived buzzer
+DEVICE_ID_RETRIES = 3
+# number of failed interrupt transfers in a row after which a buzzer is no
+# longer read
+INTERRUPT_TRANSFER_RETRIES = 10
+
+
+class DeviceIdRegistry(object):
+    """Stores the device ids of all buzzers that have been seen by a reader.
+    The ids are keyed by the bus number and the port numbers of the physical
+    port the buzzer is plugged in, so that they survive unplugging and
+    replugging a buzzer, while the device address changes every time.
+    """
+    def __init__(self):
+        self.__device_ids = {}
 
-
-class BuzzerDevice(threading.Thread):
-    """Represents one Buzzer. Is a thread, that calls 'callback', everytime
-       the Buzzer gets pressed.
+    @staticmethod
+    def get_key(dev):
+        """Returns the key for a given usb1 device. If the port numbers can
+        not be determined, the device address is used instead."""
+        try:
+            ports = tuple(dev.getPortNumberList())
+        except (AttributeError, libusb1.USBError):
+            ports = ()
+        if not ports:
+            ports = ('address', dev.getDeviceAddress())
+        return (dev.getBusNumber(), ports)
+
+    def get(self, key):
+        """Returns the stored device id for the given key or None."""
+        return self.__device_ids.get(key)
+
+    def set(self, key, device_id):
+        if self.__device_ids.get(key) not in (None, device_id):
+            logger.info('Buzzer at port {} changed id from {} to {}.'
+                        .format(key, self.__device_ids[key], device_id))
+        self.__device_ids[key] = device_id
+
+    def items(self):
+        return list(self.__device_ids.items())
+
+
+class BuzzerDevice(object):
+    """Represents one Buzzer. An asynchronous interrupt transfer is kept
+    submitted for the device and 'callback' is called with a BuzzerPress
+    everytime the Buzzer gets pressed.
+
+    All transfers are serviced by the event loop of the reader that owns this
+    device (see BuzzerReader.run()), so no thread is needed per buzzer. The
+    callback is therefore always called from inside the readers thread.
+
+    The device id is read when the device is started and stored in the given
+    registry. If the registry already knows an id for the port of this device,
+    presses are reported with that id until the read has completed. Presses
+    never cause any USB request.
+
+    :param dev: usb1 device of the buzzer
+    :param callback: callable that gets a BuzzerPress for every press
+    :param registry: DeviceIdRegistry shared by all devices of a reader
     """
-    def __init__(self, dev, callback):
-        super().__init__()
+    def __init__(self, dev, callback, registry=None):
         self.__device = dev
+        # stays None if the device can not be opened
+        self.__handle = None
         self.__handle = self.open_device(dev)
+        self.__registry = registry if registry is not None else DeviceIdRegistry()
+        self.__registry_key = DeviceIdRegistry.get_key(dev)
         self.__device_id = 0x00
         self.__device_id_dirty = True
-        self.__keep_running = True
+        self.__device_id_known = False
+        self.__device_id_retries = DEVICE_ID_RETRIES
+        cached_device_id = self.__registry.get(self.__registry_key)
+        if cached_device_id is not None:
+            self.__device_id = cached_device_id
+            self.__device_id_known = True
+        self.__keep_running = False
         self.__callback = callback
+        self.__bus = dev.getBusNumber()
+        self.__address = dev.getDeviceAddress()
+        # timestamps of presses that wait for the device id to be read
+        self.__pending_presses = []
+        self.__interrupt_transfer = None
+        self.__interrupt_errors = 0
+        self.__control_transfer = None
 
     def __del__(self):
-        """Make sure the thread is stopped and the device is closed."""
+        """Make sure the transfers are stopped and the device is closed."""
         self.__keep_running = False
         try:
             # close device only if still available
@@ -65,31 +147,65 @@ class BuzzerDevice(threading.Thread):
         except libusb1.USBError:
             pass
 
-    def run(self):
-        while(self.__keep_running):
-            if self.read_interrupt():
-                try:
-                    self.__callback(self.get_device_id())
-                except libusb1.USBError:
-                    logger.error('Could not get device id!')
+    def start(self):
+        """Reads the device id and submits the interrupt transfer for this
+        device. From now on all presses are reported while the owning reader
+        handles events.
+        """
+        self.__keep_running = True
+        if self.__device_id_dirty:
+            self.request_device_id()
+        self.__interrupt_transfer = self.__handle.getTransfer()
+        self.__interrupt_transfer.setInterrupt(ENDPOINT | libusb1.LIBUSB_ENDPOINT_IN, 1,
+                                               callback=self.on_interrupt_transfer,
+                                               timeout=0)
+        self.__interrupt_transfer.submit()
 
     def stop(self):
+        """Cancels all pending transfers. The transfers are finished by the
+        event loop of the owning reader.
+        """
         self.__keep_running = False
+        for transfer in (self.__interrupt_transfer, self.__control_transfer):
+            if transfer is not None and transfer.isSubmitted():
+                try:
+                    transfer.cancel()
+                except libusb1.USBError:
+                    pass
+
+    def is_busy(self):
+        """Returns whether any transfer of this device is still submitted."""
+        return any(transfer is not None and transfer.isSubmitted()
+                   for transfer in (self.__interrupt_transfer,
+                                    self.__control_transfer))
 
     def open_device(self, dev):
         handle = dev.open()
-        if platform.system() == 'Linux' and handle.kernelDriverActive(INTERFACE):
-            handle.detachKernelDriver(INTERFACE)
-        handle.claimInterface(INTERFACE)
+        try:
+            if platform.system() == 'Linux' and handle.kernelDriverActive(INTERFACE):
+                handle.detachKernelDriver(INTERFACE)
+            handle.claimInterface(INTERFACE)
+        except libusb1.USBError:
+            handle.close()
+            raise
         return handle
 
     def close_device(self):
-        self.__handle.releaseInterface(INTERFACE)
+        if self.__handle is None:
+            return
+        try:
+            self.__handle.releaseInterface(INTERFACE)
+        except libusb1.USBError:
+            # device is already gone, the handle has to be closed anyway
+            pass
         self.__handle.close()
+        self.__handle = None
 
     def set_device_id(self, device_id):
-        self.__device_id_dirty = True
-        self.__device_id = device_id
+        self.__device_id = int(device_id)
+        self.__device_id_dirty = False
+        self.__device_id_known = True
+        self.__registry.set(self.__registry_key, self.__device_id)
         self.__handle.controlRead(libusb1.LIBUSB_TYPE_VENDOR |
                                   libusb1.LIBUSB_RECIPIENT_DEVICE |
                                   libusb1.LIBUSB_ENDPOINT_IN,
@@ -98,6 +214,9 @@ class BuzzerDevice(threading.Thread):
     def get_device_id(self):
         """Returns Buzzer ID. uses a dirty flag, to prevent unnecessary USB
         reads.
+
+        This method blocks and must not be called from inside a transfer
+        callback. Presses are reported via request_device_id() instead.
         """
         if self.__device_id_dirty:
             ret = self.__handle.controlRead(libusb1.LIBUSB_TYPE_VENDOR |
@@ -106,39 +225,116 @@ class BuzzerDevice(threading.Thread):
                                             0, 0x00, 0, 1, timeout=USB_TIMEOUT)
             self.__device_id = int(ret[0])
             self.__device_id_dirty = False
+            self.__device_id_known = True
+            self.__registry.set(self.__registry_key, self.__device_id)
         return self.__device_id
 
+    def request_device_id(self):
+        """Reads the Buzzer ID with an asynchronous control transfer. Uses the
+        same dirty flag as get_device_id(). All presses that happen before any
+        id is known are reported when the control transfer has completed.
+        """
+        if self.__control_transfer is not None and self.__control_transfer.isSubmitted():
+            return
+        if self.__control_transfer is None:
+            self.__control_transfer = self.__handle.getTransfer()
+        self.__control_transfer.setControl(libusb1.LIBUSB_TYPE_VENDOR |
+                                           libusb1.LIBUSB_RECIPIENT_DEVICE |
+                                           libusb1.LIBUSB_ENDPOINT_IN,
+                                           0, 0x00, 0, 1,
+                                           callback=self.on_control_transfer,
+                                           timeout=USB_TIMEOUT)
+        self.__control_transfer.submit()
+
     def get_device(self):
         return self.__device
 
-    def read_interrupt(self, timeout=USB_TIMEOUT):
-        """Read the USB Interrupt Endpoint. Blocks until byte is read or
-        timeout.
+    def on_interrupt_transfer(self, transfer):
+        """Transfer callback for the interrupt endpoint. Reports the press and
+        submits the transfer again as long as the device should be read.
+        Failed transfers are submitted again, until INTERRUPT_TRANSFER_RETRIES
+        transfers in a row have failed.
         """
-        try:
-            temp = int(self.__handle.interruptRead(endpoint=1, length=1,
-                                                   timeout=timeout)[0])
-            if temp == BUZZER_MAGIC_MARKER:
-                return True
+        timestamp = get_timestamp()
+        status = transfer.getStatus()
+        if status == libusb1.LIBUSB_TRANSFER_COMPLETED:
+            self.__interrupt_errors = 0
+            if (transfer.getActualLength() and
+                int(transfer.getBuffer()[0]) == BUZZER_MAGIC_MARKER):
+                self.on_press(timestamp)
             else:
-                raise libusb1.USBError('Wrong buzzer marker!')
-        except libusb1.USBError:
-            return False
-        return False
+                logger.warning('Wrong buzzer marker!')
+        elif status in (libusb1.LIBUSB_TRANSFER_CANCELLED, libusb1.LIBUSB_TRANSFER_NO_DEVICE):
+            # device was removed or transfer was cancelled
+            return
+        elif status != libusb1.LIBUSB_TRANSFER_TIMED_OUT:
+            self.__interrupt_errors += 1
+            logger.warning('Interrupt transfer of buzzer {} failed with status {}.'
+                           .format(self.__device_id, status))
+            if self.__interrupt_errors >= INTERRUPT_TRANSFER_RETRIES:
+                logger.error('Giving up reading buzzer {} after {} failed transfers!'
+                             .format(self.__device_id, self.__interrupt_errors))
+                return
+        if self.__keep_running:
+            try:
+                transfer.submit()
+            except libusb1.USBError:
+                logger.error('Could not resubmit interrupt transfer!')
+
+    def on_control_transfer(self, transfer):
+        """Transfer callback for reading the device id."""
+        status = transfer.getStatus()
+        if status == libusb1.LIBUSB_TRANSFER_COMPLETED and transfer.getActualLength():
+            self.__device_id = int(transfer.getBuffer()[0])
+            self.__device_id_dirty = False
+            self.__device_id_known = True
+            self.__registry.set(self.__registry_key, self.__device_id)
+            pending, self.__pending_presses = self.__pending_presses, []
+            for timestamp in pending:
+                self.report_press(timestamp)
+        elif (status not in (libusb1.LIBUSB_TRANSFER_CANCELLED, libusb1.LIBUSB_TRANSFER_NO_DEVICE)
+              and self.__keep_running and self.__device_id_retries > 0):
+            self.__device_id_retries -= 1
+            logger.warning('Could not get device id, trying again...')
+            self.request_device_id()
+        else:
+            self.__pending_presses = []
+            logger.error('Could not get device id!')
+
+    def on_press(self, timestamp):
+        if self.__device_id_known:
+            self.report_press(timestamp)
+        else:
+            # device id is still read, see start()
+            self.__pending_presses.append(timestamp)
+
+    def report_press(self, timestamp):
+        self.__callback(BuzzerPress(self.__device_id, timestamp,
+                                    self.__bus, self.__address))
 
     def flush_interrupt_data(self):
         """A pressed button is 'stored' in the device and may need to get
         flushed, before a real value can be read.
+
+        Because the interrupt transfer is always submitted, stored presses are
+        read as soon as they occur, so nothing has to be done here.
         """
-        self.read_interrupt()
+        pass
 
 
 class BuzzerReader(threading.Thread):
-    def __init__(self, callback):
+    """Reads all buzzers in a single thread. Devices are found via hotplug
+    callbacks and their transfers are serviced by one libusb event loop.
+    """
+    def __init__(self, callback, context=None):
         super().__init__()
         self.__callback = callback
         self.__device_list = []
-        self.__context = self.init_context()
+        # removed devices whose handles are closed after their transfers
+        # have finished
+        self.__removed_devices = []
+        self.__device_ids = DeviceIdRegistry()
+        self.__context = context if context is not None else self.init_context()
         self.__context.hotplugRegisterCallback(self.callback_device_left,
                                                events=libusb1.LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT,
                                                vendor_id=USBDEV_VENDOR, product_id=USBDEV_PRODUCT)
@@ -151,13 +347,18 @@ class BuzzerReader(threading.Thread):
 
     def stop(self):
         self.__keep_running = False
+        wake_up_event_loop(self.__context)
 
     def run(self):
         try:
-            while True:
-                self.__context.handleEvents()
+            while self.__keep_running:
+                handle_events(self.__context)
+                self.__removed_devices = close_stopped_devices(self.__removed_devices)
         except (KeyboardInterrupt, SystemExit):
             pass
+        close_devices(self.__context, self.__device_list + self.__removed_devices)
+        self.__device_list = []
+        self.__removed_devices = []
         self.__context.exit()
 
     def init_context(self):
@@ -168,23 +369,30 @@ class BuzzerReader(threading.Thread):
 
     def callback_device_arrived(self, context, device, event):
         """Hotplug callback for device arrival. Gets called for every existing
-        device at the start.
+        device at the start. The device id is read right away, so that it is
+        known before the first press.
         """
-        bd = BuzzerDevice(device, self.__callback)
+        try:
+            bd = BuzzerDevice(device, self.__callback, self.__device_ids)
+            bd.start()
+        except libusb1.USBError:
+            logger.error('Could not open buzzer {}!'.format(
+                (device.getBusNumber(), device.getDeviceAddress())))
+            # return False, to *not* cancel the callback
+            return False
         self.__device_list.append(bd)
-        bd.daemon = True
-        bd.start()
         # return False, to *not* cancel the callback
         return False
 
     def callback_device_left(self, context, device, event):
         """Hotplug callback for device removal."""
-        for d in self.__device_list:
+        for d in list(self.__device_list):
             # check which device was removed - the device address is assigned
             # by the os and should be pretty unique. I think...
             if device.getDeviceAddress() == d.get_device().getDeviceAddress():
                 d.stop()
                 self.__device_list.remove(d)
+                self.__removed_devices.append(d)
         # return False, to *not* cancel the callback
         return False
 
@@ -194,60 +402,149 @@ class BuzzerReader(threading.Thread):
 
 
 class BuzzerReaderPoller(threading.Thread):
-    def __init__(self, callback):
+    """Reads all buzzers in a single thread on systems where BuzzerReader can
+    not be used. If the libusb version supports hotplug, devices are watched
+    by hotplug callbacks. Otherwise the bus is scanned for new devices and all
+    transfers are serviced by the same thread in between.
+
+    The scan interval starts at MINIMUM_POLLING_INTERVAL and is increased by
+    POLLING_BACKOFF_FACTOR after every scan without changes up to
+    POLLING_INTERVAL. Only devices with a (bus, address) pair that was not
+    seen before are opened. Statistics about the scans can be read with
+    get_statistics().
+
+    :param use_hotplug: whether to use hotplug callbacks if available
+    """
+    def __init__(self, callback, context=None, use_hotplug=True):
         super().__init__()
         self.__callback = callback
         self.__devices_already_registered = {}
-        self.__context = self.init_context()
+        # removed devices whose handles are closed after their transfers
+        # have finished
+        self.__removed_devices = []
+        self.__device_ids = DeviceIdRegistry()
+        self.__context = context if context is not None else self.init_context()
+        self.__use_hotplug = (use_hotplug and
+                              self.__context.hasCapability(libusb1.LIBUSB_CAP_HAS_HOTPLUG))
+        self.__scan_interval = MINIMUM_POLLING_INTERVAL
+        self.__statistics = {'mode': 'hotplug' if self.__use_hotplug else 'polling',
+                             'scan interval': self.__scan_interval,
+                             'scans': 0,
+                             'last scan cost': 0.0,
+                             'total scan cost': 0.0,
+                             'devices': 0,
+                             'devices added': 0,
+                             'devices removed': 0}
+        if self.__use_hotplug:
+            self.__context.hotplugRegisterCallback(self.callback_device_left,
+                                                   events=libusb1.LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT,
+                                                   vendor_id=USBDEV_VENDOR, product_id=USBDEV_PRODUCT)
+            self.__context.hotplugRegisterCallback(self.callback_device_arrived,
+                                                   events=libusb1.LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED,
+                                                   vendor_id=USBDEV_VENDOR, product_id=USBDEV_PRODUCT)
         self.__keep_running = True
         self.daemon = True
         self.start()
 
     def stop(self):
         self.__keep_running = False
+        wake_up_event_loop(self.__context)
 
     def run(self):
         try:
-            while True:
-                self.check_for_new_devices()
-                # stop for half a second before checking again
-                time.sleep(0.5)
+            while self.__keep_running:
+                if self.__use_hotplug:
+                    handle_events(self.__context)
+                    self.__removed_devices = close_stopped_devices(self.__removed_devices)
+                    continue
+                if self.check_for_new_devices():
+                    self.__scan_interval = MINIMUM_POLLING_INTERVAL
+                else:
+                    self.__scan_interval = min(self.__scan_interval * POLLING_BACKOFF_FACTOR,
+                                               POLLING_INTERVAL)
+                self.__statistics['scan interval'] = self.__scan_interval
+                # handle transfers until the bus should be checked again
+                next_check = time.monotonic() + self.__scan_interval
+                while self.__keep_running and time.monotonic() < next_check:
+                    handle_events(self.__context, next_check - time.monotonic())
+                    self.__removed_devices = close_stopped_devices(self.__removed_devices)
         except (KeyboardInterrupt, SystemExit):
             pass
+        close_devices(self.__context, list(self.__devices_already_registered.values()) +
+                      self.__removed_devices)
+        self.__devices_already_registered = {}
+        self.__removed_devices = []
         self.__context.exit()
 
     def check_for_new_devices(self):
-        # check for new devices
-        newly_found_devices = {}
-        found_devices = []
+        """Scans the bus and opens all buzzers that were not seen before.
+        Buzzers that are gone are stopped.
+
+        :returns: True, if any device was added or removed
+        """
+        scan_start = time.perf_counter()
+        found_devices = {}
         for device in self.__context.getDeviceList():
             if (device.getVendorID() == USBDEV_VENDOR and
                 device.getProductID() == USBDEV_PRODUCT):
-                bus_id = device.getBusNumber()
-                device_address = device.getDeviceAddress()
-                x = (bus_id, device_address)
-                if x not in self.__devices_already_registered:
-                    print('New buzzer: {}'.format(x))
-                    bd = BuzzerDevice(device, self.__callback)
-                    bd.daemon = True
-                    bd.start()
-                    newly_found_devices[x] = bd
-                found_devices.append(x)
-        # delete old devices that are not there anymore
-        list_of_old_devices = []
-        for key, device in self.__devices_already_registered.items():
-            if key not in found_devices:
-                self.__devices_already_registered[key].stop()
-                list_of_old_devices.append(key)
-        for device in list_of_old_devices:
-            print('Deleting old device {}.'.format(device))
-            del self.__devices_already_registered[device]
-        self.__devices_already_registered.update(newly_found_devices)
+                found_devices[(device.getBusNumber(), device.getDeviceAddress())] = device
+        new_devices = found_devices.keys() - self.__devices_already_registered.keys()
+        old_devices = self.__devices_already_registered.keys() - found_devices.keys()
+        for key in new_devices:
+            self.add_device(key, found_devices[key])
+        for key in old_devices:
+            self.remove_device(key)
+        scan_cost = time.perf_counter() - scan_start
+        self.__statistics['scans'] += 1
+        self.__statistics['last scan cost'] = scan_cost
+        self.__statistics['total scan cost'] += scan_cost
+        return bool(new_devices or old_devices)
+
+    def add_device(self, key, device):
+        logger.info('New buzzer: {}'.format(key))
+        try:
+            bd = BuzzerDevice(device, self.__callback, self.__device_ids)
+            bd.start()
+        except libusb1.USBError:
+            logger.error('Could not open buzzer {}!'.format(key))
+            return
+        self.__devices_already_registered[key] = bd
+        self.__statistics['devices added'] += 1
+        self.__statistics['devices'] = len(self.__devices_already_registered)
+
+    def remove_device(self, key):
+        logger.info('Deleting old device {}.'.format(key))
+        bd = self.__devices_already_registered.pop(key)
+        bd.stop()
+        self.__removed_devices.append(bd)
+        self.__statistics['devices removed'] += 1
+        self.__statistics['devices'] = len(self.__devices_already_registered)
+
+    def callback_device_arrived(self, context, device, event):
+        """Hotplug callback for device arrival."""
+        key = (device.getBusNumber(), device.getDeviceAddress())
+        if key not in self.__devices_already_registered:
+            self.add_device(key, device)
+        # return False, to *not* cancel the callback
+        return False
+
+    def callback_device_left(self, context, device, event):
+        """Hotplug callback for device removal."""
+        key = (device.getBusNumber(), device.getDeviceAddress())
+        if key in self.__devices_already_registered:
+            self.remove_device(key)
+        # return False, to *not* cancel the callback
+        return False
+
+    def get_statistics(self):
+        """Returns a dictionary with the watching mode ('hotplug' or
+        'polling'), the current scan interval in seconds, the number of scans,
+        the cost of the last scan and of all scans in seconds as well as the
+        number of currently registered, added and removed devices."""
+        return dict(self.__statistics)
 
     def init_context(self):
         context = usb1.USBContext()
-        #if not context.hasCapability(libusb1.LIBUSB_CAP_HAS_HOTPLUG):
-        #    print('Hotplug support is missing. Please update your libusb version.')
         return context
 
     def flush_all_devices(self):
@@ -255,7 +552,68 @@ class BuzzerReaderPoller(threading.Thread):
             d.flush_interrupt_data()
 
 
+##### Functions for driving the libusb event loop
+
+def handle_events(context, timeout=None):
+    """Handles pending libusb events and calls all transfer and hotplug
+    callbacks. Blocks until an event occured, the timeout (in seconds) is
+    elapsed or wake_up_event_loop() was called.
+
+    Older versions of python-libusb1 can not interrupt the event handling from
+    another thread. In that case the loop wakes up every USB_TIMEOUT.
+    """
+    if timeout is None and not hasattr(context, 'interruptEventHandler'):
+        timeout = USB_TIMEOUT / 1000
+    if timeout is None:
+        context.handleEvents()
+    else:
+        context.handleEventsTimeout(tv=max(timeout, 0))
+
+
+def wake_up_event_loop(context):
+    """Causes a blocking handle_events() call in another thread to return."""
+    if hasattr(context, 'interruptEventHandler'):
+        context.interruptEventHandler()
+
+
+def close_stopped_devices(devices):
+    """Closes all given devices that were stopped and whose transfers have
+    finished. Handles must not be closed while transfers are submitted, so
+    removed devices are closed by the event loop after their transfers were
+    cancelled.
+
+    :returns: list of the devices that are still busy
+    """
+    busy_devices = []
+    for d in devices:
+        if d.is_busy():
+            busy_devices.append(d)
+            continue
+        try:
+            d.close_device()
+        except libusb1.USBError:
+            pass
+    return busy_devices
+
+
+def close_devices(context, devices):
+    """Cancels the transfers of all given devices, waits for the cancellation
+    to be finished and closes the devices afterwards.
+    """
+    devices = list(devices)
+    for d in devices:
+        d.stop()
+    deadline = time.monotonic() + USB_TIMEOUT / 1000
+    while any(d.is_busy() for d in devices) and time.monotonic() < deadline:
+        context.handleEventsTimeout(tv=0.01)
+    for d in devices:
+        try:
+            d.close_device()
+        except libusb1.USBError:
+            pass
+
+
 if __name__ == '__main__':
-    def callback(buzzer_id):
-        print(buzzer_id)
+    def callback(press):
+        print(press.buzzer_id)
     BuzzerReaderPoller(callback)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+This module contains the debouncing of buzzer presses. Every buzzer is
+debounced on its own, so presses of different buzzers never influence each
+other.
+"""
+
+import logging
+
+from buzzer.press import NUMBER_OF_BUZZER_IDS
+
+
+logger = logging.getLogger('pyPardy.buzzer')
+
+
+# press is reported at once, further presses of the same buzzer are
+# suppressed until the debounce interval since the reported press is elapsed
+LEADING_EDGE = 'leading'
+# press is reported when the buzzer was not pressed again for the debounce
+# interval, the reported press is the first one of the burst
+TRAILING_EDGE = 'trailing'
+# press is reported at once, further presses of the same buzzer are
+# suppressed until reset() is called
+LOCKOUT = 'lockout'
+# all available policies
+DEBOUNCE_POLICIES = (LEADING_EDGE, TRAILING_EDGE, LOCKOUT)
+
+
+class BuzzerDebouncer(object):
+    """Debounces buzzer presses per buzzer. All state is held in lists that
+    are indexed by the buzzer id. Presses of buzzer ids outside the valid
+    range are dropped and counted in 'invalid_presses'.
+
+    Presses have to be given to process() in the order they arrive. For the
+    trailing edge policy presses are held back and have to be collected by
+    calling poll() after the time returned by next_deadline().
+
+    :param policy: one of LEADING_EDGE, TRAILING_EDGE or LOCKOUT
+    :param interval: debounce interval in seconds
+    """
+    def __init__(self, policy=LEADING_EDGE, interval=0.5):
+        if policy not in DEBOUNCE_POLICIES:
+            raise ValueError('Invalid debounce policy: {}'.format(policy))
+        self.policy = policy
+        self.interval = interval
+        self.__size = NUMBER_OF_BUZZER_IDS
+        self.__last_time = [None] * self.__size
+        self.__locked = bytearray(self.__size)
+        self.__pending = [None] * self.__size
+        self.__suppressed = [0] * self.__size
+        self.__pending_count = 0
+        self.invalid_presses = 0
+
+    def process(self, press):
+        """Debounces a single press.
+
+        :param press: BuzzerPress that has arrived
+        :returns: the press if it should be reported now, otherwise None
+        """
+        buzzer_id = press.buzzer_id
+        if not 0 <= buzzer_id < self.__size:
+            # negative ids would silently use the slot of another buzzer
+            self.invalid_presses += 1
+            logger.debug('Dropped press of invalid buzzer id {}.'.format(buzzer_id))
+            return None
+        if self.policy == LEADING_EDGE:
+            last_time = self.__last_time[buzzer_id]
+            if last_time is not None and press.timestamp - last_time <= self.interval:
+                self.__suppressed[buzzer_id] += 1
+                return None
+            self.__last_time[buzzer_id] = press.timestamp
+            return press
+        elif self.policy == LOCKOUT:
+            if self.__locked[buzzer_id]:
+                self.__suppressed[buzzer_id] += 1
+                return None
+            self.__locked[buzzer_id] = 1
+            return press
+        else:
+            # remember time of the latest press, but keep the first press of
+            # the burst for reporting
+            last_time = self.__last_time[buzzer_id]
+            self.__last_time[buzzer_id] = press.timestamp
+            pending = self.__pending[buzzer_id]
+            if pending is None:
+                self.__pending[buzzer_id] = press
+                self.__pending_count += 1
+            elif press.timestamp - last_time > self.interval:
+                # burst has ended before poll() was called, report it now
+                self.__pending[buzzer_id] = press
+                return pending
+            else:
+                self.__suppressed[buzzer_id] += 1
+            return None
+
+    def poll(self, now):
+        """Returns a list of all held back presses whose buzzer has not been
+        pressed again for the debounce interval.
+
+        :param now: current time in the same clock as the press timestamps
+        """
+        if not self.__pending_count:
+            return []
+        presses = []
+        for buzzer_id, press in enumerate(self.__pending):
+            if press is not None and now - self.__last_time[buzzer_id] >= self.interval:
+                presses.append(press)
+                self.__pending[buzzer_id] = None
+                self.__pending_count -= 1
+        presses.sort(key=lambda p: p.timestamp)
+        return presses
+
+    def next_deadline(self):
+        """Returns the time when the next held back press can be reported or
+        None, if no press is held back."""
+        if not self.__pending_count:
+            return None
+        return min(self.__last_time[buzzer_id] + self.interval
+                   for buzzer_id, press in enumerate(self.__pending)
+                   if press is not None)
+
+    def reset(self):
+        """Forgets all presses, e.g. before a new question is shown. The
+        counters of suppressed presses are kept."""
+        self.__last_time = [None] * self.__size
+        self.__locked = bytearray(self.__size)
+        self.__pending = [None] * self.__size
+        self.__pending_count = 0
+
+    def get_suppressed_presses(self):
+        """Returns a dictionary with the number of suppressed presses for all
+        buzzer ids with suppressed presses."""
+        return {buzzer_id: count for buzzer_id, count in enumerate(self.__suppressed)
+                if count}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+
+"""
+This module contains a gateway for buzzers that are connected over the
+network, e.g. phones running a small web page. All clients are served by one
+asyncio event loop in a single thread, either over UDP or over WebSocket.
+
+Every message is a JSON object. A press is send as
+
+    {"type": "press", "buzzer": 101, "time": 1234.5678, "seq": 17}
+
+with the clients own clock in seconds. The gateway estimates the offset
+between the clock of each client and its own clock, so that the press is
+stamped with the time it happened on the client. The sequence number is
+optional and allows clients to send presses more than once over UDP.
+
+Clients can measure the round trip time by sending
+
+    {"type": "sync", "time": 1234.5678}
+
+which is answered with
+
+    {"type": "sync", "time": 1234.5678, "server time": 42.4242}
+
+To test the gateway, a load generator can be started that connects many
+clients over the loopback interface:
+
+    python3 -m buzzer.network --clients 200 --rate 5 --duration 5
+"""
+
+import json
+import math
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+import collections
+
+from buzzer.press import BuzzerPress, get_timestamp, NUMBER_OF_BUZZER_IDS
+
+
+logger = logging.getLogger('pyPardy.buzzer')
+
+
+# host address to listen on
+GATEWAY_HOST = '0.0.0.0'
+# UDP port to listen on, None to disable UDP
+GATEWAY_UDP_PORT = 7777
+# TCP port for WebSocket clients, None to disable WebSocket
+GATEWAY_WEBSOCKET_PORT = 7778
+# bus number that is reported for presses from network clients
+NETWORK_BUS = 0xff
+# number of samples used to estimate the clock offset of a client
+CLOCK_OFFSET_SAMPLES = 32
+# number of recent sequence numbers remembered per client
+SEQUENCE_HISTORY = 64
+# maximum number of UDP clients that are remembered, UDP has no connections,
+# so the least recently seen client is forgotten if more clients send messages
+MAXIMUM_UDP_CLIENTS = 1024
+# maximum size of a single message in bytes
+MAXIMUM_MESSAGE_SIZE = 4096
+# magic string for the WebSocket handshake (see RFC 6455)
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# opcodes of WebSocket frames
+WEBSOCKET_TEXT = 0x1
+WEBSOCKET_BINARY = 0x2
+WEBSOCKET_CLOSE = 0x8
+WEBSOCKET_PING = 0x9
+WEBSOCKET_PONG = 0xa
+
+
+class ClockOffsetEstimator(object):
+    """Estimates the offset between the clock of a client and the clock of
+    the gateway.
+
+    For every message the difference between the receive time and the time
+    of the client is stored. This difference is the clock offset plus the
+    network delay. The smallest difference of the last samples therefore has
+    the smallest delay and is used as estimate of the offset.
+    """
+    def __init__(self, samples=CLOCK_OFFSET_SAMPLES):
+        self.__differences = collections.deque(maxlen=samples)
+        self.offset = None
+
+    def add_sample(self, client_time, receive_time):
+        difference = receive_time - client_time
+        self.__differences.append(difference)
+        if self.offset is None or difference < self.offset:
+            self.offset = difference
+        elif len(self.__differences) == self.__differences.maxlen:
+            # follow a drifting clock by forgetting old samples
+            self.offset = min(self.__differences)
+
+    def to_local_time(self, client_time, receive_time):
+        """Converts a time of the client into the clock of the gateway. The
+        result is never later than the time the message was received."""
+        return min(client_time + self.offset, receive_time)
+
+
+class NetworkClient(object):
+    """State of one client connected to the gateway."""
+    def __init__(self, number, peer):
+        self.number = number
+        self.peer = peer
+        self.clock = ClockOffsetEstimator()
+        self.__sequences = collections.deque(maxlen=SEQUENCE_HISTORY)
+        self.__known_sequences = set()
+
+    def is_duplicate(self, sequence):
+        """Checks whether a press with the given sequence number was already
+        received and remembers the sequence number."""
+        if sequence is None:
+            return False
+        if sequence in self.__known_sequences:
+            return True
+        if len(self.__sequences) == self.__sequences.maxlen:
+            self.__known_sequences.discard(self.__sequences[0])
+        self.__sequences.append(sequence)
+        self.__known_sequences.add(sequence)
+        return False
+
+
+class BuzzerGateway(threading.Thread):
+    """Accepts buzzer presses from network clients and calls 'callback' with
+    a BuzzerPress for every press. Can be used in place of BuzzerReader.
+
+    :param callback: callable that gets a BuzzerPress for every press
+    :param host: address to listen on
+    :param udp_port: UDP port to listen on, None to disable UDP
+    :param websocket_port: TCP port for WebSocket clients, None to disable
+    """
+    def __init__(self, callback, host=GATEWAY_HOST, udp_port=GATEWAY_UDP_PORT,
+                 websocket_port=GATEWAY_WEBSOCKET_PORT):
+        super().__init__()
+        self.__callback = callback
+        self.host = host
+        self.udp_port = udp_port
+        self.websocket_port = websocket_port
+        self.__clients = {}
+        self.__udp_clients = collections.OrderedDict()
+        self.__loop = asyncio.new_event_loop()
+        self.__stop_event = None
+        self.__ready = threading.Event()
+        self.__statistics = collections.Counter()
+        self.daemon = True
+        self.start()
+        self.__ready.wait()
+
+    def stop(self):
+        if self.__stop_event is None or self.__loop.is_closed():
+            return
+        try:
+            self.__loop.call_soon_threadsafe(self.__stop_event.set)
+        except RuntimeError:
+            # loop was closed in the meantime, because serve() has failed
+            pass
+
+    def run(self):
+        asyncio.set_event_loop(self.__loop)
+        try:
+            self.__loop.run_until_complete(self.serve())
+        finally:
+            self.__ready.set()
+            self.__loop.close()
+
+    async def serve(self):
+        self.__stop_event = asyncio.Event()
+        transport = None
+        server = None
+        try:
+            if self.udp_port is not None:
+                transport, protocol = await self.__loop.create_datagram_endpoint(
+                    lambda: GatewayDatagramProtocol(self),
+                    local_addr=(self.host, self.udp_port))
+                self.udp_port = transport.get_extra_info('sockname')[1]
+                logger.info('Buzzer gateway listening on UDP port {}.'.format(self.udp_port))
+            if self.websocket_port is not None:
+                server = await asyncio.start_server(self.handle_websocket_client,
+                                                    self.host, self.websocket_port,
+                                                    limit=MAXIMUM_MESSAGE_SIZE)
+                self.websocket_port = server.sockets[0].getsockname()[1]
+                logger.info('Buzzer gateway listening for WebSockets on port {}.'
+                            .format(self.websocket_port))
+        except OSError as e:
+            logger.error('Could not start buzzer gateway: {}'.format(e))
+            return
+        finally:
+            self.__ready.set()
+        await self.__stop_event.wait()
+        if transport:
+            transport.close()
+        if server:
+            server.close()
+            await server.wait_closed()
+
+    def get_client(self, peer):
+        if peer not in self.__clients:
+            self.__statistics['clients'] += 1
+            self.__clients[peer] = NetworkClient(self.__statistics['clients'], peer)
+        return self.__clients[peer]
+
+    def get_udp_client(self, peer):
+        """Returns the client for a UDP sender address. Only the last
+        MAXIMUM_UDP_CLIENTS clients are remembered."""
+        client = self.__udp_clients.get(peer)
+        if client is None:
+            self.__statistics['clients'] += 1
+            client = NetworkClient(self.__statistics['clients'], peer)
+            self.__udp_clients[peer] = client
+            if len(self.__udp_clients) > MAXIMUM_UDP_CLIENTS:
+                self.__udp_clients.popitem(last=False)
+                self.__statistics['expired clients'] += 1
+        else:
+            self.__udp_clients.move_to_end(peer)
+        return client
+
+    def forget_client(self, peer):
+        self.__clients.pop(peer, None)
+
+    def handle_message(self, client, data, receive_time):
+        """Handles a single message of a client.
+
+        :returns: answer that should be sent to the client or None
+        """
+        try:
+            message = json.loads(data.decode('utf8') if isinstance(data, bytes) else data)
+            message_type = message['type']
+            client_time = message['time']
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+            self.__statistics['invalid messages'] += 1
+            return None
+        # json.loads() accepts NaN and Infinity, a single infinite sample
+        # would spoil the clock offset of the client for good
+        if (isinstance(client_time, bool) or not isinstance(client_time, (int, float))
+                or not math.isfinite(client_time)):
+            self.__statistics['invalid messages'] += 1
+            return None
+        client.clock.add_sample(client_time, receive_time)
+        if message_type == 'sync':
+            self.__statistics['sync messages'] += 1
+            return json.dumps({'type': 'sync', 'time': client_time,
+                               'server time': get_timestamp()})
+        elif message_type == 'press':
+            if client.is_duplicate(message.get('seq')):
+                self.__statistics['duplicates'] += 1
+                return None
+            try:
+                buzzer_id = int(message['buzzer'])
+            except (ValueError, KeyError, TypeError):
+                self.__statistics['invalid messages'] += 1
+                return None
+            if not 0 <= buzzer_id < NUMBER_OF_BUZZER_IDS:
+                self.__statistics['invalid messages'] += 1
+                return None
+            self.__statistics['presses'] += 1
+            timestamp = client.clock.to_local_time(client_time, receive_time)
+            self.__callback(BuzzerPress(buzzer_id, timestamp, NETWORK_BUS,
+                                        client.number))
+        else:
+            self.__statistics['invalid messages'] += 1
+        return None
+
+    async def handle_websocket_client(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            if not await websocket_accept(reader, writer):
+                return
+            client = self.get_client(peer)
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                receive_time = get_timestamp()
+                if opcode in (WEBSOCKET_TEXT, WEBSOCKET_BINARY):
+                    answer = self.handle_message(client, payload, receive_time)
+                    if answer:
+                        writer.write(build_websocket_frame(WEBSOCKET_TEXT,
+                                                           answer.encode('utf8')))
+                elif opcode == WEBSOCKET_PING:
+                    writer.write(build_websocket_frame(WEBSOCKET_PONG, payload))
+                elif opcode == WEBSOCKET_CLOSE:
+                    writer.write(build_websocket_frame(WEBSOCKET_CLOSE, b''))
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            self.forget_client(peer)
+            writer.close()
+
+    def flush_all_devices(self):
+        pass
+
+    def get_statistics(self):
+        """Returns a dictionary with the number of clients that have been
+        connected, received presses, sync messages, duplicates, invalid
+        messages and forgotten UDP clients."""
+        statistics = dict(self.__statistics)
+        statistics['connected clients'] = len(self.__clients) + len(self.__udp_clients)
+        return statistics
+
+
+class GatewayDatagramProtocol(asyncio.DatagramProtocol):
+    """Handles all UDP datagrams of the gateway. Every sender address is a
+    client of its own."""
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        receive_time = get_timestamp()
+        if len(data) > MAXIMUM_MESSAGE_SIZE:
+            return
+        client = self.gateway.get_udp_client(addr)
+        answer = self.gateway.handle_message(client, data, receive_time)
+        if answer:
+            self.transport.sendto(answer.encode('utf8'), addr)
+
+
+##### Functions implementing the WebSocket protocol (RFC 6455)
+
+async def websocket_accept(reader, writer):
+    """Reads the HTTP upgrade request of a client and answers it.
+
+    :returns: True, if the handshake was successful
+    """
+    request = await reader.readuntil(b'\r\n\r\n')
+    headers = {}
+    for line in request.decode('latin1').split('\r\n')[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    key = headers.get('sec-websocket-key')
+    if not key or 'websocket' not in headers.get('upgrade', '').lower():
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        return False
+    writer.write('HTTP/1.1 101 Switching Protocols\r\n'
+                 'Upgrade: websocket\r\n'
+                 'Connection: Upgrade\r\n'
+                 'Sec-WebSocket-Accept: {}\r\n\r\n'
+                 .format(get_websocket_accept_key(key)).encode('latin1'))
+    return True
+
+
+def get_websocket_accept_key(key):
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('latin1')).digest()
+    return base64.b64encode(digest).decode('latin1')
+
+
+async def read_websocket_frame(reader):
+    """Reads a complete (maybe fragmented) message from a WebSocket.
+
+    :returns: tuple with opcode and payload
+    """
+    message_opcode = None
+    message = b''
+    while True:
+        header = await reader.readexactly(2)
+        final = header[0] & 0x80
+        opcode = header[0] & 0x0f
+        masked = header[1] & 0x80
+        length = header[1] & 0x7f
+        if length == 126:
+            length = int.from_bytes(await reader.readexactly(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), 'big')
+        if length + len(message) > MAXIMUM_MESSAGE_SIZE:
+            raise ValueError('WebSocket message is too large!')
+        mask = await reader.readexactly(4) if masked else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        if opcode >= WEBSOCKET_CLOSE:
+            # control frames may be sent between fragments
+            return opcode, payload
+        if opcode:
+            message_opcode = opcode
+        message += payload
+        if final:
+            return message_opcode, message
+
+
+def build_websocket_frame(opcode, payload, mask=False):
+    """Builds a single WebSocket frame. Frames sent by clients have to be
+    masked."""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0x00
+    if len(payload) < 126:
+        header.append(mask_bit | len(payload))
+    elif len(payload) < 65536:
+        header.append(mask_bit | 126)
+        header += len(payload).to_bytes(2, 'big')
+    else:
+        header.append(mask_bit | 127)
+        header += len(payload).to_bytes(8, 'big')
+    if mask:
+        mask_key = bytes(random.getrandbits(8) for _ in range(4))
+        payload = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+        header += mask_key
+    return bytes(header) + payload
+
+
+##### Load generator for testing the gateway over the loopback interface
+
+class LoadGeneratorClient(asyncio.DatagramProtocol):
+    """UDP client of the load generator."""
+    def connection_made(self, transport):
+        self.transport = transport
+
+
+async def run_load_generator_client(number, protocol, host, port, rate, duration,
+                                    sent_presses):
+    """Simulates one client that presses its buzzer 'rate' times per second.
+    The clock of the client is shifted by a random offset to test the offset
+    correction of the gateway."""
+    loop = asyncio.get_event_loop()
+    clock_offset = random.uniform(-1000, 1000)
+    buzzer_id = number
+    if protocol == 'udp':
+        transport, _ = await loop.create_datagram_endpoint(LoadGeneratorClient,
+                                                           remote_addr=(host, port))
+        send = lambda message: transport.sendto(message)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(bytes(random.getrandbits(8) for _ in range(16))).decode('latin1')
+        writer.write('GET / HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\n'
+                     'Connection: Upgrade\r\nSec-WebSocket-Key: {}\r\n'
+                     'Sec-WebSocket-Version: 13\r\n\r\n'.format(host, key).encode('latin1'))
+        await reader.readuntil(b'\r\n\r\n')
+        send = lambda message: writer.write(build_websocket_frame(WEBSOCKET_TEXT, message,
+                                                                  mask=True))
+    # start at a random time to spread the load
+    await asyncio.sleep(random.uniform(0, 1 / rate))
+    end = time.perf_counter() + duration
+    sequence = 0
+    while time.perf_counter() < end:
+        send_time = get_timestamp()
+        message = json.dumps({'type': 'press', 'buzzer': buzzer_id, 'seq': sequence,
+                              'time': send_time + clock_offset})
+        send(message.encode('utf8'))
+        sent_presses[(buzzer_id, sequence)] = send_time
+        sequence += 1
+        await asyncio.sleep(1 / rate)
+    if protocol == 'udp':
+        transport.close()
+    else:
+        writer.write(build_websocket_frame(WEBSOCKET_CLOSE, b'', mask=True))
+        await writer.drain()
+        writer.close()
+
+
+def run_load_generator(host, port, clients, rate, duration, protocol='udp'):
+    """Starts the given number of clients and lets them press their buzzers.
+
+    :returns: dictionary mapping (buzzer id, sequence number) to the time the
+              press was sent
+    """
+    sent_presses = {}
+
+    async def run_all_clients():
+        await asyncio.gather(*[run_load_generator_client(i, protocol, host, port, rate,
+                                                         duration, sent_presses)
+                               for i in range(clients)])
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run_all_clients())
+    finally:
+        loop.close()
+    return sent_presses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tests the network buzzer gateway with many clients over the loopback interface.')
+    parser.add_argument('--clients', type=int, default=200, help='number of clients')
+    parser.add_argument('--rate', type=float, default=5, help='presses per second and client')
+    parser.add_argument('--duration', type=float, default=5, help='duration in seconds')
+    parser.add_argument('--protocol', choices=('udp', 'websocket'), default='udp')
+    args = parser.parse_args(argv)
+    if not 0 < args.clients <= NUMBER_OF_BUZZER_IDS:
+        parser.error('between 1 and {} clients are allowed'.format(NUMBER_OF_BUZZER_IDS))
+    received = []
+    gateway = BuzzerGateway(lambda press: received.append((press, get_timestamp())),
+                            host='127.0.0.1', udp_port=0, websocket_port=0)
+    port = gateway.udp_port if args.protocol == 'udp' else gateway.websocket_port
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    sent_presses = run_load_generator('127.0.0.1', port, args.clients, args.rate,
+                                      args.duration, args.protocol)
+    time.sleep(0.2)
+    cpu_usage = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+    gateway.stop()
+    gateway.join()
+    # compare the corrected timestamps with the real send times
+    send_times = collections.defaultdict(list)
+    for (buzzer_id, sequence), send_time in sorted(sent_presses.items()):
+        send_times[buzzer_id].append(send_time)
+    errors = []
+    latencies = []
+    for press, callback_time in received:
+        send_time = send_times[press.buzzer_id].pop(0)
+        errors.append(abs(press.timestamp - send_time))
+        latencies.append(callback_time - send_time)
+    errors.sort()
+    latencies.sort()
+    print('Sent presses:     {}'.format(len(sent_presses)))
+    print('Received presses: {}'.format(len(received)))
+    print('Gateway:          {}'.format(gateway.get_statistics()))
+    if received:
+        print('Latency p50/p99:  {:.3f} / {:.3f} ms'.format(
+            latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+        print('Clock error p50/p99: {:.3f} / {:.3f} ms'.format(
+            errors[len(errors) // 2] * 1000, errors[int(len(errors) * 0.99)] * 1000))
+    print('CPU usage:        {:.1f} %'.format(cpu_usage * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+"""
+This module contains the description of a single buzzer press. It does not
+depend on USB access, so network buzzers and recorded logs can be used
+without libusb being installed.
+"""
+
+import time
+import collections
+
+
+# number of valid buzzer ids, USB buzzers store their id in a single byte, so
+# ids are between 0 and NUMBER_OF_BUZZER_IDS - 1
+NUMBER_OF_BUZZER_IDS = 256
+
+# Information about a single press of a buzzer. The timestamp is taken from
+# time.perf_counter() when the USB transfer has completed.
+BuzzerPress = collections.namedtuple('BuzzerPress', ['buzzer_id', 'timestamp',
+                                                     'bus', 'address'])
+
+
+def get_timestamp():
+    """Returns a high resolution timestamp in seconds to stamp buzzer presses
+    with. Only differences between timestamps are meaningful.
+    """
+    return time.perf_counter()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+This module contains a bounded queue to hand buzzer presses from the threads
+reading the buzzers over to the thread of the GUI.
+"""
+
+import collections
+import logging
+
+
+logger = logging.getLogger('pyPardy.buzzer')
+
+
+# maximum number of presses that are waiting to be handled
+PRESS_QUEUE_CAPACITY = 1024
+
+
+class PressQueue(object):
+    """Bounded queue for buzzer presses. Any number of threads can push
+    presses, one thread drains them.
+
+    No lock is used: appending and popping of collections.deque are atomic
+    operations, so producers never block and never wait for the consumer. If
+    the queue is full, new presses are dropped and counted, because for the
+    game the earliest presses are the important ones.
+
+    The function 'wakeup' is called by a producer when the first press after
+    the last drain() was pushed. Therefore the consumer is woken up only once
+    per batch of presses, e.g. by emitting a queued Qt signal.
+
+    :param capacity: maximum number of presses in the queue
+    :param wakeup: function without arguments that is called from the
+                   producing thread when the queue has to be drained
+    """
+    def __init__(self, capacity=PRESS_QUEUE_CAPACITY, wakeup=None):
+        self.__queue = collections.deque()
+        self.__capacity = capacity
+        self.__wakeup = wakeup
+        self.__wakeup_pending = False
+        self.pushed = 0
+        self.overflows = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    def push(self, press):
+        """Adds a press to the queue. Can be called from any thread.
+
+        :returns: False, if the press was dropped because the queue is full
+        """
+        # the check is not atomic with the append, so with several producers
+        # the capacity may be exceeded by a few presses
+        if len(self.__queue) >= self.__capacity:
+            self.overflows += 1
+            return False
+        self.__queue.append(press)
+        self.pushed += 1
+        # wake up the consumer only after the press is in the queue, the
+        # consumer resets the flag before draining
+        if not self.__wakeup_pending:
+            self.__wakeup_pending = True
+            if self.__wakeup:
+                self.__wakeup()
+        return True
+
+    def drain(self):
+        """Removes and returns all presses in the queue as list. Must only be
+        called by the consuming thread."""
+        self.__wakeup_pending = False
+        presses = []
+        try:
+            while True:
+                presses.append(self.__queue.popleft())
+        except IndexError:
+            pass
+        if presses:
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(presses))
+        return presses
+
+    def __len__(self):
+        return len(self.__queue)
+
+    def get_statistics(self):
+        """Returns a dictionary with the number of pushed and dropped presses,
+        the number of drained batches and the size of the largest batch."""
+        return {'pushed': self.pushed,
+                'overflows': self.overflows,
+                'batches': self.batches,
+                'largest batch': self.largest_batch,
+                'waiting': len(self.__queue)}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+This module records buzzer presses to a compact binary log and replays such
+logs as source for buzzer presses.
+
+A log starts with a header (magic bytes and version) followed by one record
+per press containing the timestamp, buzzer id, bus number and device address.
+To print a recorded log use:
+
+    python3 -m buzzer.recording presses.log
+"""
+
+import queue
+import atexit
+import struct
+import logging
+import argparse
+import threading
+
+from buzzer.press import BuzzerPress, get_timestamp
+
+
+logger = logging.getLogger('pyPardy.buzzer')
+
+
+# magic bytes at the start of every log file
+RECORDING_MAGIC = b'PPBZ'
+# version of the file format
+RECORDING_VERSION = 1
+# header of log files: magic bytes and version
+HEADER_FORMAT = struct.Struct('<4sH')
+# single press: timestamp, buzzer id, bus number and device address
+RECORD_FORMAT = struct.Struct('<dHBH')
+
+
+class PressRecorder(object):
+    """Writes all given presses to a log file in a background thread.
+    Existing files are overwritten.
+
+    record() only queues the press, so it can be called from the buzzer
+    threads as soon as a press arrives. All waiting presses are written and
+    flushed at once by the background thread.
+
+    :param filename: name of the log file
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.recorded_presses = 0
+        self.__queue = queue.Queue()
+        self.__file = open(filename, 'wb')
+        self.__file.write(HEADER_FORMAT.pack(RECORDING_MAGIC, RECORDING_VERSION))
+        self.__thread = threading.Thread(target=self.__run, name='PressRecorder')
+        self.__thread.daemon = True
+        self.__thread.start()
+        # write all waiting presses when the application exits
+        atexit.register(self.close)
+
+    def record(self, press):
+        """Adds a press to the log. Returns at once, the press is written by
+        the background thread."""
+        self.__queue.put(press)
+
+    def close(self):
+        """Writes all waiting presses and closes the log file."""
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+
+    def __run(self):
+        running = True
+        while running:
+            # wait for the first press, then write all waiting presses at once
+            presses = [self.__queue.get()]
+            while True:
+                try:
+                    presses.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in presses:
+                running = False
+                presses = [p for p in presses if p is not None]
+            self.__write(presses)
+        self.__file.close()
+
+    def __write(self, presses):
+        records = []
+        for press in presses:
+            try:
+                records.append(RECORD_FORMAT.pack(press.timestamp, press.buzzer_id,
+                                                  press.bus & 0xff, press.address & 0xffff))
+            except struct.error:
+                logger.warning('Could not record press of buzzer {}.'.format(press.buzzer_id))
+        try:
+            self.__file.write(b''.join(records))
+            self.__file.flush()
+        except OSError as e:
+            logger.error('Could not write buzzer recording: {}'.format(e))
+            return
+        self.recorded_presses += len(records)
+
+
+def read_recording(filename):
+    """Reads a log file and yields all recorded presses as BuzzerPress."""
+    with open(filename, 'rb') as log_file:
+        header = log_file.read(HEADER_FORMAT.size)
+        if len(header) < HEADER_FORMAT.size:
+            raise ValueError('File is not a buzzer recording: {}'.format(filename))
+        magic, version = HEADER_FORMAT.unpack(header)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError('File is not a buzzer recording: {}'.format(filename))
+        while True:
+            record = log_file.read(RECORD_FORMAT.size)
+            if len(record) < RECORD_FORMAT.size:
+                # ignore incomplete record at the end, e.g. after a crash
+                break
+            timestamp, buzzer_id, bus, address = RECORD_FORMAT.unpack(record)
+            yield BuzzerPress(buzzer_id, timestamp, bus, address)
+
+
+class BuzzerReplayer(threading.Thread):
+    """Replays a recorded log file and calls 'callback' with a BuzzerPress for
+    every recorded press. Can be used in place of BuzzerReader.
+
+    The presses are stamped with the current time, but the differences between
+    them are kept (divided by the speed), so that arbitration gives the same
+    results as during the recording. When replaying as fast as possible, every
+    press is stamped with the time it is replayed.
+
+    :param callback: callable that gets a BuzzerPress for every press
+    :param filename: name of the log file to replay
+    :param speed: factor for the replay speed, e.g. 2.0 for double speed or
+                  0 for replaying as fast as possible
+    :param repeat: whether to start again at the end of the log
+    """
+    def __init__(self, callback, filename, speed=1.0, repeat=False):
+        super().__init__()
+        self.__callback = callback
+        self.__presses = list(read_recording(filename))
+        self.__speed = speed
+        self.__repeat = repeat
+        self.__stop_event = threading.Event()
+        self.replayed_presses = 0
+        logger.info('Replaying {} presses from "{}".'.format(len(self.__presses), filename))
+        self.daemon = True
+        self.start()
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def run(self):
+        if not self.__presses:
+            return
+        while not self.__stop_event.is_set():
+            first_timestamp = self.__presses[0].timestamp
+            replay_start = get_timestamp()
+            for press in self.__presses:
+                if self.__speed > 0:
+                    timestamp = replay_start + (press.timestamp - first_timestamp) / self.__speed
+                    delay = timestamp - get_timestamp()
+                    if delay > 0 and self.__stop_event.wait(delay):
+                        return
+                else:
+                    timestamp = get_timestamp()
+                    if self.__stop_event.is_set():
+                        return
+                self.__callback(press._replace(timestamp=timestamp))
+                self.replayed_presses += 1
+            if not self.__repeat:
+                break
+
+    def flush_all_devices(self):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prints all presses of a buzzer recording.')
+    parser.add_argument('filename', help='recorded log file')
+    args = parser.parse_args(argv)
+    first_timestamp = None
+    for press in read_recording(args.filename):
+        if first_timestamp is None:
+            first_timestamp = press.timestamp
+        print('{:12.6f} s  buzzer {:3}  bus {:3}  address {:5}'.format(
+            press.timestamp - first_timestamp, press.buzzer_id, press.bus, press.address))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+"""
+This module simulates the USB buzzers for benchmarks and for running pyPardy
+without hardware. It provides a fake USB context that can be given to
+BuzzerReader and BuzzerReaderPoller instead of a usb1.USBContext. Presses are
+injected by calling SimulatedDevice.press() from any thread.
+
+If python-libusb1 is not installed, install_fake_usb_modules() registers
+minimal replacements for the modules 'usb1' and 'libusb1', so that the
+buzzer module can be imported anyway.
+"""
+
+import sys
+import types
+import queue
+import threading
+import logging
+
+
+logger = logging.getLogger('pyPardy.buzzer')
+
+
+# constants with the same values as in libusb
+LIBUSB_TYPE_VENDOR = 0x40
+LIBUSB_RECIPIENT_DEVICE = 0x00
+LIBUSB_ENDPOINT_IN = 0x80
+LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED = 0x01
+LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT = 0x02
+LIBUSB_HOTPLUG_ENUMERATE = 0x01
+LIBUSB_CAP_HAS_HOTPLUG = 0x0001
+LIBUSB_TRANSFER_COMPLETED = 0
+LIBUSB_TRANSFER_ERROR = 1
+LIBUSB_TRANSFER_TIMED_OUT = 2
+LIBUSB_TRANSFER_CANCELLED = 3
+LIBUSB_TRANSFER_NO_DEVICE = 5
+
+# default vendor and product id of the simulated buzzers
+SIMULATED_VENDOR = 0x16C0
+SIMULATED_PRODUCT = 0x05DC
+# byte that is send by the simulated buzzers for every press
+SIMULATED_MAGIC_MARKER = 0xa5
+
+
+class SimulatedUSBError(Exception):
+    """Is raised by the simulated devices if no real libusb1 module is
+    available."""
+    pass
+
+
+def get_usb_error():
+    """Returns the exception class that is used by the buzzer module."""
+    libusb1 = sys.modules.get('libusb1')
+    return getattr(libusb1, 'USBError', SimulatedUSBError)
+
+
+def install_fake_usb_modules():
+    """Registers the modules 'usb1' and 'libusb1' if python-libusb1 is not
+    installed. Has to be called before the buzzer module is imported.
+
+    :returns: True, if the fake modules were installed
+    """
+    try:
+        import usb1
+        import libusb1
+        return False
+    except ImportError:
+        pass
+    logger.info('python-libusb1 not found, using simulated USB modules.')
+    fake_libusb1 = types.ModuleType('libusb1')
+    for name, value in globals().items():
+        if name.startswith('LIBUSB_'):
+            setattr(fake_libusb1, name, value)
+    fake_libusb1.USBError = SimulatedUSBError
+    fake_usb1 = types.ModuleType('usb1')
+    fake_usb1.USBContext = SimulatedContext
+    fake_usb1.USBError = SimulatedUSBError
+    sys.modules['libusb1'] = fake_libusb1
+    sys.modules['usb1'] = fake_usb1
+    return True
+
+
+class SimulatedContext(object):
+    """Replacement for usb1.USBContext. All transfer and hotplug callbacks are
+    called from the thread that calls handleEvents() or handleEventsTimeout().
+
+    :param has_hotplug: whether the context should report hotplug capability
+    """
+    def __init__(self, has_hotplug=True):
+        self.__events = queue.Queue()
+        self.__devices = []
+        self.__hotplug_callbacks = []
+        self.__lock = threading.Lock()
+        self.has_hotplug = has_hotplug
+        # number of calls to getDeviceList() for measuring scan costs
+        self.device_list_calls = 0
+
+    def hasCapability(self, capability):
+        if capability == LIBUSB_CAP_HAS_HOTPLUG:
+            return self.has_hotplug
+        return False
+
+    def hotplugRegisterCallback(self, callback, events=(LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED |
+                                                       LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT),
+                                flags=LIBUSB_HOTPLUG_ENUMERATE, vendor_id=None,
+                                product_id=None, **kwargs):
+        self.__hotplug_callbacks.append((callback, events, vendor_id, product_id))
+        if flags & LIBUSB_HOTPLUG_ENUMERATE and events & LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED:
+            for device in self.getDeviceList():
+                if self.__matches(device, vendor_id, product_id):
+                    callback(self, device, LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED)
+
+    def getDeviceList(self, skip_on_error=False):
+        self.device_list_calls += 1
+        with self.__lock:
+            return list(self.__devices)
+
+    def handleEvents(self):
+        self.handleEventsTimeout(tv=60)
+
+    def handleEventsTimeout(self, tv=0):
+        """Waits up to tv seconds for the first event and handles all events
+        that are pending after that."""
+        try:
+            event = self.__events.get(timeout=tv) if tv else self.__events.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            if event is not None:
+                event()
+            try:
+                event = self.__events.get_nowait()
+            except queue.Empty:
+                return
+
+    def interruptEventHandler(self):
+        self.__events.put(None)
+
+    def exit(self):
+        pass
+
+    def queue_event(self, event):
+        """Queues a function that is called by the event handling thread."""
+        self.__events.put(event)
+
+    def plug(self, device):
+        """Simulates the arrival of a new device."""
+        with self.__lock:
+            self.__devices.append(device)
+        if self.has_hotplug:
+            self.queue_event(lambda: self.__notify(device, LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED))
+
+    def unplug(self, device):
+        """Simulates the removal of a device."""
+        with self.__lock:
+            self.__devices.remove(device)
+        device.disconnect()
+        if self.has_hotplug:
+            self.queue_event(lambda: self.__notify(device, LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT))
+
+    def __notify(self, device, event):
+        for callback, events, vendor_id, product_id in list(self.__hotplug_callbacks):
+            if events & event and self.__matches(device, vendor_id, product_id):
+                callback(self, device, event)
+
+    def __matches(self, device, vendor_id, product_id):
+        return ((vendor_id is None or device.getVendorID() == vendor_id) and
+                (product_id is None or device.getProductID() == product_id))
+
+
+class SimulatedDevice(object):
+    """Replacement for usb1.USBDevice representing a single buzzer.
+
+    Like the real hardware the device stores one press while no interrupt
+    transfer is submitted. Further presses in that time are lost and counted
+    in 'dropped_presses'.
+
+    :param context: simulated context this device belongs to
+    :param device_id: buzzer id that is stored in the device
+    :param bus: bus number of the device
+    :param address: device address on the bus
+    :param port_numbers: tuple with the port numbers the device is plugged in
+    """
+    def __init__(self, context, device_id, bus=1, address=1, port_numbers=None):
+        self.context = context
+        self.device_id = device_id
+        self.bus = bus
+        self.address = address
+        self.port_numbers = tuple(port_numbers) if port_numbers else (address, )
+        self.connected = True
+        self.injected_presses = 0
+        self.dropped_presses = 0
+        self.control_reads = 0
+        self.__stored_press = False
+        self.__transfers = []
+        self.__lock = threading.Lock()
+
+    def getVendorID(self):
+        return SIMULATED_VENDOR
+
+    def getProductID(self):
+        return SIMULATED_PRODUCT
+
+    def getBusNumber(self):
+        return self.bus
+
+    def getDeviceAddress(self):
+        return self.address
+
+    def getPortNumberList(self):
+        return list(self.port_numbers)
+
+    def open(self):
+        if not self.connected:
+            raise get_usb_error()('Device is not connected!')
+        return SimulatedHandle(self)
+
+    def press(self):
+        """Simulates a press of the buzzer. Can be called from any thread.
+
+        :returns: False, if the press was lost inside the device
+        """
+        with self.__lock:
+            self.injected_presses += 1
+            for transfer in self.__transfers:
+                if transfer.is_interrupt and transfer.isSubmitted():
+                    transfer.complete(LIBUSB_TRANSFER_COMPLETED,
+                                      bytearray([SIMULATED_MAGIC_MARKER]))
+                    return True
+            if self.__stored_press:
+                self.dropped_presses += 1
+                return False
+            self.__stored_press = True
+            return True
+
+    def disconnect(self):
+        with self.__lock:
+            self.connected = False
+            for transfer in self.__transfers:
+                if transfer.isSubmitted():
+                    transfer.complete(LIBUSB_TRANSFER_NO_DEVICE)
+
+    def add_transfer(self, transfer):
+        with self.__lock:
+            self.__transfers.append(transfer)
+
+    def submit(self, transfer):
+        """Called by a transfer of this device when it gets submitted."""
+        with self.__lock:
+            if not self.connected:
+                raise get_usb_error()('Device is not connected!')
+            if transfer.is_interrupt:
+                transfer.submitted = True
+                if self.__stored_press:
+                    self.__stored_press = False
+                    transfer.complete(LIBUSB_TRANSFER_COMPLETED,
+                                      bytearray([SIMULATED_MAGIC_MARKER]))
+            else:
+                self.control_reads += 1
+                transfer.submitted = True
+                transfer.complete(LIBUSB_TRANSFER_COMPLETED,
+                                  bytearray([self.device_id]))
+
+
+class SimulatedHandle(object):
+    """Replacement for usb1.USBDeviceHandle."""
+    def __init__(self, device):
+        self.device = device
+
+    def kernelDriverActive(self, interface):
+        return False
+
+    def detachKernelDriver(self, interface):
+        pass
+
+    def claimInterface(self, interface):
+        pass
+
+    def releaseInterface(self, interface):
+        pass
+
+    def close(self):
+        pass
+
+    def getTransfer(self, iso_packets=0):
+        transfer = SimulatedTransfer(self.device)
+        self.device.add_transfer(transfer)
+        return transfer
+
+    def controlRead(self, request_type, request, value, index, length, timeout=0):
+        if not self.device.connected:
+            raise get_usb_error()('Device is not connected!')
+        self.device.control_reads += 1
+        if value:
+            # vendor request to set a new device id
+            self.device.device_id = value
+        return bytearray([self.device.device_id])
+
+
+class SimulatedTransfer(object):
+    """Replacement for usb1.USBTransfer. Completed transfers are handed to
+    the event queue of the context, so that their callbacks are called by the
+    event handling thread."""
+    def __init__(self, device):
+        self.device = device
+        self.submitted = False
+        self.is_interrupt = False
+        self.__callback = None
+        self.__status = LIBUSB_TRANSFER_COMPLETED
+        self.__buffer = bytearray()
+
+    def setInterrupt(self, endpoint, buffer_or_len, callback=None, user_data=None,
+                     timeout=0):
+        self.is_interrupt = True
+        self.__callback = callback
+
+    def setControl(self, request_type, request, value, index, buffer_or_len,
+                   callback=None, user_data=None, timeout=0):
+        self.is_interrupt = False
+        self.__callback = callback
+
+    def submit(self):
+        if self.submitted:
+            raise get_usb_error()('Transfer is already submitted!')
+        self.device.submit(self)
+
+    def cancel(self):
+        if not self.submitted:
+            raise get_usb_error()('Transfer is not submitted!')
+        self.complete(LIBUSB_TRANSFER_CANCELLED)
+
+    def complete(self, status, data=b''):
+        """Finishes the transfer and queues its callback."""
+        self.submitted = False
+        self.__status = status
+        self.__buffer = bytearray(data)
+        if self.__callback:
+            self.device.context.queue_event(lambda: self.__callback(self))
+
+    def isSubmitted(self):
+        return self.submitted
+
+    def getStatus(self):
+        return self.__status
+
+    def getActualLength(self):
+        return len(self.__buffer)
+
+    def getBuffer(self):
+        return self.__buffer
+
+
+def create_simulated_buzzers(number_of_buzzers, has_hotplug=True):
+    """Creates a simulated context with the given number of buzzers. Every
+    buzzer gets its own bus address and a buzzer id starting with 1.
+
+    :returns: tuple with the context and a list of all devices
+    """
+    context = SimulatedContext(has_hotplug=has_hotplug)
+    devices = []
+    for i in range(number_of_buzzers):
+        device = SimulatedDevice(context, device_id=i + 1, bus=1, address=i + 2,
+                                 port_numbers=(i + 1, ))
+        context.plug(device)
+        devices.append(device)
+    # no hotplug callback is registered yet, so this only discards the arrival
+    # events of the initial devices, like libusb they are reported when a
+    # callback is registered with LIBUSB_HOTPLUG_ENUMERATE
+    context.handleEventsTimeout()
+    return context, devices
+
+
+if __name__ == '__main__':
+    pass
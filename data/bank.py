@@ -0,0 +1,361 @@
+"""
+pyPardy
+
+Module for a question bank containing the questions of all rounds. The bank
+is a SQLite database with a full-text index on question, answer and topic. It
+is filled incrementally from the round data files, so only new or changed
+files are imported again. New rounds can be assembled from search queries and
+exported as round data files.
+
+Usage:
+
+    python3 -m data.bank import rounds/
+    python3 -m data.bank search "hauptstadt"
+    python3 -m data.bank assemble "New round" --topic "Cities:stadt" \\
+        --topic "Music:sänger OR band" --output rounds/new.round
+
+@author: Christian Wichmann
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import collections
+
+from data import round
+from data.model import Round, Topic, Question, MAXIMUM_QUESTION_COUNT
+from data.validator import normalize_question
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# file name of the question bank
+BANK_FILE = './questions.db'
+# points for the easiest question, if a round does not define them
+DEFAULT_QUESTION_POINTS = 100
+# maximum number of results of a search
+SEARCH_LIMIT = 50
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rounds (
+    id INTEGER PRIMARY KEY,
+    filename TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    round_id INTEGER NOT NULL REFERENCES rounds(id) ON DELETE CASCADE,
+    topic TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    comment TEXT,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_round ON questions(round_id);
+CREATE INDEX IF NOT EXISTS questions_key ON questions(key);
+CREATE TABLE IF NOT EXISTS usage (
+    key TEXT NOT NULL,
+    used_at REAL NOT NULL,
+    round_title TEXT
+);
+CREATE INDEX IF NOT EXISTS usage_key ON usage(key);
+CREATE TABLE IF NOT EXISTS usage_counts (
+    key TEXT PRIMARY KEY,
+    uses INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS usage_insert AFTER INSERT ON usage BEGIN
+    INSERT INTO usage_counts(key, uses) VALUES (new.key, 1)
+        ON CONFLICT(key) DO UPDATE SET uses = uses + 1;
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+    question, answer, topic, content='questions', content_rowid='id',
+    prefix='2 3 4'
+);
+CREATE TRIGGER IF NOT EXISTS questions_insert AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts(rowid, question, answer, topic)
+        VALUES (new.id, new.question, new.answer, new.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_delete AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts(questions_fts, rowid, question, answer, topic)
+        VALUES ('delete', old.id, old.question, old.answer, old.topic);
+END;
+'''
+
+
+BankQuestion = collections.namedtuple('BankQuestion', ['id', 'round', 'topic', 'difficulty',
+                                                       'points', 'question', 'answer',
+                                                       'comment', 'uses'])
+
+
+def build_match_expression(query):
+    """Converts a search query into a FTS5 match expression. Words are
+    searched as prefixes, the operators AND, OR and NOT are kept."""
+    terms = []
+    for word in query.split():
+        if word in ('AND', 'OR', 'NOT'):
+            terms.append(word)
+        else:
+            terms.append('"{}"*'.format(word.replace('"', '""')))
+    return ' '.join(terms)
+
+
+class QuestionBank(object):
+    """Question bank stored in a SQLite database.
+
+    :param filename: name of the database file
+    """
+    def __init__(self, filename=BANK_FILE):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    ##### import of round data files #####
+
+    def import_directory(self, directory=round.ROUND_DATA_PATH):
+        """Imports all round data files of a directory. Only new and changed
+        files are read, questions of removed files are deleted.
+
+        :returns: dictionary with the number of imported, unchanged and
+                  removed files
+        """
+        statistics = {'imported': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+        known_rounds = {filename: (round_id, mtime, size, content_hash)
+                        for round_id, filename, mtime, size, content_hash
+                        in self.connection.execute('SELECT id, filename, mtime, size, hash FROM rounds')}
+        found_files = set()
+        extension = '.{}'.format(round.ROUND_DATA_EXTENSION)
+        with self.connection:
+            for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+                if not entry.name.endswith(extension) or not entry.is_file():
+                    continue
+                path = os.path.normpath(entry.path)
+                found_files.add(path)
+                stat_result = entry.stat()
+                known = known_rounds.get(path)
+                if known and known[1] == stat_result.st_mtime_ns and known[2] == stat_result.st_size:
+                    statistics['unchanged'] += 1
+                    continue
+                with open(path, 'rb') as round_file:
+                    content = round_file.read()
+                content_hash = hashlib.sha1(content).hexdigest()
+                if known and known[3] == content_hash:
+                    self.connection.execute('UPDATE rounds SET mtime = ?, size = ? WHERE id = ?',
+                                            (stat_result.st_mtime_ns, stat_result.st_size, known[0]))
+                    statistics['unchanged'] += 1
+                    continue
+                try:
+                    round_data = Round.from_dict(json.loads(content.decode('utf8')))
+                except ValueError as e:
+                    logger.error('Could not import round data file {}: {}'.format(path, e))
+                    statistics['failed'] += 1
+                    continue
+                if known:
+                    self.connection.execute('DELETE FROM rounds WHERE id = ?', (known[0],))
+                self.insert_round(path, round_data, stat_result, content_hash)
+                statistics['imported'] += 1
+            for path, known in known_rounds.items():
+                if path not in found_files and os.path.dirname(path) == os.path.normpath(directory):
+                    self.connection.execute('DELETE FROM rounds WHERE id = ?', (known[0],))
+                    statistics['removed'] += 1
+        return statistics
+
+    def insert_round(self, path, round_data, stat_result, content_hash):
+        cursor = self.connection.execute(
+            'INSERT INTO rounds (filename, title, mtime, size, hash) VALUES (?, ?, ?, ?, ?)',
+            (path, round_data.title, stat_result.st_mtime_ns, stat_result.st_size, content_hash))
+        round_id = cursor.lastrowid
+        question_points = round_data.question_points or DEFAULT_QUESTION_POINTS
+        rows = []
+        for topic in round_data.topics:
+            topic_title = topic.title.replace('<br>', ' ')
+            for question_number, question in enumerate(topic.questions):
+                if not question.question.strip():
+                    continue
+                difficulty = question_number + 1
+                rows.append((round_id, topic_title, difficulty, difficulty * question_points,
+                             question.question, question.answer, question.comment,
+                             normalize_question(question.question)))
+        self.connection.executemany(
+            'INSERT INTO questions (round_id, topic, difficulty, points, question, answer, comment, key) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    ##### searching #####
+
+    def search(self, query, difficulty=None, unused_only=False, limit=SEARCH_LIMIT,
+               exclude=()):
+        """Searches questions, answers and topics.
+
+        :param query: search words, every word is searched as prefix
+        :param difficulty: only questions with this difficulty (1 for the
+                           easiest question of a topic), None for all
+        :param unused_only: whether to return only questions that were never
+                            used in an assembled round
+        :param limit: maximum number of results
+        :param exclude: ids of questions that should not be returned
+        :returns: list of BankQuestion sorted by relevance, less used
+                  questions first
+        """
+        conditions = ['questions_fts MATCH ?']
+        parameters = [build_match_expression(query)]
+        if difficulty is not None:
+            conditions.append('q.difficulty = ?')
+            parameters.append(difficulty)
+        if exclude:
+            conditions.append('q.id NOT IN ({})'.format(', '.join('?' * len(exclude))))
+            parameters.extend(exclude)
+        if unused_only:
+            conditions.append('u.uses IS NULL')
+        sql = ('SELECT q.id, r.title, q.topic, q.difficulty, q.points, q.question, q.answer, '
+               'q.comment, IFNULL(u.uses, 0) AS uses '
+               'FROM questions_fts JOIN questions q ON q.id = questions_fts.rowid '
+               'JOIN rounds r ON r.id = q.round_id '
+               'LEFT JOIN usage_counts u ON u.key = q.key '
+               'WHERE {} ORDER BY uses, bm25(questions_fts) LIMIT ?'
+               .format(' AND '.join(conditions)))
+        parameters.append(limit)
+        try:
+            return [BankQuestion(*row) for row in self.connection.execute(sql, parameters)]
+        except sqlite3.OperationalError as e:
+            logger.error('Invalid search query "{}": {}'.format(query, e))
+            return []
+
+    def get_usage(self, question):
+        """Returns a list of tuples (time, round title) for every use of the
+        given question text."""
+        return list(self.connection.execute(
+            'SELECT used_at, round_title FROM usage WHERE key = ? ORDER BY used_at',
+            (normalize_question(question),)))
+
+    def record_usage(self, round_data):
+        """Records that all questions of a round were used."""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO usage (key, used_at, round_title) VALUES (?, ?, ?)',
+                [(normalize_question(q.question), now, round_data.title)
+                 for topic in round_data.topics for q in topic.questions])
+
+    def get_statistics(self):
+        rounds, = self.connection.execute('SELECT COUNT(*) FROM rounds').fetchone()
+        questions, = self.connection.execute('SELECT COUNT(*) FROM questions').fetchone()
+        uses, = self.connection.execute('SELECT COUNT(*) FROM usage').fetchone()
+        return {'rounds': rounds, 'questions': questions, 'uses': uses}
+
+    ##### assembling new rounds #####
+
+    def assemble_round(self, title, topic_queries, questions_per_topic=5,
+                       question_points=None):
+        """Assembles a new round from search queries. For every topic one
+        question of every difficulty is chosen, preferring questions that
+        were used less often.
+
+        :param title: title of the new round
+        :param topic_queries: list of tuples (topic title, search query)
+        :param questions_per_topic: number of questions for every topic
+        :param question_points: points for the easiest question, None for
+                                the default
+        :returns: Round object
+        :raises ValueError: if not enough questions were found for a topic
+        """
+        if questions_per_topic > MAXIMUM_QUESTION_COUNT:
+            raise ValueError('At most {} questions per topic are allowed.'
+                             .format(MAXIMUM_QUESTION_COUNT))
+        chosen_ids = []
+        chosen_keys = set()
+        topics = []
+        for topic_title, query in topic_queries:
+            questions = []
+            for difficulty in range(1, questions_per_topic + 1):
+                question = self.choose_question(query, difficulty, chosen_ids, chosen_keys)
+                if not question:
+                    raise ValueError('Not enough questions for topic "{}".'.format(topic_title))
+                chosen_ids.append(question.id)
+                chosen_keys.add(normalize_question(question.question))
+                questions.append(Question(question.question, question.answer, question.comment))
+            topics.append(Topic(topic_title, questions))
+        return Round(title, topics, question_points)
+
+    def choose_question(self, query, difficulty, chosen_ids, chosen_keys):
+        """Returns the best question for the query with the given difficulty
+        or any difficulty, if there is none."""
+        for wanted_difficulty in (difficulty, None):
+            for question in self.search(query, wanted_difficulty, exclude=chosen_ids):
+                # the same question may be in several rounds
+                if normalize_question(question.question) not in chosen_keys:
+                    return question
+        return None
+
+    def export_round(self, round_data, filename):
+        """Saves an assembled round as round data file and records the use of
+        its questions."""
+        round.save_round_data_file(filename, round_data)
+        self.record_usage(round_data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manages the question bank of pyPardy.')
+    parser.add_argument('--bank', default=BANK_FILE, help='file name of the question bank')
+    subparsers = parser.add_subparsers(dest='command')
+    import_parser = subparsers.add_parser('import', help='import round data files')
+    import_parser.add_argument('directory', nargs='?', default=round.ROUND_DATA_PATH)
+    search_parser = subparsers.add_parser('search', help='search questions')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--difficulty', type=int)
+    search_parser.add_argument('--unused', action='store_true')
+    search_parser.add_argument('--limit', type=int, default=SEARCH_LIMIT)
+    assemble_parser = subparsers.add_parser('assemble', help='assemble a new round')
+    assemble_parser.add_argument('title')
+    assemble_parser.add_argument('--topic', action='append', required=True,
+                                 help='topic title and search query as "title:query"')
+    assemble_parser.add_argument('--questions', type=int, default=5)
+    assemble_parser.add_argument('--output', required=True, help='round data file to write')
+    args = parser.parse_args(argv)
+    bank = QuestionBank(args.bank)
+    try:
+        if args.command == 'import':
+            print(bank.import_directory(args.directory))
+        elif args.command == 'search':
+            start = time.perf_counter()
+            results = bank.search(args.query, args.difficulty, args.unused, args.limit)
+            duration = time.perf_counter() - start
+            for result in results:
+                print('[{}] {} / {} ({} points, used {} times)'.format(
+                    result.id, result.round, result.topic, result.points, result.uses))
+                print('    Q: {}'.format(result.question))
+                print('    A: {}'.format(result.answer))
+            print('{} results in {:.1f} ms'.format(len(results), duration * 1000))
+        elif args.command == 'assemble':
+            topic_queries = [tuple(topic.split(':', 1)) for topic in args.topic]
+            if any(len(t) != 2 for t in topic_queries):
+                parser.error('topics have to be given as "title:query"')
+            try:
+                round_data = bank.assemble_round(args.title, topic_queries, args.questions)
+            except ValueError as e:
+                print(e)
+                return 1
+            bank.export_round(round_data, args.output)
+            print('Round "{}" written to {}.'.format(round_data.title, args.output))
+        else:
+            parser.print_help()
+    finally:
+        bank.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""
+pyPardy
+
+Module for compiled round bundles. A bundle contains the same data as a round
+data file, but in a binary format that is memory-mapped instead of parsed:
+
+    header          magic, version, number of topics, questions per topic,
+                    question points, number of strings
+    round           string index of title and extra data
+    topics          string index of title and extra data for every topic
+    questions       string index of question, answer, comment and extra data
+                    for every question
+    string offsets  start of every string in the string data, followed by the
+                    end of the last string
+    string data     all strings encoded as UTF-8, every string only once
+
+The board can be built from the header and the topic titles. The text of a
+question is only decoded when it is accessed. Bundles are created from round
+data files and can be converted back, so that the editor can keep working with
+JSON:
+
+    python3 -m data.bundle compile rounds/test.round
+    python3 -m data.bundle decompile rounds/test.rbundle
+
+@author: Christian Wichmann
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import logging
+import argparse
+
+from data.model import Round, Question, Topic, RoundDataError
+from data.model import MAXIMUM_TOPIC_COUNT, MAXIMUM_QUESTION_COUNT
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# file extension of round bundles
+ROUND_BUNDLE_EXTENSION = 'rbundle'
+# magic bytes at the start of every bundle
+BUNDLE_MAGIC = b'PPRB'
+# version of the bundle format
+BUNDLE_VERSION = 1
+# header: magic, version, topics, questions per topic, question points (or
+# NO_QUESTION_POINTS) and number of strings
+HEADER_FORMAT = struct.Struct('<4sHBBiI')
+# round: title and extra data
+ROUND_FORMAT = struct.Struct('<II')
+# topic: title and extra data
+TOPIC_FORMAT = struct.Struct('<II')
+# question: question, answer, comment and extra data
+QUESTION_FORMAT = struct.Struct('<IIII')
+# single entry of the string offset table
+OFFSET_FORMAT = struct.Struct('<I')
+# string index for missing values, e.g. questions without comment
+NO_STRING = 0xffffffff
+# value in the header for rounds without question points
+NO_QUESTION_POINTS = -1
+
+
+class StringTable(object):
+    """Collects all strings of a bundle, every string is stored once."""
+    def __init__(self):
+        self.strings = []
+        self.indices = {}
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        index = self.indices.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self.indices[value] = index
+        return index
+
+    def add_extra(self, extra):
+        """Adds extra data of the model as JSON string."""
+        if not extra:
+            return NO_STRING
+        return self.add(json.dumps(dict(extra), sort_keys=True))
+
+    def pack(self):
+        encoded = [s.encode('utf8') for s in self.strings]
+        offsets = []
+        position = 0
+        for value in encoded:
+            offsets.append(position)
+            position += len(value)
+        offsets.append(position)
+        return (b''.join(OFFSET_FORMAT.pack(o) for o in offsets) +
+                b''.join(encoded))
+
+
+def pack_round(round_data):
+    """Returns a Round object packed as bundle.
+
+    :param round_data: Round object to pack
+    :returns: bytes with the bundle
+    """
+    strings = StringTable()
+    parts = []
+    parts.append(ROUND_FORMAT.pack(strings.add(round_data.title),
+                                   strings.add_extra(round_data.extra)))
+    for topic in round_data.topics:
+        parts.append(TOPIC_FORMAT.pack(strings.add(topic.title),
+                                       strings.add_extra(topic.extra)))
+    for topic in round_data.topics:
+        for question in topic.questions:
+            parts.append(QUESTION_FORMAT.pack(strings.add(question.question),
+                                              strings.add(question.answer),
+                                              strings.add(question.comment),
+                                              strings.add_extra(question.extra)))
+    question_points = round_data.question_points
+    if question_points is None:
+        question_points = NO_QUESTION_POINTS
+    header = HEADER_FORMAT.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(round_data.topics),
+                                round_data.questions_per_topic, question_points,
+                                len(strings.strings))
+    return header + b''.join(parts) + strings.pack()
+
+
+class BundleQuestions(object):
+    """Sequence of the questions of a single topic in a bundle. Questions are
+    decoded when they are accessed."""
+    __slots__ = ('bundle', 'topic')
+
+    def __init__(self, bundle, topic):
+        self.bundle = bundle
+        self.topic = topic
+
+    def __len__(self):
+        return self.bundle.questions_per_topic
+
+    def __getitem__(self, question):
+        if isinstance(question, slice):
+            return tuple(self[i] for i in range(*question.indices(len(self))))
+        if question < 0:
+            question += len(self)
+        if not 0 <= question < len(self):
+            raise IndexError('Question index out of range.')
+        return self.bundle.get_question(self.topic, question)
+
+    def __iter__(self):
+        for question in range(len(self)):
+            yield self.bundle.get_question(self.topic, question)
+
+
+class BundleTopic(object):
+    """Topic of a bundle with its title and lazily decoded questions."""
+    __slots__ = ('title', 'questions', 'extra')
+
+    def __init__(self, title, questions, extra):
+        self.title = title
+        self.questions = questions
+        self.extra = extra
+
+
+class BundleRound(object):
+    """Round read from a bundle. It offers the same attributes and methods
+    as Round for reading, but decodes questions only when they are accessed.
+
+    All strings and string indices are checked once when the bundle is
+    opened, so accessing a question during a game can not fail.
+
+    :param buffer: bytes or memory map containing the bundle
+    :raises RoundDataError: if the buffer contains no valid bundle
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        try:
+            (magic, version, topic_count, questions_per_topic, question_points,
+             string_count) = HEADER_FORMAT.unpack_from(buffer, 0)
+        except struct.error:
+            raise RoundDataError('Bundle is too short.')
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise RoundDataError('File is not a round bundle.')
+        if topic_count == 0:
+            raise RoundDataError('No topics in round data.')
+        if topic_count > MAXIMUM_TOPIC_COUNT:
+            raise RoundDataError('To much topics in round data.')
+        if not 0 < questions_per_topic <= MAXIMUM_QUESTION_COUNT:
+            raise RoundDataError('Invalid number of questions per topic in bundle.')
+        self.questions_per_topic = questions_per_topic
+        self.question_points = None if question_points == NO_QUESTION_POINTS else question_points
+        self.__string_count = string_count
+        self.__topics_offset = HEADER_FORMAT.size + ROUND_FORMAT.size
+        self.__questions_offset = self.__topics_offset + topic_count * TOPIC_FORMAT.size
+        self.__strings_offset = (self.__questions_offset +
+                                 topic_count * questions_per_topic * QUESTION_FORMAT.size)
+        self.__string_data_offset = (self.__strings_offset +
+                                     (string_count + 1) * OFFSET_FORMAT.size)
+        if len(buffer) < self.__string_data_offset:
+            raise RoundDataError('Bundle is truncated.')
+        self.check_strings()
+        title, extra = ROUND_FORMAT.unpack_from(buffer, HEADER_FORMAT.size)
+        self.title = self.get_string(title)
+        if self.title is None:
+            raise RoundDataError('Round in bundle has no title.')
+        self.extra = self.get_extra(extra)
+        topics = []
+        for topic in range(topic_count):
+            title, extra = TOPIC_FORMAT.unpack_from(buffer, self.__topics_offset +
+                                                    topic * TOPIC_FORMAT.size)
+            title = self.get_string(title)
+            if title is None:
+                raise RoundDataError('Topic in bundle has no title.')
+            topics.append(BundleTopic(title, BundleQuestions(self, topic),
+                                      self.get_extra(extra)))
+        self.topics = tuple(topics)
+        self.check_questions()
+
+    def check_strings(self):
+        """Checks that the string offsets are in order and inside the bundle
+        and that every string is valid UTF-8."""
+        offsets = struct.unpack_from('<{}I'.format(self.__string_count + 1), self.buffer,
+                                     self.__strings_offset)
+        end = offsets[-1]
+        if self.__string_data_offset + end > len(self.buffer):
+            raise RoundDataError('Bundle is truncated.')
+        if any(start > next_start for start, next_start in zip(offsets, offsets[1:])):
+            raise RoundDataError('Invalid string table in bundle.')
+        data = self.buffer[self.__string_data_offset:self.__string_data_offset + end]
+        try:
+            data.decode('utf8')
+        except UnicodeDecodeError:
+            raise RoundDataError('Invalid string in bundle.')
+        # all data is valid UTF-8, so every string is valid if none of them
+        # starts in the middle of a character
+        if any(start < end and 0x80 <= data[start] < 0xc0 for start in offsets):
+            raise RoundDataError('Invalid string in bundle.')
+
+    def check_questions(self):
+        """Checks the string indices and the extra data of all questions."""
+        table = self.buffer[self.__questions_offset:self.__strings_offset]
+        for text, answer, comment, extra in QUESTION_FORMAT.iter_unpack(table):
+            # NO_STRING is never a valid index, so questions without text or
+            # answer are found, too
+            if text >= self.__string_count or answer >= self.__string_count:
+                raise RoundDataError('Question in bundle has no text or answer.')
+            if comment != NO_STRING and comment >= self.__string_count:
+                raise RoundDataError('Invalid string index in bundle.')
+            if extra != NO_STRING:
+                self.get_extra(extra)
+
+    def get_string(self, index):
+        """Decodes a string from the string table."""
+        if index == NO_STRING:
+            return None
+        if index >= self.__string_count:
+            raise RoundDataError('Invalid string index in bundle.')
+        start, end = struct.unpack_from('<II', self.buffer,
+                                        self.__strings_offset + index * OFFSET_FORMAT.size)
+        start += self.__string_data_offset
+        end += self.__string_data_offset
+        if end > len(self.buffer) or start > end:
+            raise RoundDataError('Bundle is truncated.')
+        try:
+            return bytes(self.buffer[start:end]).decode('utf8')
+        except UnicodeDecodeError:
+            raise RoundDataError('Invalid string in bundle.')
+
+    def get_extra(self, index):
+        extra = self.get_string(index)
+        if extra is None:
+            return ()
+        try:
+            extra = json.loads(extra)
+        except ValueError:
+            extra = None
+        if not isinstance(extra, dict):
+            raise RoundDataError('Invalid extra data in bundle.')
+        return tuple(sorted(extra.items()))
+
+    def get_question(self, topic, question):
+        """Decodes the question with the given number from the given
+        topic."""
+        offset = (self.__questions_offset +
+                  (topic * self.questions_per_topic + question) * QUESTION_FORMAT.size)
+        text, answer, comment, extra = QUESTION_FORMAT.unpack_from(self.buffer, offset)
+        return Question(self.get_string(text), self.get_string(answer),
+                        self.get_string(comment), self.get_extra(extra))
+
+    def to_round(self):
+        """Decodes the whole bundle and returns it as Round object."""
+        return Round(self.title,
+                     [Topic(topic.title, list(topic.questions), topic.extra)
+                      for topic in self.topics],
+                     self.question_points, self.extra)
+
+    def to_dict(self):
+        return self.to_round().to_dict()
+
+    def replace_question(self, topic, question, new_question):
+        return self.to_round().replace_question(topic, question, new_question)
+
+    def __repr__(self):
+        return 'BundleRound({!r}, {} topics)'.format(self.title, len(self.topics))
+
+
+def open_bundle(filename):
+    """Memory-maps a bundle file and returns it as BundleRound.
+
+    :raises RoundDataError: if the file contains no valid bundle
+    """
+    with open(filename, 'rb') as bundle_file:
+        try:
+            buffer = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            raise RoundDataError('Bundle is too short.')
+    return BundleRound(buffer)
+
+
+def write_bundle(filename, round_data):
+    """Writes a round as bundle to a file. The file is replaced atomically.
+
+    :param round_data: Round object to write
+    """
+    temporary_filename = filename + '.tmp'
+    with open(temporary_filename, 'wb') as bundle_file:
+        bundle_file.write(pack_round(round_data))
+        bundle_file.flush()
+        os.fsync(bundle_file.fileno())
+    os.replace(temporary_filename, filename)
+
+
+def compile_round_file(json_filename, bundle_filename=None):
+    """Converts a round data file into a bundle.
+
+    :returns: filename of the bundle
+    """
+    if not bundle_filename:
+        bundle_filename = '{}.{}'.format(os.path.splitext(json_filename)[0],
+                                         ROUND_BUNDLE_EXTENSION)
+    with open(json_filename, encoding='utf8') as json_file:
+        round_data = Round.from_dict(json.load(json_file))
+    write_bundle(bundle_filename, round_data)
+    return bundle_filename
+
+
+def decompile_bundle(bundle_filename, json_filename=None, overwrite=False):
+    """Converts a bundle back into a round data file. The file is replaced
+    atomically. A round data file with the default name, usually the source
+    of the bundle, is only replaced if 'overwrite' is set.
+
+    :returns: filename of the round data file
+    :raises FileExistsError: if the default round data file already exists
+    """
+    if not json_filename:
+        json_filename = '{}.round'.format(os.path.splitext(bundle_filename)[0])
+        if not overwrite and os.path.exists(json_filename):
+            raise FileExistsError('{} already exists, use --force or --output.'
+                                  .format(json_filename))
+    with open(bundle_filename, 'rb') as bundle_file:
+        round_data = BundleRound(bundle_file.read())
+    content = json.dumps(round_data.to_dict(), indent=4, sort_keys=True).encode('utf8')
+    temporary_filename = json_filename + '.tmp'
+    with open(temporary_filename, 'wb') as json_file:
+        json_file.write(content)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(temporary_filename, json_filename)
+    return json_filename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Converts between round data files and round bundles.')
+    parser.add_argument('command', choices=('compile', 'decompile'),
+                        help='"compile" creates bundles, "decompile" creates round data files')
+    parser.add_argument('filenames', nargs='+', help='files to convert')
+    parser.add_argument('--output', help='output file, only for a single input file')
+    parser.add_argument('--force', action='store_true',
+                        help='let "decompile" replace existing round data files')
+    args = parser.parse_args(argv)
+    if args.output and len(args.filenames) > 1:
+        parser.error('--output can only be used with a single input file')
+    result = 0
+    for filename in args.filenames:
+        try:
+            if args.command == 'compile':
+                output = compile_round_file(filename, args.output)
+            else:
+                output = decompile_bundle(filename, args.output, args.force)
+            print('{} -> {}'.format(filename, output))
+        except (OSError, ValueError) as e:
+            print('{}: {}'.format(filename, e))
+            result = 1
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -39,6 +39,12 @@ ADD_ROUND_POINTS = False
 HIDE_QUESTION = False
 # whether to allow multiple teams to answer a single question
 ALLOW_ALL_TEAMS_TO_ANSWER = True
+# when to sync the score journal to disk: 'always', 'interval' or 'never'
+JOURNAL_FSYNC_POLICY = 'interval'
+# minimal time between two syncs of the score journal in milliseconds
+JOURNAL_FSYNC_INTERVAL = 1000
+# interval for saving snapshots of the running game in milliseconds
+SNAPSHOT_INTERVAL = 2000
 
 
 ##### Audio related settings #####
@@ -72,6 +78,23 @@ HIGH_CONTRAST = False
 BUZZER_ID_FOR_TEAMS = [1, 2, 3, 4]
 # predefined team names
 TEAM_NAMES = ['Rot', 'Grün', 'Gelb', 'Blau']
+# time in milliseconds in which all presses are collected before the first
+# one (by its timestamp) is chosen as winner
+BUZZER_ARBITRATION_WINDOW = 5
+# source for buzzer presses, either 'usb' for local USB buzzers, 'network'
+# for buzzers connected over UDP or WebSocket or 'replay' for replaying a
+# recorded file
+BUZZER_SOURCE = 'usb'
+# UDP port for network buzzers
+NETWORK_BUZZER_UDP_PORT = 7777
+# TCP port for network buzzers using WebSocket
+NETWORK_BUZZER_WEBSOCKET_PORT = 7778
+# file to record all buzzer presses to, empty to disable recording
+BUZZER_RECORD_FILE = ''
+# recorded file that is replayed when BUZZER_SOURCE is 'replay'
+BUZZER_REPLAY_FILE = 'buzzer.rec'
+# speed for replaying in percent, 0 for replaying as fast as possible
+BUZZER_REPLAY_SPEED = 100
 
 
 def load_config_from_file():
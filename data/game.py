@@ -11,13 +11,19 @@ Module for handling all game related data like teams and points.
 import logging
 
 from data import config
+from data import journal
+from data.model import MAXIMUM_TOPIC_COUNT, MAXIMUM_QUESTION_COUNT
 
 
 logger = logging.getLogger('pyPardy.data')
 
 
-# file name for storing information about points of all teams
-POINTS_FILE = './points.log'
+# file name for the journal of all score changes, see data.journal
+JOURNAL_FILE = './points.journal'
+# events sent to all listeners of a game, see Game.add_listener()
+QUESTION_COMPLETED = 'question completed'
+POINTS_CHANGED = 'points changed'
+GAME_RESET = 'game reset'
 
 
 class Game():
@@ -28,20 +34,54 @@ class Game():
 
     The team id and the buzzer id begins with 0. A value of -1 signals an
     error.
+
+    :param journal_filename: file name of the journal of all score changes,
+                             None if no journal should be written
     """
-    def __init__(self):
+    def __init__(self, journal_filename=None):
+        # counter that is increased on every change of the game state, used
+        # to write snapshots only after changes
+        self.state_version = 0
+        # callables that are informed about changes of the game state
+        self.listeners = []
+        # open journal for saving points information of all rounds
+        if journal_filename:
+            self.journal = journal.ScoreJournal(journal_filename, config.JOURNAL_FSYNC_POLICY,
+                                                config.JOURNAL_FSYNC_INTERVAL / 1000)
+        else:
+            self.journal = journal.NullJournal()
         self.reset_game(reset_points=True)
         # dictionary with the buzzer id for each team copied from configs
         # default
         self.buzzer_id_list = list(config.BUZZER_ID_FOR_TEAMS)
         self._current_round_data = None
-        # open file for saving points information of all rounds
-        self.points_file = open(POINTS_FILE, 'a')
 
-    def __del__(self):
-        # close file when destroying this object
-        #self.points_file.close()
-        pass
+    def close(self):
+        """Writes all waiting journal records and closes the journal."""
+        self.journal.close()
+
+    ##### methods for informing listeners about changes #####
+
+    def add_listener(self, listener):
+        """Adds a callable that is called for every change of the game with
+        the event and its arguments:
+
+            QUESTION_COMPLETED  topic, question
+            POINTS_CHANGED      team id, new points of the team
+            GAME_RESET          no arguments, all questions and maybe the
+                                points of all teams have been reset
+
+        :param listener: callable getting the event and its arguments
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify_listeners(self, event, *args):
+        for listener in list(self.listeners):
+            listener(event, *args)
 
     @property
     def current_round_data(self):
@@ -49,18 +89,34 @@ class Game():
 
     @current_round_data.setter
     def current_round_data(self, value):
+        self.state_version += 1
         if value:
             self._current_round_data = value
-            # write info to points file
-            self.points_file.write('===== New round: {} =====\n'.format(self.get_round_title()))
-            self.points_file.flush()
+            self.count_remaining_questions()
+            # write info to journal
+            self.journal.write(journal.ROUND_EVENT, round=self.get_round_title())
             # read question points from loaded data and set config option
-            try:
-                config.QUESTION_POINTS = int(self._current_round_data['question points'])
-            except KeyError:
+            if self._current_round_data.question_points is not None:
+                config.QUESTION_POINTS = self._current_round_data.question_points
+            else:
                 logger.debug('Round does not include a setting for "question points"!')
         else:
             self._current_round_data = None
+            self.remaining_questions = 0
+
+    def start_game(self):
+        """Writes to the journal that a new game of the current round was
+        started. Only the game window calls this, so that the journal tells
+        which rounds were really played."""
+        self.journal.write(journal.GAME_EVENT, round=self.get_round_title())
+
+    def update_round_data(self, round_data):
+        """Replaces the data of the current round without starting a new
+        round, e.g. after a question was edited.
+
+        :param round_data: Round object with the changed data
+        """
+        self._current_round_data = round_data
 
     ##### methods for generating information from raw data #####
 
@@ -69,7 +125,7 @@ class Game():
 
         :returns: number of topics, or 0 if no round was chosen"""
         if self.current_round_data:
-            return len(self.current_round_data['topics'])
+            return len(self.current_round_data.topics)
         return 0
 
     def get_number_of_questions(self, topic):
@@ -78,13 +134,13 @@ class Game():
         :returns: number of questions in chosen topic, or 0 if no round
                   was chosen"""
         if self.current_round_data:
-            return len(self.current_round_data['topics'][topic]['questions'])
+            return len(self.current_round_data.topics[topic].questions)
         return 0
 
     def get_topic_name(self):
         """Returns a string containing the name of the chosen topic."""
         if self.current_round_data:
-            return self.current_round_data['topics'][self.current_topic]['title']
+            return self.current_round_data.topics[self.current_topic].title
 
     def get_points_for_current_question(self):
         """Calculates and returns the points given for the current question as
@@ -95,16 +151,16 @@ class Game():
 
     def get_current_question(self):
         """Returns a string containing the text of the current question."""
-        questions = self.current_round_data['topics'][self.current_topic]['questions']
-        return questions[self.current_question]['question']
+        return self.current_round_data.get_question(self.current_topic,
+                                                    self.current_question).question
 
     def get_current_answer(self):
         """Returns a string containing the answer of the current question."""
-        questions = self.current_round_data['topics'][self.current_topic]['questions']
-        return questions[self.current_question]['answer']
+        return self.current_round_data.get_question(self.current_topic,
+                                                    self.current_question).answer
 
     def get_round_title(self):
-        return self.current_round_data['title']
+        return self.current_round_data.title
 
     ##### methods concerning status of questions #####
 
@@ -114,55 +170,68 @@ class Game():
             topic = self.current_topic
         if question == None:
             question=self.current_question
-        string = '{}-{}'.format(topic, question)
-        self.played_questions_list.append(string)
+        index = topic * MAXIMUM_QUESTION_COUNT + question
+        if self.played_questions_bitset[index]:
+            return
+        self.played_questions_bitset[index] = 1
+        self.played_questions.append((topic, question))
+        self.remaining_questions -= 1
+        self.state_version += 1
+        self.notify_listeners(QUESTION_COMPLETED, topic, question)
 
     def was_question_completed(self, topic, question):
-        """Marks current questions of current topic as completed."""
-        string = '{}-{}'.format(topic, question)
-        if string in self.played_questions_list:
-            return True
-        else:
-            return False
+        """Returns whether the given question of the given topic was already
+        played."""
+        return bool(self.played_questions_bitset[topic * MAXIMUM_QUESTION_COUNT + question])
+
+    def count_remaining_questions(self):
+        """Sets the number of questions of the current round that were not
+        played yet."""
+        self.remaining_questions = 0
+        for topic in range(self.get_number_of_topics()):
+            for question in range(self.get_number_of_questions(topic)):
+                if not self.was_question_completed(topic, question):
+                    self.remaining_questions += 1
 
     def is_round_complete(self):
         """Returns whether all questions of a given round were played.
 
         :returns: true, if all questions have been played"""
-        for topic in range(self.get_number_of_topics()):
-            for question in range(self.get_number_of_questions(topic)):
-                if not self.was_question_completed(topic, question):
-                    return False
+        if self.remaining_questions:
+            return False
         self.fix_ranking()
         return True
 
     def quit_round(self):
         for topic in range(self.get_number_of_topics()):
             for question in range(self.get_number_of_questions(topic)):
-                if not self.was_question_completed(topic, question):
-                    self.mark_question_as_complete(topic=topic, question=question)
+                self.mark_question_as_complete(topic=topic, question=question)
         self.fix_ranking()
 
     ##### methods concerning points and team management #####
 
-    def write_current_points_to_file(self):
-        self.points_file.write('----- ')
-        for team_id, team in self.team_points_dict.items():
-            self.points_file.write(' * {}: {} * '.format(team_id, team))
-        self.points_file.write(' -----\n')
-        self.points_file.flush()
+    def change_points_of_team(self, team_id, delta):
+        """Changes the points of a team and writes the change to the journal.
 
-    def add_points_to_team(self, team_id):
+        :param team_id: id of the team
+        :param delta: points to add, negative to subtract points
+        """
         if team_id not in self.team_points_dict:
             raise ValueError('Invalid team id!')
-        self.team_points_dict[team_id] += (self.current_question + 1) * config.QUESTION_POINTS
-        self.write_current_points_to_file()
+        self.team_points_dict[team_id] += delta
+        self.state_version += 1
+        round_title = self.get_round_title() if self.current_round_data else None
+        self.journal.write(journal.POINTS_EVENT, round=round_title,
+                           topic=self.current_topic, question=self.current_question,
+                           team=team_id, delta=delta,
+                           total=self.team_points_dict[team_id])
+        self.notify_listeners(POINTS_CHANGED, team_id, self.team_points_dict[team_id])
+
+    def add_points_to_team(self, team_id):
+        self.change_points_of_team(team_id, (self.current_question + 1) * config.QUESTION_POINTS)
 
     def subtract_points_from_team(self, team_id):
-        if team_id not in self.team_points_dict:
-            raise ValueError('Invalid team id!')
-        self.team_points_dict[team_id] -= (self.current_question + 1) * config.QUESTION_POINTS
-        self.write_current_points_to_file() 
+        self.change_points_of_team(team_id, -(self.current_question + 1) * config.QUESTION_POINTS)
 
     def correct_points_by_100(self, team_id, add_points=True):
         """Corrects points for a given team by the number of points for a
@@ -173,12 +242,10 @@ class Game():
         :param add_points: whether to add points for given team or to subtract
                            them
         """
-        if team_id not in self.team_points_dict:
-            raise ValueError('Invalid team id!')
         if add_points:
-            self.team_points_dict[team_id] += config.QUESTION_POINTS
+            self.change_points_of_team(team_id, config.QUESTION_POINTS)
         else:
-            self.team_points_dict[team_id] -= config.QUESTION_POINTS
+            self.change_points_of_team(team_id, -config.QUESTION_POINTS)
 
     def get_points_for_team(self, team_id):
         return self.team_points_dict[team_id]
@@ -237,11 +304,52 @@ class Game():
         self.current_topic = -1
         # number of the currently chosen question, -1 if non was chosen
         self.current_question = -1
-        # list with all questions that have been played before
-        self.played_questions_list = []
+        # flag for every question whether it has been played before, indexed
+        # by topic * MAXIMUM_QUESTION_COUNT + question
+        self.played_questions_bitset = bytearray(MAXIMUM_TOPIC_COUNT * MAXIMUM_QUESTION_COUNT)
+        # list with all questions as tuple (topic, question) in the order they
+        # have been played
+        self.played_questions = []
+        # number of questions of the current round that were not played yet
+        self.remaining_questions = 0
         # dictionary with points for all teams
         if not config.ADD_ROUND_POINTS or reset_points:
             self.team_points_dict = dict.fromkeys(range(config.MAX_TEAM_NUMBER), 0)
+            self.journal.write(journal.RESET_EVENT, teams=config.MAX_TEAM_NUMBER)
+        self.notify_listeners(GAME_RESET)
+
+    ##### methods for saving and restoring the game state #####
+
+    def get_state(self):
+        """Returns the state of the game as dictionary that can be stored as
+        JSON, e.g. in a snapshot."""
+        return {'filename': self.filename,
+                'played questions': [list(cell) for cell in self.played_questions],
+                'points': [[team_id, points] for team_id, points
+                           in sorted(self.team_points_dict.items())]}
+
+    def restore_state(self, state):
+        """Restores the played questions and the points of all teams from a
+        state returned by get_state(). The round data of the file in the
+        state has to be loaded already.
+
+        :param state: dictionary with the game state
+        """
+        for topic, question in state['played questions']:
+            if (topic < self.get_number_of_topics() and
+                    question < self.get_number_of_questions(topic)):
+                self.mark_question_as_complete(topic=topic, question=question)
+        round_title = self.get_round_title() if self.current_round_data else None
+        for team_id, points in state['points']:
+            if team_id in self.team_points_dict:
+                self.team_points_dict[team_id] = points
+                # write restored points to journal so that it can rebuild the
+                # scoreboard after the next crash
+                self.journal.write(journal.POINTS_EVENT, round=round_title,
+                                   topic=-1, question=-1, team=team_id,
+                                   delta=0, total=points)
+                self.notify_listeners(POINTS_CHANGED, team_id, points)
+        self.state_version += 1
 
 
 if __name__ == '__main__':
@@ -0,0 +1,292 @@
+"""
+pyPardy
+
+Module for generating new rounds from the question bank. The generator picks
+MAXIMUM_TOPIC_COUNT topics and for every topic one question per difficulty,
+honoring the following constraints:
+
+    * questions used in the last games are not chosen again
+    * the difficulty of the questions increases with their points, so the
+      question for 100 points comes from a lower position in its original
+      topic than the question for 200 points
+    * every topic title is used only once and topics are taken from as many
+      different rounds as possible
+    * no question is used twice in the same round
+
+The pool is read from the question bank once and grouped by topic, the search
+then only works on these groups in memory. Only ids and normalized texts are
+kept in the pool, the text of the chosen questions is read at the end:
+
+    python3 -m data.generator "Generated round" --output rounds/generated.round
+
+@author: Christian Wichmann
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import collections
+
+from data import bank
+from data import journal
+from data import round
+from data.game import JOURNAL_FILE
+from data.model import Round, Topic, Question, MAXIMUM_TOPIC_COUNT, MAXIMUM_QUESTION_COUNT
+from data.validator import normalize_question
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# number of last games whose questions are not chosen again
+RECENT_GAMES = 5
+# default number of questions per topic
+QUESTIONS_PER_TOPIC = 5
+
+
+PoolQuestion = collections.namedtuple('PoolQuestion', ['id', 'round_id', 'difficulty', 'key'])
+
+
+class TopicPool(object):
+    """All candidate questions for a topic title, grouped by difficulty."""
+    __slots__ = ('title', 'round_ids', 'questions_by_difficulty')
+
+    def __init__(self, title):
+        self.title = title
+        self.round_ids = set()
+        self.questions_by_difficulty = collections.defaultdict(list)
+
+    def add(self, question):
+        self.round_ids.add(question.round_id)
+        self.questions_by_difficulty[question.difficulty].append(question)
+
+    def is_feasible(self, questions_per_topic):
+        return len(self.questions_by_difficulty) >= questions_per_topic
+
+
+def normalize_topic(title):
+    """Returns the title of a topic in a form that is used to find topics
+    with the same title."""
+    return normalize_question(title)
+
+
+def get_recently_played_rounds(games, journal_filename=JOURNAL_FILE):
+    """Returns the titles of the rounds of the last games from the score
+    journal. Only games started in the game window are counted."""
+    titles = []
+    if not os.path.exists(journal_filename):
+        return titles
+    try:
+        for record in journal.read_journal(journal_filename):
+            if record.get('event') == journal.GAME_EVENT:
+                titles.append(record.get('round'))
+    except OSError as e:
+        logger.warning('Could not read score journal: {}'.format(e))
+    return titles[-games:] if games else []
+
+
+class RoundGenerator(object):
+    """Generates rounds from the questions of a question bank.
+
+    :param question_bank: QuestionBank object with all available questions
+    :param recent_games: number of last games whose questions are excluded
+    :param journal_filename: score journal used to find the rounds of the
+                             last games that were played
+    :param seed: seed for the random choice, None for a different round every
+                 time
+    """
+    def __init__(self, question_bank, recent_games=RECENT_GAMES,
+                 journal_filename=JOURNAL_FILE, seed=None):
+        self.question_bank = question_bank
+        self.recent_games = recent_games
+        self.journal_filename = journal_filename
+        self.random = random.Random(seed)
+
+    def get_excluded_keys(self):
+        """Returns the normalized texts of all questions used in the last
+        games, either as part of a generated round or of a played round."""
+        if not self.recent_games:
+            return set()
+        connection = self.question_bank.connection
+        times = [row[0] for row in connection.execute(
+            'SELECT DISTINCT used_at FROM usage ORDER BY used_at DESC LIMIT ?',
+            (self.recent_games,))]
+        keys = set()
+        if times:
+            keys.update(row[0] for row in connection.execute(
+                'SELECT key FROM usage WHERE used_at >= ?', (min(times),)))
+        titles = get_recently_played_rounds(self.recent_games, self.journal_filename)
+        if titles:
+            keys.update(row[0] for row in connection.execute(
+                'SELECT q.key FROM questions q JOIN rounds r ON r.id = q.round_id '
+                'WHERE r.title IN ({})'.format(', '.join('?' * len(titles))), titles))
+        return keys
+
+    def load_pool(self):
+        """Reads all questions that may be used from the question bank.
+
+        :returns: dictionary mapping normalized topic titles to TopicPool
+        """
+        excluded_keys = self.get_excluded_keys()
+        pool = {}
+        # many questions share the same topic title
+        topics_by_title = {}
+        for row in self.question_bank.connection.execute(
+                "SELECT id, round_id, topic, difficulty, key FROM questions WHERE answer != ''"):
+            question_id, round_id, topic_title, difficulty, key = row
+            if key in excluded_keys:
+                continue
+            topic = topics_by_title.get(topic_title)
+            if topic is None:
+                topic_key = normalize_topic(topic_title)
+                topic = pool.get(topic_key)
+                if topic is None:
+                    topic = pool[topic_key] = TopicPool(topic_title)
+                topics_by_title[topic_title] = topic
+            topic.add(PoolQuestion(question_id, round_id, difficulty, key))
+        return pool
+
+    def get_questions(self, pool_questions):
+        """Reads the text of the given pool questions from the question bank.
+
+        :returns: list of Question objects in the same order
+        """
+        ids = [q.id for q in pool_questions]
+        rows = {row[0]: row[1:] for row in self.question_bank.connection.execute(
+            'SELECT id, question, answer, comment FROM questions WHERE id IN ({})'
+            .format(', '.join('?' * len(ids))), ids)}
+        return [Question(*rows[question_id]) for question_id in ids]
+
+    def generate(self, title, topic_count=MAXIMUM_TOPIC_COUNT,
+                 questions_per_topic=QUESTIONS_PER_TOPIC, question_points=None):
+        """Generates a new round.
+
+        :param title: title of the new round
+        :param topic_count: number of topics
+        :param questions_per_topic: number of questions for every topic
+        :param question_points: points for the easiest question, None for
+                                the default
+        :returns: Round object
+        :raises ValueError: if the pool does not contain enough questions to
+                            satisfy all constraints
+        """
+        if not 0 < topic_count <= MAXIMUM_TOPIC_COUNT:
+            raise ValueError('Between 1 and {} topics are allowed.'.format(MAXIMUM_TOPIC_COUNT))
+        if not 0 < questions_per_topic <= MAXIMUM_QUESTION_COUNT:
+            raise ValueError('Between 1 and {} questions per topic are allowed.'
+                             .format(MAXIMUM_QUESTION_COUNT))
+        pool = self.load_pool()
+        candidates = [topic for topic in pool.values()
+                      if topic.is_feasible(questions_per_topic)]
+        self.random.shuffle(candidates)
+        topics = self.choose_topics(candidates, topic_count, questions_per_topic)
+        if topics is None:
+            raise ValueError('Not enough questions in the question bank for {} topics with {} '
+                             'questions each.'.format(topic_count, questions_per_topic))
+        return Round(title, topics, question_points)
+
+    def choose_topics(self, candidates, topic_count, questions_per_topic):
+        """Chooses topics from the candidates. Topics from rounds that were
+        not used yet are preferred, so the search first tries only those and
+        then allows topics from rounds that are already used.
+
+        :returns: list of Topic objects or None, if not enough topics could
+                  be filled
+        """
+        topics = []
+        used_round_ids = set()
+        used_keys = set()
+        remaining = list(candidates)
+        for allow_used_rounds in (False, True):
+            unused_candidates = []
+            for candidate in remaining:
+                if len(topics) == topic_count:
+                    break
+                if not allow_used_rounds and candidate.round_ids <= used_round_ids:
+                    unused_candidates.append(candidate)
+                    continue
+                questions = self.choose_questions(candidate, questions_per_topic,
+                                                  used_keys, None if allow_used_rounds
+                                                  else used_round_ids)
+                if questions is None:
+                    unused_candidates.append(candidate)
+                    continue
+                topics.append(Topic(candidate.title, self.get_questions(questions)))
+                used_keys.update(q.key for q in questions)
+                used_round_ids.update(q.round_id for q in questions)
+            remaining = unused_candidates
+        if len(topics) < topic_count:
+            return None
+        return topics
+
+    def choose_questions(self, topic, questions_per_topic, used_keys, avoided_round_ids):
+        """Chooses one question for every slot of a topic with increasing
+        difficulty. The difficulties are a random sorted sample of the
+        available ones, so that easy and hard questions keep their order.
+
+        :param avoided_round_ids: ids of rounds whose questions should not be
+                                  used, None to allow all rounds
+        :returns: list of PoolQuestion or None, if the topic can not be
+                  filled
+        """
+        def is_allowed(question):
+            return (question.key not in used_keys and
+                    (avoided_round_ids is None or question.round_id not in avoided_round_ids))
+
+        available = sorted(difficulty for difficulty, questions
+                           in topic.questions_by_difficulty.items()
+                           if any(is_allowed(q) for q in questions))
+        if len(available) < questions_per_topic:
+            return None
+        difficulties = sorted(self.random.sample(available, questions_per_topic))
+        chosen = []
+        chosen_keys = set()
+        for difficulty in difficulties:
+            questions = [q for q in topic.questions_by_difficulty[difficulty]
+                         if is_allowed(q) and q.key not in chosen_keys]
+            if not questions:
+                return None
+            question = self.random.choice(questions)
+            chosen.append(question)
+            chosen_keys.add(question.key)
+        return chosen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generates a new round from the question bank.')
+    parser.add_argument('title', help='title of the new round')
+    parser.add_argument('--output', required=True, help='round data file to write')
+    parser.add_argument('--bank', default=bank.BANK_FILE, help='file name of the question bank')
+    parser.add_argument('--rounds', default=round.ROUND_DATA_PATH,
+                        help='directory with round data files that are imported first')
+    parser.add_argument('--topics', type=int, default=MAXIMUM_TOPIC_COUNT)
+    parser.add_argument('--questions', type=int, default=QUESTIONS_PER_TOPIC)
+    parser.add_argument('--recent', type=int, default=RECENT_GAMES,
+                        help='number of last games whose questions are not used again')
+    parser.add_argument('--seed', type=int, help='seed for reproducible rounds')
+    args = parser.parse_args(argv)
+    question_bank = bank.QuestionBank(args.bank)
+    try:
+        start = time.perf_counter()
+        question_bank.import_directory(args.rounds)
+        generator = RoundGenerator(question_bank, args.recent, seed=args.seed)
+        try:
+            round_data = generator.generate(args.title, args.topics, args.questions)
+        except ValueError as e:
+            print(e)
+            return 1
+        question_bank.export_round(round_data, args.output)
+        duration = time.perf_counter() - start
+    finally:
+        question_bank.close()
+    for topic in round_data.topics:
+        print('{}: {} questions'.format(topic.title, len(topic.questions)))
+    print('Round "{}" written to {} in {:.0f} ms.'.format(round_data.title, args.output,
+                                                         duration * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,7 +7,11 @@ Helper classes for the back-end of pyPardy.
 @author: Christian Wichmann
 """
 
+import os
+import math
+import time
 import logging
+import threading
 import collections
 import functools
 
@@ -47,6 +51,201 @@ class memoized(object):
         return functools.partial(self.__call__, obj)
 
 
+def copy_json_data(data):
+    """Returns a deep copy of data as loaded by the json module. Only dicts and
+    lists are copied, all other values are immutable. This is much faster than
+    copy.deepcopy()."""
+    if isinstance(data, dict):
+        return {key: copy_json_data(value) for key, value in data.items()}
+    elif isinstance(data, list):
+        return [copy_json_data(value) for value in data]
+    return data
+
+
+class FileCache(object):
+    """Least recently used cache for data loaded from files. Entries are
+    keyed by the path of the file and are reloaded when modification time or
+    size of the file have changed.
+
+    The cache is bounded by the number of entries and by the summed size of
+    the cached files. Unless the data is immutable, every call of get()
+    returns a new copy of the cached data, so callers can change it without
+    affecting the cache. The cache can be used from several threads.
+
+    :param loader: function that gets a filename and returns the loaded data
+    :param max_entries: maximum number of cached files
+    :param max_size: maximum summed size of all cached files in bytes
+    :param copy: function that returns a copy of the loaded data, None if
+                 the data is immutable and can be returned as is
+    """
+    def __init__(self, loader, max_entries, max_size, copy=copy_json_data):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.copy = copy
+        # maps path to tuple of (mtime, size, data)
+        self.__entries = collections.OrderedDict()
+        self.__size = 0
+        self.__lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, filename):
+        """Returns a copy of the data from the given file. The file is only
+        loaded if it is not cached or has changed on disk."""
+        with self.__lock:
+            path = os.path.abspath(filename)
+            stat_result = os.stat(path)
+            entry = self.__entries.get(path)
+            if entry is not None:
+                mtime, size, data = entry
+                if mtime == stat_result.st_mtime_ns and size == stat_result.st_size:
+                    self.hits += 1
+                    self.__entries.move_to_end(path)
+                    return self.copy(data) if self.copy else data
+                self.invalidations += 1
+                self.__remove(path)
+            self.misses += 1
+            data = self.loader(filename)
+            self.__insert(path, stat_result, data)
+            return self.copy(data) if self.copy else data
+
+    def put(self, filename, data):
+        """Stores data for a file that was just written, so that it does not
+        have to be loaded again. The data must not be changed afterwards."""
+        with self.__lock:
+            path = os.path.abspath(filename)
+            if path in self.__entries:
+                self.__remove(path)
+            self.__insert(path, os.stat(path), data)
+
+    def __insert(self, path, stat_result, data):
+        size = stat_result.st_size
+        if size <= self.max_size:
+            self.__entries[path] = (stat_result.st_mtime_ns, size, data)
+            self.__size += size
+            while len(self.__entries) > self.max_entries or self.__size > self.max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+    def __remove(self, path):
+        _, size, _ = self.__entries.pop(path)
+        self.__size -= size
+
+    def invalidate(self, filename=None):
+        """Removes the given file or all files from the cache."""
+        with self.__lock:
+            if filename is None:
+                self.invalidations += len(self.__entries)
+                self.__entries.clear()
+                self.__size = 0
+            else:
+                path = os.path.abspath(filename)
+                if path in self.__entries:
+                    self.invalidations += 1
+                    self.__remove(path)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_statistics(self):
+        """Returns a dictionary with the number of hits, misses, evictions and
+        invalidations as well as the number and summed size of cached
+        files."""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.__entries),
+                'size': self.__size}
+
+
+class Countdown(object):
+    """Countdown that is computed from a deadline on the monotonic clock
+    instead of counting timer events. A stalled event loop therefore only
+    delays the display, but never the end of the countdown.
+
+    The countdown also measures how late the timer events that drive it
+    arrive (jitter), see schedule_tick() and tick().
+
+    :param duration: length of the countdown in seconds
+    :param clock: function returning the current time in seconds
+    """
+    def __init__(self, duration, clock=time.monotonic):
+        self.duration = duration
+        self.clock = clock
+        self.__deadline = None
+        self.__remaining = duration
+        self.__expected_tick = None
+        self.ticks = 0
+        self.total_lateness = 0.0
+        self.maximum_lateness = 0.0
+
+    def start(self):
+        """Starts or resumes the countdown with the remaining time."""
+        if self.__deadline is None:
+            self.__deadline = self.clock() + self.__remaining
+
+    resume = start
+
+    def pause(self):
+        """Stops the countdown and keeps the remaining time exactly."""
+        if self.__deadline is not None:
+            self.__remaining = max(self.__deadline - self.clock(), 0.0)
+            self.__deadline = None
+        self.__expected_tick = None
+
+    def is_running(self):
+        return self.__deadline is not None
+
+    def remaining(self):
+        """Returns the remaining time in seconds."""
+        if self.__deadline is None:
+            return self.__remaining
+        return max(self.__deadline - self.clock(), 0.0)
+
+    def is_expired(self):
+        return self.remaining() <= 0
+
+    def get_steps(self, steps_per_second):
+        """Returns the remaining time rounded up to whole steps, e.g. tenths
+        of a second for a display with one decimal place."""
+        return int(math.ceil(round(self.remaining() * steps_per_second, 6)))
+
+    def schedule_tick(self, steps_per_second):
+        """Returns the time in milliseconds until the displayed value changes
+        next and remembers when the next tick is expected.
+
+        :param steps_per_second: resolution of the display
+        """
+        remaining = self.remaining()
+        steps = self.get_steps(steps_per_second)
+        delay = remaining - (steps - 1) / steps_per_second
+        milliseconds = max(int(math.ceil(delay * 1000)), 1)
+        self.__expected_tick = self.clock() + milliseconds / 1000
+        return milliseconds
+
+    def tick(self):
+        """Records how late a tick arrived compared to schedule_tick()."""
+        if self.__expected_tick is None:
+            return
+        lateness = max(self.clock() - self.__expected_tick, 0.0)
+        self.__expected_tick = None
+        self.ticks += 1
+        self.total_lateness += lateness
+        self.maximum_lateness = max(self.maximum_lateness, lateness)
+
+    def get_jitter(self):
+        """Returns a dictionary with the number of ticks and the mean and
+        maximum lateness in milliseconds."""
+        mean = self.total_lateness / self.ticks if self.ticks else 0.0
+        return {'ticks': self.ticks,
+                'mean': mean * 1000,
+                'maximum': self.maximum_lateness * 1000}
+
+
 @memoized
 def module_exists(module_name):
     try:
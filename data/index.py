@@ -0,0 +1,200 @@
+"""
+pyPardy
+
+Module for a persistent index of all round data files. The index stores title,
+number of topics and questions, modification time, size, hash and validation
+status of every round data file, so that listing all available rounds only
+costs a stat per file. Files are read again only if they have changed.
+
+@author: Christian Wichmann
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from data.model import Round
+from data.bundle import BundleRound, ROUND_BUNDLE_EXTENSION
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# name of the index file inside the directory with the round data files
+INDEX_FILENAME = '.index.json'
+# version of the index file format, older index files are rebuilt
+INDEX_VERSION = 1
+
+
+class RoundIndexEntry(object):
+    """Information about a single round data file."""
+    __slots__ = ('title', 'topic_count', 'question_count', 'mtime', 'size',
+                 'hash', 'valid')
+
+    def __init__(self, title, topic_count, question_count, mtime, size, hash,
+                 valid):
+        self.title = title
+        self.topic_count = topic_count
+        self.question_count = question_count
+        self.mtime = mtime
+        self.size = size
+        self.hash = hash
+        self.valid = valid
+
+    def is_up_to_date(self, stat_result):
+        return self.mtime == stat_result.st_mtime_ns and self.size == stat_result.st_size
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(*(d[slot] for slot in cls.__slots__))
+
+
+class RoundIndex(object):
+    """Index of all round data files in a directory. The index is loaded from
+    disk on first use and written back after it has changed.
+
+    :param directory: directory containing the round data files
+    :param extensions: file extensions of round data files and bundles
+    """
+    def __init__(self, directory, extensions):
+        self.directory = directory
+        self.extensions = tuple('.{}'.format(e) for e in extensions)
+        self.index_filename = os.path.join(directory, INDEX_FILENAME)
+        self.entries = None
+        self.read_files = 0
+        self.lock = threading.RLock()
+
+    def load(self):
+        """Loads the index file. If it does not exist or is damaged, an empty
+        index is used and all files are read again."""
+        self.entries = {}
+        try:
+            with open(self.index_filename, encoding='utf8') as index_file:
+                data = json.load(index_file)
+            if data['version'] != INDEX_VERSION:
+                logger.info('Rebuilding round index with old version.')
+                return
+            for filename, entry in data['entries'].items():
+                self.entries[filename] = RoundIndexEntry.from_dict(entry)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Could not load round index, rebuilding it: {}'.format(e))
+            self.entries = {}
+
+    def save(self):
+        """Writes the index to a temporary file and replaces the old index
+        with it, so that a crash never leaves a damaged index behind."""
+        data = {'version': INDEX_VERSION,
+                'entries': {filename: entry.to_dict()
+                            for filename, entry in self.entries.items()}}
+        temporary_filename = self.index_filename + '.tmp'
+        try:
+            with open(temporary_filename, 'w', encoding='utf8') as index_file:
+                json.dump(data, index_file, indent=1, sort_keys=True)
+            os.replace(temporary_filename, self.index_filename)
+        except OSError as e:
+            logger.warning('Could not save round index: {}'.format(e))
+
+    def update(self):
+        """Brings the index up to date with the files in the directory. Only
+        new and changed files are read.
+
+        :returns: dictionary with the names of all round data files (without
+                  path) as keys and their RoundIndexEntry as values
+        """
+        with self.lock:
+            return self.__update()
+
+    def __update(self):
+        if self.entries is None:
+            self.load()
+        changed = False
+        found_files = set()
+        try:
+            directory_entries = list(os.scandir(self.directory))
+        except OSError as e:
+            logger.error('Could not list round data files: {}'.format(e))
+            directory_entries = []
+        for directory_entry in directory_entries:
+            filename = directory_entry.name
+            if not filename.endswith(self.extensions) or not directory_entry.is_file():
+                continue
+            entry = self.entries.get(filename)
+            try:
+                stat_result = directory_entry.stat()
+                if entry is not None and entry.is_up_to_date(stat_result):
+                    found_files.add(filename)
+                    continue
+                new_entry = self.build_entry(directory_entry.path, stat_result, entry)
+            except OSError as e:
+                # file was removed or made unreadable after the directory
+                # was listed, its entry is dropped below
+                logger.warning('Could not read round data file {}: {}'
+                               .format(directory_entry.path, e))
+                continue
+            found_files.add(filename)
+            self.entries[filename] = new_entry
+            changed = True
+        for filename in set(self.entries) - found_files:
+            del self.entries[filename]
+            changed = True
+        if changed:
+            self.save()
+        return dict(self.entries)
+
+    def build_entry(self, path, stat_result, old_entry=None):
+        """Reads a round data file and creates a new entry for it. If the
+        content has not changed since the old entry was created, only
+        modification time and size are updated."""
+        self.read_files += 1
+        with open(path, 'rb') as round_file:
+            content = round_file.read()
+        content_hash = hashlib.sha1(content).hexdigest()
+        if old_entry is not None and old_entry.hash == content_hash:
+            old_entry.mtime = stat_result.st_mtime_ns
+            old_entry.size = stat_result.st_size
+            return old_entry
+        logger.debug('Indexing round data file: {}'.format(path))
+        try:
+            if path.endswith('.' + ROUND_BUNDLE_EXTENSION):
+                round_data = BundleRound(content)
+            else:
+                round_data = Round.from_dict(json.loads(content.decode('utf8')))
+        except ValueError as e:
+            logger.error('Error in round data file {}: {}'.format(path, e))
+            return RoundIndexEntry(os.path.basename(path), 0, 0,
+                                   stat_result.st_mtime_ns, stat_result.st_size,
+                                   content_hash, False)
+        return self.create_entry(round_data, stat_result, content_hash)
+
+    def create_entry(self, round_data, stat_result, content_hash):
+        """Creates an entry for a valid round."""
+        topic_count = len(round_data.topics)
+        return RoundIndexEntry(round_data.title, topic_count,
+                               topic_count * round_data.questions_per_topic,
+                               stat_result.st_mtime_ns, stat_result.st_size,
+                               content_hash, True)
+
+    def set_entry(self, path, round_data, content):
+        """Updates the entry of a round data file that was just written, so
+        that the file does not have to be read again.
+
+        :param path: path of the round data file inside the directory
+        :param round_data: Round object that was written
+        :param content: bytes that were written to the file
+        """
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            entry = self.create_entry(round_data, os.stat(path),
+                                      hashlib.sha1(content).hexdigest())
+            self.entries[os.path.basename(path)] = entry
+            self.save()
+
+if __name__ == '__main__':
+    pass
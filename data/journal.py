@@ -0,0 +1,203 @@
+"""
+pyPardy
+
+Module for an append-only journal of all score changes. Every event is
+written as one compact JSON record per line, e.g.:
+
+    {"event":"points","time":1439209539.2,"round":"Round 1","topic":2,
+     "question":3,"team":1,"delta":400,"total":700}
+
+Records are handed to a background thread that writes all waiting records at
+once (group commit), so the GUI thread never waits for the disk. After a crash
+the scoreboard can be rebuilt from the journal with rebuild_scores().
+
+@author: Christian Wichmann
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# event when points of all teams are reset to zero
+RESET_EVENT = 'reset'
+# event when a new round was started
+ROUND_EVENT = 'round'
+# event when a new game was started in the game window, loading a round in the
+# editor or resuming a game does not write this event
+GAME_EVENT = 'game'
+# event when the points of a team were changed
+POINTS_EVENT = 'points'
+# fsync after every group commit
+FSYNC_ALWAYS = 'always'
+# fsync at most once in the fsync interval
+FSYNC_INTERVAL = 'interval'
+# never fsync, leave it to the operating system
+FSYNC_NEVER = 'never'
+# all available fsync policies
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+
+class ScoreJournal(object):
+    """Writes records to a journal file in a background thread.
+
+    :param filename: name of the journal file, new records are appended
+    :param fsync_policy: one of FSYNC_ALWAYS, FSYNC_INTERVAL or FSYNC_NEVER
+    :param fsync_interval: minimal time between two fsyncs in seconds for
+                           the policy FSYNC_INTERVAL
+    """
+    def __init__(self, filename, fsync_policy=FSYNC_INTERVAL, fsync_interval=1.0):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError('Invalid fsync policy: {}'.format(fsync_policy))
+        self.filename = filename
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.written_records = 0
+        self.commits = 0
+        self.fsyncs = 0
+        self.__queue = queue.Queue()
+        self.__last_fsync = 0
+        self.__fsync_pending = False
+        self.__file = open(filename, 'a', encoding='utf8')
+        self.__thread = threading.Thread(target=self.__run, name='ScoreJournal')
+        self.__thread.daemon = True
+        self.__thread.start()
+        # write all waiting records when the application exits
+        atexit.register(self.close)
+
+    def write(self, event, **fields):
+        """Adds a record to the journal. Returns at once, the record is
+        written by the background thread.
+
+        :param event: type of the event, e.g. POINTS_EVENT
+        :param fields: additional fields of the record
+        """
+        record = {'event': event, 'time': time.time()}
+        record.update(fields)
+        self.__queue.put(record)
+
+    def close(self):
+        """Writes all waiting records and closes the journal file."""
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+
+    def __run(self):
+        running = True
+        while running:
+            # wait for the first record, then take all records that are
+            # waiting and write them at once
+            timeout = self.fsync_interval if self.__fsync_pending else None
+            try:
+                records = [self.__queue.get(timeout=timeout)]
+            except queue.Empty:
+                self.__fsync()
+                continue
+            while True:
+                try:
+                    records.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in records:
+                running = False
+                records = [r for r in records if r is not None]
+            self.__commit(records)
+        self.__fsync()
+        self.__file.close()
+
+    def __commit(self, records):
+        if not records:
+            return
+        try:
+            self.__file.write(''.join(json.dumps(r, separators=(',', ':'), ensure_ascii=False) + '\n'
+                                      for r in records))
+            self.__file.flush()
+        except OSError as e:
+            logger.error('Could not write score journal: {}'.format(e))
+            return
+        self.written_records += len(records)
+        self.commits += 1
+        if self.fsync_policy == FSYNC_ALWAYS:
+            self.__fsync()
+        elif self.fsync_policy == FSYNC_INTERVAL:
+            self.__fsync_pending = True
+            if time.monotonic() - self.__last_fsync >= self.fsync_interval:
+                self.__fsync()
+
+    def __fsync(self):
+        if self.fsync_policy == FSYNC_NEVER or self.__file.closed:
+            return
+        try:
+            os.fsync(self.__file.fileno())
+        except OSError as e:
+            logger.error('Could not sync score journal: {}'.format(e))
+        self.__last_fsync = time.monotonic()
+        self.__fsync_pending = False
+        self.fsyncs += 1
+
+    def get_statistics(self):
+        """Returns a dictionary with the number of written records, group
+        commits and fsyncs."""
+        return {'records': self.written_records,
+                'commits': self.commits,
+                'fsyncs': self.fsyncs,
+                'waiting': self.__queue.qsize()}
+
+
+class NullJournal(object):
+    """Journal that drops all records. Used by everything that works with a
+    game but is not the game window, e.g. the editor, so that only the game
+    window writes to the score journal."""
+    def write(self, event, **fields):
+        pass
+
+    def close(self):
+        pass
+
+    def get_statistics(self):
+        return {'records': 0, 'commits': 0, 'fsyncs': 0, 'waiting': 0}
+
+
+def read_journal(filename):
+    """Reads a journal file and yields all records as dictionaries. An
+    incomplete last record, e.g. after a crash, is ignored."""
+    with open(filename, encoding='utf8') as journal_file:
+        for line_number, line in enumerate(journal_file, 1):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning('Ignoring damaged record in line {} of score journal.'
+                               .format(line_number))
+
+
+def rebuild_scores(filename):
+    """Rebuilds the scoreboard from a journal file.
+
+    :returns: tuple with the title of the last round and a dictionary with the
+              points of every team since the last reset
+    """
+    round_title = None
+    scores = {}
+    for record in read_journal(filename):
+        event = record.get('event')
+        if event == RESET_EVENT:
+            scores = {team: 0 for team in range(record['teams'])}
+        elif event == ROUND_EVENT:
+            round_title = record['round']
+        elif event == POINTS_EVENT:
+            scores[record['team']] = record['total']
+    return round_title, scores
+
+
+if __name__ == '__main__':
+    import sys
+    title, points = rebuild_scores(sys.argv[1])
+    print('Round: {}'.format(title))
+    for team, team_points in sorted(points.items()):
+        print('Team {}: {}'.format(team, team_points))
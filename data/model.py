@@ -0,0 +1,211 @@
+"""
+pyPardy
+
+Module containing the model for round data. A round is built once when its
+data file is loaded and is immutable afterwards. All round data is validated
+while the model is built, so there is no separate pass for verifying it.
+
+Changed rounds are created by the replace methods, e.g. when editing a
+question.
+
+@author: Christian Wichmann
+"""
+
+import sys
+import logging
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# maximum number of topics per round
+MAXIMUM_TOPIC_COUNT = 6
+# maximum number of questions per topic
+MAXIMUM_QUESTION_COUNT = 7
+
+
+class RoundDataError(ValueError):
+    """Raised if round data is not valid."""
+    pass
+
+
+def intern_string(value, name):
+    """Checks that value is a string and returns its interned version, so that
+    texts that are used several times are only stored once."""
+    if not isinstance(value, str):
+        raise RoundDataError('Value "{}" is not a string.'.format(name))
+    return sys.intern(value)
+
+
+def get_extra_items(data, known_keys):
+    """Returns all items of a dictionary whose keys are not in known_keys as
+    tuple, so that they are kept when the data is saved again."""
+    return tuple(sorted((key, value) for key, value in data.items()
+                        if key not in known_keys))
+
+
+class ImmutableObject(object):
+    """Base class for objects whose attributes can not be changed after
+    construction."""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable.'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} is immutable.'.format(type(self).__name__))
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, slot) == getattr(other, slot)
+                    for slot in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, slot) for slot in self.__slots__))
+
+
+class Question(ImmutableObject):
+    """A single question with its answer and an optional comment."""
+    __slots__ = ('question', 'answer', 'comment', 'extra')
+
+    def __init__(self, question, answer, comment=None, extra=()):
+        object.__setattr__(self, 'question', intern_string(question, 'question'))
+        object.__setattr__(self, 'answer', intern_string(answer, 'answer'))
+        if comment is not None:
+            comment = intern_string(comment, 'comment')
+        object.__setattr__(self, 'comment', comment)
+        object.__setattr__(self, 'extra', extra)
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            return cls(data['question'], data['answer'], data.get('comment'),
+                       get_extra_items(data, ('question', 'answer', 'comment')))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RoundDataError('Invalid question: {}'.format(e))
+
+    def to_dict(self):
+        data = dict(self.extra)
+        data['question'] = self.question
+        data['answer'] = self.answer
+        if self.comment is not None:
+            data['comment'] = self.comment
+        return data
+
+    def __repr__(self):
+        return 'Question({!r}, {!r})'.format(self.question, self.answer)
+
+
+class Topic(ImmutableObject):
+    """A topic with its title and a tuple of all questions."""
+    __slots__ = ('title', 'questions', 'extra')
+
+    def __init__(self, title, questions, extra=()):
+        object.__setattr__(self, 'title', intern_string(title, 'title'))
+        questions = tuple(questions)
+        if len(questions) > MAXIMUM_QUESTION_COUNT:
+            raise RoundDataError('Too much questions in topic "{}".'.format(title))
+        object.__setattr__(self, 'questions', questions)
+        object.__setattr__(self, 'extra', extra)
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            questions = [Question.from_dict(q) for q in data['questions']]
+            return cls(data['title'], questions,
+                       get_extra_items(data, ('title', 'questions')))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RoundDataError('Invalid topic: {}'.format(e))
+
+    def to_dict(self):
+        data = dict(self.extra)
+        data['title'] = self.title
+        data['questions'] = [q.to_dict() for q in self.questions]
+        return data
+
+    def __repr__(self):
+        return 'Topic({!r}, {} questions)'.format(self.title, len(self.questions))
+
+
+class Round(ImmutableObject):
+    """A round with its title, a tuple of all topics and optionally the
+    points for the easiest question.
+
+    All topics must have the same number of questions.
+    """
+    __slots__ = ('title', 'topics', 'question_points', 'extra')
+
+    def __init__(self, title, topics, question_points=None, extra=()):
+        object.__setattr__(self, 'title', intern_string(title, 'title'))
+        topics = tuple(topics)
+        if not topics:
+            raise RoundDataError('No topics in round data.')
+        if len(topics) > MAXIMUM_TOPIC_COUNT:
+            raise RoundDataError('To much topics in round data.')
+        questions_per_topic = len(topics[0].questions)
+        for topic in topics:
+            if len(topic.questions) != questions_per_topic:
+                raise RoundDataError('Not all topics have the same number of questions.')
+        object.__setattr__(self, 'topics', topics)
+        if question_points is not None:
+            try:
+                question_points = int(question_points)
+            except (TypeError, ValueError):
+                raise RoundDataError('Invalid value for "question points".')
+        object.__setattr__(self, 'question_points', question_points)
+        object.__setattr__(self, 'extra', extra)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a round from data as loaded from a round data file.
+
+        :raises RoundDataError: if the data is not valid round data
+        """
+        try:
+            topics = [Topic.from_dict(t) for t in data['topics']]
+            return cls(data['title'], topics, data.get('question points'),
+                       get_extra_items(data, ('title', 'topics', 'question points')))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RoundDataError('Invalid round data: {}'.format(e))
+
+    def to_dict(self):
+        """Returns the round as data that can be stored in a round data
+        file."""
+        data = dict(self.extra)
+        data['title'] = self.title
+        data['topics'] = [t.to_dict() for t in self.topics]
+        if self.question_points is not None:
+            data['question points'] = self.question_points
+        return data
+
+    @property
+    def questions_per_topic(self):
+        return len(self.topics[0].questions)
+
+    def get_question(self, topic, question):
+        """Returns the question with the given number from the given topic."""
+        return self.topics[topic].questions[question]
+
+    def replace_question(self, topic, question, new_question):
+        """Returns a new round in which a single question was replaced. All
+        other topics and questions are shared with this round.
+
+        :param topic: number of the topic containing the question
+        :param question: number of the question inside the topic
+        :param new_question: Question object to insert
+        """
+        old_topic = self.topics[topic]
+        questions = list(old_topic.questions)
+        questions[question] = new_question
+        topics = list(self.topics)
+        topics[topic] = Topic(old_topic.title, questions, old_topic.extra)
+        return Round(self.title, topics, self.question_points, self.extra)
+
+    def __repr__(self):
+        return 'Round({!r}, {} topics)'.format(self.title, len(self.topics))
+
+
+if __name__ == '__main__':
+    pass
@@ -11,12 +11,16 @@ TODO:
 @author: Christian Wichmann
 """
 
-import glob
 import os
 import json
 import logging
 
-from data.helper import memoized
+from data.helper import FileCache
+from data.index import RoundIndex
+from data.model import Round, RoundDataError
+from data.bundle import open_bundle, BundleRound, ROUND_BUNDLE_EXTENSION
+from data.model import MAXIMUM_TOPIC_COUNT, MAXIMUM_QUESTION_COUNT
+from data.validator import check_content, check_round_data, ERROR
 
 logger = logging.getLogger('pyPardy.data')
 
@@ -28,103 +32,170 @@ ROUND_DATA_PATH = 'rounds/'
 # black list containing round data files that should not be used
 ROUND_DATA_BLACK_LIST = ('Rundenvorlage.round', 'Sommerfest 6.round')
 
-# maximum number of topics per round
-MAXIMUM_TOPIC_COUNT = 6
-# maximum number of questions per topic
-MAXIMUM_QUESTION_COUNT = 7
+# maximum number of round data files held in the cache
+ROUND_DATA_CACHE_ENTRIES = 32
+# maximum summed size of all round data files held in the cache in bytes
+ROUND_DATA_CACHE_SIZE = 4 * 1024 * 1024
 
+# index of all round data files, created on first use
+round_index = None
 
-def get_available_round_data():
-    """Checks for all round data files in current directory and returns list
-    of all available data file names.
 
-    Only files with '.round' extension are recognized!
+def get_available_round_data(include_bundles=True):
+    """Returns list of all available round data files in ROUND_DATA_PATH.
 
+    Only files with '.round' extension and bundles with '.rbundle' extension
+    are recognized! If a round exists in both formats, the bundle is used
+    unless the round data file was changed after the bundle was compiled. The
+    title and the validation status of all files are taken from the round
+    index, so only new or changed files are read.
+
+    :param include_bundles: whether bundles should be listed, e.g. the editor
+                            only works with round data files
     :returns: all available rounds including their name and the filename with
               the round data
     """
-    search_directory = '.'
+    entries = get_round_index().update()
+    bundle_suffix = '.' + ROUND_BUNDLE_EXTENSION
     round_data = []
-    os.chdir(search_directory)
-    extension = '*.{}'.format(ROUND_DATA_EXTENSION)
-    for filename in glob.glob(os.path.join(ROUND_DATA_PATH, extension)):
-        data_ok = check_round_file(filename)
-        title = load_round_data_file(filename)['title']
-        filename_without_path = os.path.basename(filename)
-        if data_ok and filename_without_path not in ROUND_DATA_BLACK_LIST:
-            round_data.append((title, filename))
+    for filename, entry in entries.items():
+        name, extension = os.path.splitext(filename)
+        if extension == bundle_suffix:
+            if not include_bundles:
+                continue
+            json_entry = entries.get('{}.{}'.format(name, ROUND_DATA_EXTENSION))
+            if json_entry and json_entry.valid and json_entry.mtime > entry.mtime:
+                continue
+        elif include_bundles:
+            bundle_entry = entries.get(name + bundle_suffix)
+            if bundle_entry and bundle_entry.valid and bundle_entry.mtime >= entry.mtime:
+                continue
+        black_listed = '{}.{}'.format(name, ROUND_DATA_EXTENSION) in ROUND_DATA_BLACK_LIST
+        if entry.valid and not black_listed:
+            round_data.append((entry.title,
+                               os.path.join(ROUND_DATA_PATH, filename)))
     round_data.sort()
     return round_data
 
 
+def get_round_index():
+    """Returns the index of all round data files in ROUND_DATA_PATH."""
+    global round_index
+    if round_index is None:
+        round_index = RoundIndex(ROUND_DATA_PATH, (ROUND_DATA_EXTENSION,
+                                                   ROUND_BUNDLE_EXTENSION))
+    return round_index
+
+
 def check_round_file(filename):
-    """Checks whether a given file contains valid JSON data."""
-    return True
+    """Checks whether a given file contains valid round data. All problems
+    are logged.
+
+    :returns: True, if the file contains no errors
+    """
+    try:
+        with open(filename, 'rb') as round_file:
+            problems, _ = check_content(round_file.read())
+    except OSError as e:
+        logger.error('Could not read round data file {}: {}'.format(filename, e))
+        return False
+    log_problems(filename, problems)
+    return not any(p.severity == ERROR for p in problems)
+
+
+def log_problems(name, problems):
+    for problem in problems:
+        if problem.severity == ERROR:
+            logger.error('{}: {}'.format(name, problem.message))
+        else:
+            logger.warning('{}: {}'.format(name, problem.message))
 
 
-@memoized
 def load_round_data_file(filename):
-    """Loads a given round data file and returns data from it.
+    """Loads a given round data file and returns data from it. The data is
+    cached until the file changes on disk.
 
     :param filename: filename to load round data from
-    :returns: data from round data file
+    :returns: Round object with the data from round data file
+    :raises RoundDataError: if the file does not contain valid round data
     """
-    json_data_file = open(filename, encoding='utf8')
-    data = json.load(json_data_file)
-    if not verify_round_data(data):
-        logger.error('Error in round data file: {}.'.format(filename))
-    json_data_file.close()
-    return data
+    return round_data_cache.get(filename)
+
+
+def read_round_data_file(filename):
+    """Reads a given round data file without using the cache.
+
+    Bundles are memory-mapped and their questions are decoded only when they
+    are accessed.
+
+    :param filename: filename to load round data from
+    :returns: Round object with the data from round data file or BundleRound
+              object for bundles
+    :raises RoundDataError: if the file does not contain valid round data
+    """
+    if filename.endswith('.' + ROUND_BUNDLE_EXTENSION):
+        try:
+            return open_bundle(filename)
+        except RoundDataError as e:
+            logger.error('Error in round bundle {}: {}'.format(filename, e))
+            raise
+    with open(filename, encoding='utf8') as json_data_file:
+        try:
+            return Round.from_dict(json.load(json_data_file))
+        except ValueError as e:
+            logger.error('Error in round data file {}: {}'.format(filename, e))
+            raise RoundDataError(str(e))
+
+
+# cache for loaded round data files
+round_data_cache = FileCache(read_round_data_file, ROUND_DATA_CACHE_ENTRIES,
+                             ROUND_DATA_CACHE_SIZE, copy=None)
 
 
 def save_round_data_file(filename, data):
-    """Saves current round data into a file.
+    """Saves current round data into a file. The data is written to a
+    temporary file first which then replaces the old file, so that a crash
+    never leaves a damaged round data file behind. Cache and round index are
+    updated with the saved round, so the file is not read again.
 
-    :param data: round data to save to file
+    :param data: Round object to save to file
     :param filename: filename to save round data to
     """
-    json_data_file = open(filename, 'w', encoding='utf8')
-    json.dump(data, json_data_file, indent=4, sort_keys=True)
-    json_data_file.close()
+    content = json.dumps(data.to_dict(), indent=4, sort_keys=True).encode('utf8')
+    temporary_filename = filename + '.tmp'
+    with open(temporary_filename, 'wb') as json_data_file:
+        json_data_file.write(content)
+        json_data_file.flush()
+        os.fsync(json_data_file.fileno())
+    os.replace(temporary_filename, filename)
+    round_data_cache.put(filename, data)
+    directory = os.path.dirname(os.path.abspath(filename))
+    if directory == os.path.abspath(ROUND_DATA_PATH):
+        get_round_index().set_entry(filename, data, content)
 
 
 def verify_round_data(data):
-    """Verifys the loaded round data from file.
+    """Verifys the loaded round data from file. All problems are logged.
 
+    :param data: Round or BundleRound object or round data as dictionary
     :returns: True, if data is valid round data
     """
-    try:
-        # check if title exists and if number of topics is valid
-        data['title']
-        if len(data['topics']) > MAXIMUM_TOPIC_COUNT:
-            raise ValueError('To much topics in round data file.')
-        questions_per_topic = len(data['topics'][0]['questions'])
-        for topic in data['topics']:
-            # check if topic title exists and if number of questions in topic
-            # is valid
-            topic['title']
-            if len(topic['questions']) > MAXIMUM_QUESTION_COUNT:
-                raise ValueError('Too much questions in round "{}" in round data file.'.format(topic['title']))
-            # check if all topics have same number of questions
-            if questions_per_topic != len(topic['questions']):
-                raise ValueError('Not all topics have the same number of questions.')
-            # check if all questions have answers :-)
-            for question in topic['questions']:
-                question['question']
-                question['answer']
-    except Exception as e:
-        logger.error(e)
-        return False
-    return True
+    if isinstance(data, (Round, BundleRound)):
+        # the constructors already reject everything that is an error for
+        # check_round_data(), so the data is not walked again
+        return True
+    problems = check_round_data(data)
+    log_problems('Round data', problems)
+    return not any(p.severity == ERROR for p in problems)
 
 
 def pprint_round_data(data):
-    print('=== {} ==='.format(data['title']))
-    for topic in data['topics']:
-        print('-- {} --'.format(topic['title']))
-        for question in topic['questions']:
-            print('Question: {}'.format(question['question']))
-            print('Answer: {}'.format(question['answer']))
+    print('=== {} ==='.format(data.title))
+    for topic in data.topics:
+        print('-- {} --'.format(topic.title))
+        for question in topic.questions:
+            print('Question: {}'.format(question.question))
+            print('Answer: {}'.format(question.answer))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+"""
+pyPardy
+
+Module for saving edited rounds in the background. Edits are collected until
+no further edit happened for a short time and only the latest version of the
+round is written. An undo journal keeps the previous versions of the round.
+
+@author: Christian Wichmann
+"""
+
+import time
+import atexit
+import logging
+import threading
+
+from data import round
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# time in seconds without edits before a round is saved
+SAVE_DELAY = 1.0
+# number of edits that can be undone
+UNDO_JOURNAL_SIZE = 25
+
+
+class RoundSaver(object):
+    """Saves a round data file in a background thread. Every call of
+    schedule() replaces the round that is waiting to be saved and restarts
+    the delay, so a series of edits is written only once.
+
+    :param filename: name of the round data file
+    :param delay: time in seconds without edits before the round is saved
+    """
+    def __init__(self, filename, delay=SAVE_DELAY):
+        self.filename = filename
+        self.delay = delay
+        self.saved_rounds = 0
+        self.__pending = None
+        self.__deadline = 0
+        self.__running = True
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name='RoundSaver')
+        self.__thread.daemon = True
+        self.__thread.start()
+        # save the waiting round when the application exits
+        atexit.register(self.close)
+
+    def schedule(self, round_data):
+        """Requests saving the given round. Returns at once.
+
+        :param round_data: Round object to save
+        """
+        with self.__condition:
+            self.__pending = round_data
+            self.__deadline = time.monotonic() + self.delay
+            self.__condition.notify()
+
+    def is_pending(self):
+        """Returns whether a round is waiting to be saved."""
+        with self.__condition:
+            return self.__pending is not None
+
+    def flush(self):
+        """Saves the waiting round at once and waits until it is written."""
+        with self.__condition:
+            self.__deadline = 0
+            self.__condition.notify()
+            while self.__pending is not None and self.__thread.is_alive():
+                self.__condition.wait()
+
+    def close(self):
+        """Saves the waiting round and stops the background thread."""
+        with self.__condition:
+            self.__running = False
+            self.__deadline = 0
+            self.__condition.notify()
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while True:
+                    if self.__pending is None:
+                        if not self.__running:
+                            return
+                        self.__condition.wait()
+                        continue
+                    remaining = self.__deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+                round_data = self.__pending
+            try:
+                round.save_round_data_file(self.filename, round_data)
+                self.saved_rounds += 1
+                logger.info('Round data saved to file "{}".'.format(self.filename))
+            except OSError as e:
+                logger.error('Could not save round data file: {}'.format(e))
+            with self.__condition:
+                # a new edit may have been scheduled while saving
+                if self.__pending is round_data:
+                    self.__pending = None
+                self.__condition.notify_all()
+
+
+class UndoJournal(object):
+    """Keeps the last versions of a round, so that edits can be undone.
+    Because rounds are immutable and share unchanged topics, every version
+    only costs the changed topic.
+
+    :param size: maximum number of versions that are kept
+    """
+    def __init__(self, size=UNDO_JOURNAL_SIZE):
+        self.size = size
+        self.__versions = []
+
+    def record(self, round_data):
+        """Remembers the version of a round before it is changed."""
+        self.__versions.append(round_data)
+        if len(self.__versions) > self.size:
+            del self.__versions[0]
+
+    def undo(self):
+        """Returns the version before the last change or None, if there is
+        nothing to undo."""
+        if self.__versions:
+            return self.__versions.pop()
+        return None
+
+    def __len__(self):
+        return len(self.__versions)
+
+
+if __name__ == '__main__':
+    pass
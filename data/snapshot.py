@@ -0,0 +1,142 @@
+"""
+pyPardy
+
+Module for crash-safe snapshots of the game state. A snapshot contains the
+round file, all played questions and the points of all teams, so that a game
+can be resumed after a crash or a reboot.
+
+Snapshots are written by a background thread to a temporary file which then
+replaces the old snapshot, so there is always a complete snapshot on disk. A
+snapshot is only written if the game state has changed since the last one.
+
+@author: Christian Wichmann
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# file name for the snapshot of the current game
+SNAPSHOT_FILE = './game.snapshot'
+# version of the snapshot format
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(filename, state):
+    """Writes the game state atomically to the given file.
+
+    :param filename: name of the snapshot file
+    :param state: dictionary with the game state from Game.get_state()
+    """
+    data = dict(state)
+    data['version'] = SNAPSHOT_VERSION
+    temporary_filename = filename + '.tmp'
+    with open(temporary_filename, 'w', encoding='utf8') as snapshot_file:
+        json.dump(data, snapshot_file, separators=(',', ':'))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary_filename, filename)
+
+
+def load_snapshot(filename=SNAPSHOT_FILE):
+    """Loads the game state from the given file.
+
+    :returns: dictionary with the game state or None, if no valid snapshot
+              exists
+    """
+    try:
+        with open(filename, encoding='utf8') as snapshot_file:
+            data = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning('Could not load snapshot: {}'.format(e))
+        return None
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        logger.warning('Ignoring snapshot with unknown version.')
+        return None
+    return data
+
+
+class SnapshotWriter(object):
+    """Writes snapshots of a game in a background thread. If several
+    snapshots are requested before the thread gets to write them, only the
+    latest one is written.
+
+    :param filename: name of the snapshot file
+    """
+    def __init__(self, filename=SNAPSHOT_FILE):
+        self.filename = filename
+        self.written_snapshots = 0
+        self.__last_version = None
+        self.__pending = None
+        self.__running = True
+        self.__condition = threading.Condition()
+        # held while the snapshot file is written
+        self.__write_lock = threading.Lock()
+        self.__thread = threading.Thread(target=self.__run, name='SnapshotWriter')
+        self.__thread.daemon = True
+        self.__thread.start()
+        # write the latest snapshot when the application exits
+        atexit.register(self.close)
+
+    def save(self, game):
+        """Requests a snapshot of the given game, if its state has changed
+        since the last snapshot. Returns at once.
+
+        :returns: True, if a snapshot was requested
+        """
+        if game.state_version == self.__last_version:
+            return False
+        self.__last_version = game.state_version
+        with self.__condition:
+            self.__pending = game.get_state()
+            self.__condition.notify()
+        return True
+
+    def clear(self):
+        """Removes the snapshot at once, e.g. after the game has ended."""
+        self.__last_version = None
+        with self.__condition:
+            self.__pending = None
+        with self.__write_lock:
+            try:
+                if os.path.exists(self.filename):
+                    os.remove(self.filename)
+            except OSError as e:
+                logger.error('Could not remove snapshot: {}'.format(e))
+
+    def close(self):
+        """Writes the waiting snapshot and stops the background thread."""
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while self.__pending is None and self.__running:
+                    self.__condition.wait()
+                pending, self.__pending = self.__pending, None
+                if pending is None:
+                    return
+                # take the write lock before releasing the condition, so that
+                # clear() can not remove the file before it is written
+                self.__write_lock.acquire()
+            try:
+                write_snapshot(self.filename, pending)
+                self.written_snapshots += 1
+            except OSError as e:
+                logger.error('Could not write snapshot: {}'.format(e))
+            finally:
+                self.__write_lock.release()
+
+
+if __name__ == '__main__':
+    pass
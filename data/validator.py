@@ -0,0 +1,368 @@
+"""
+pyPardy
+
+Module for validating round data files. In contrast to building a Round
+object, which stops at the first error, all problems of a file are reported.
+Errors make a round unusable, warnings point to questionable content like
+empty answers or questions that are used in more than one round.
+
+A whole directory is checked in parallel with one process per CPU core. The
+results are cached by file hash, so only changed files are checked again:
+
+    python3 -m data.validator rounds/
+
+@author: Christian Wichmann
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import functools
+import collections
+import concurrent.futures
+
+from data.model import MAXIMUM_TOPIC_COUNT, MAXIMUM_QUESTION_COUNT
+
+logger = logging.getLogger('pyPardy.data')
+
+
+# problem that makes a round unusable
+ERROR = 'error'
+# problem that should be looked at but does not prevent playing the round
+WARNING = 'warning'
+# name of the cache file inside the checked directory
+VALIDATOR_CACHE_FILENAME = '.validator.json'
+# version of the cache format, older caches are ignored
+VALIDATOR_CACHE_VERSION = 1
+# file extension of round data files
+ROUND_DATA_EXTENSION = '.round'
+# maximum number of other files listed for a duplicate question
+MAXIMUM_LISTED_FILES = 3
+
+
+Problem = collections.namedtuple('Problem', ['severity', 'message'])
+
+
+def normalize_question(text):
+    """Returns the text of a question in a form that is used to find
+    duplicates, ignoring case, line breaks and white space."""
+    return ' '.join(text.replace('<br>', ' ').lower().split())
+
+
+def check_round_data(data):
+    """Checks round data as loaded from a round data file.
+
+    :returns: list of all problems found in the data
+    """
+    problems = []
+
+    def error(message, *args):
+        problems.append(Problem(ERROR, message.format(*args)))
+
+    def warning(message, *args):
+        problems.append(Problem(WARNING, message.format(*args)))
+
+    if not isinstance(data, dict):
+        error('Round data is not a JSON object.')
+        return problems
+    if not isinstance(data.get('title'), str):
+        error('Round has no title.')
+    if 'question points' in data:
+        try:
+            int(data['question points'])
+        except (TypeError, ValueError):
+            error('Invalid value for "question points".')
+    topics = data.get('topics')
+    if not isinstance(topics, list):
+        error('Round has no list of topics.')
+        return problems
+    if not topics:
+        error('Round has no topics.')
+    if len(topics) > MAXIMUM_TOPIC_COUNT:
+        error('Round has {} topics, only {} are allowed.', len(topics), MAXIMUM_TOPIC_COUNT)
+    question_counts = collections.Counter()
+    seen_questions = {}
+    for topic_number, topic in enumerate(topics, 1):
+        if not isinstance(topic, dict):
+            error('Topic {} is not a JSON object.', topic_number)
+            continue
+        if not isinstance(topic.get('title'), str):
+            error('Topic {} has no title.', topic_number)
+        questions = topic.get('questions')
+        if not isinstance(questions, list):
+            error('Topic {} has no list of questions.', topic_number)
+            continue
+        question_counts[len(questions)] += 1
+        if len(questions) > MAXIMUM_QUESTION_COUNT:
+            error('Topic {} has {} questions, only {} are allowed.',
+                  topic_number, len(questions), MAXIMUM_QUESTION_COUNT)
+        for question_number, question in enumerate(questions, 1):
+            position = 'Question {} of topic {}'.format(question_number, topic_number)
+            if not isinstance(question, dict):
+                error('{} is not a JSON object.', position)
+                continue
+            for field in ('question', 'answer'):
+                if field not in question:
+                    error('{} has no field "{}".', position, field)
+                elif not isinstance(question[field], str):
+                    error('{} has a field "{}" that is not a string.', position, field)
+                elif not question[field].strip():
+                    warning('{} has an empty field "{}".', position, field)
+            if 'comment' in question and not isinstance(question['comment'], str):
+                error('{} has a comment that is not a string.', position)
+            text = question.get('question')
+            if isinstance(text, str) and text.strip():
+                key = normalize_question(text)
+                if key in seen_questions:
+                    warning('{} is the same as {}.', position, seen_questions[key])
+                else:
+                    seen_questions[key] = position.lower()
+    if len(question_counts) > 1:
+        error('Not all topics have the same number of questions ({}).',
+              ', '.join(str(count) for count in sorted(question_counts)))
+    return problems
+
+
+def get_question_keys(data):
+    """Returns the normalized texts of all questions in round data."""
+    keys = set()
+    try:
+        for topic in data['topics']:
+            for question in topic['questions']:
+                if isinstance(question.get('question'), str) and question['question'].strip():
+                    keys.add(normalize_question(question['question']))
+    except (KeyError, TypeError, AttributeError):
+        pass
+    return sorted(keys)
+
+
+def check_content(content):
+    """Checks the content of a round data file.
+
+    :param content: bytes read from the file
+    :returns: tuple of the list of problems and the normalized texts of all
+              questions
+    """
+    try:
+        data = json.loads(content.decode('utf8'))
+    except ValueError as e:
+        return [Problem(ERROR, 'File contains no valid JSON: {}'.format(e))], []
+    return check_round_data(data), get_question_keys(data)
+
+
+def check_file(path, known_hashes=()):
+    """Checks a single round data file. Is run in the worker processes.
+
+    :param known_hashes: hashes of contents whose results are already known,
+                         files with such a content are not checked again
+    :returns: tuple of path, hash of the file, list of problems and the
+              normalized texts of all questions, problems and texts are None
+              if the hash is in known_hashes
+    """
+    try:
+        with open(path, 'rb') as round_file:
+            content = round_file.read()
+    except OSError as e:
+        return path, None, [Problem(ERROR, 'File can not be read: {}'.format(e))], []
+    content_hash = hashlib.sha1(content).hexdigest()
+    if content_hash in known_hashes:
+        return path, content_hash, None, None
+    problems, keys = check_content(content)
+    return path, content_hash, problems, keys
+
+
+class ValidationResult(object):
+    """Result for a single file."""
+    __slots__ = ('path', 'hash', 'problems', 'question_keys', 'cached')
+
+    def __init__(self, path, hash, problems, question_keys, cached=False):
+        self.path = path
+        self.hash = hash
+        self.problems = problems
+        self.question_keys = question_keys
+        self.cached = cached
+
+    def has_errors(self):
+        return any(p.severity == ERROR for p in self.problems)
+
+
+class RoundValidator(object):
+    """Validates all round data files in a directory.
+
+    :param directory: directory with round data files
+    :param jobs: number of worker processes, None for one per CPU core
+    :param use_cache: whether results from the last run should be used for
+                      unchanged files
+    """
+    def __init__(self, directory, jobs=None, use_cache=True):
+        self.directory = directory
+        self.jobs = jobs or os.cpu_count() or 1
+        self.use_cache = use_cache
+        self.cache_filename = os.path.join(directory, VALIDATOR_CACHE_FILENAME)
+        self.checked_files = 0
+        self.cached_files = 0
+
+    def load_cache(self):
+        """Returns the cache as dictionary mapping filenames to a dictionary
+        with modification time, size, hash, problems and question keys."""
+        if not self.use_cache:
+            return {}
+        try:
+            with open(self.cache_filename, encoding='utf8') as cache_file:
+                data = json.load(cache_file)
+            if data['version'] == VALIDATOR_CACHE_VERSION:
+                return data['files']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Could not load validator cache: {}'.format(e))
+        return {}
+
+    def save_cache(self, results, stat_results):
+        if not self.use_cache:
+            return
+        files = {}
+        for result in results:
+            if result.hash is None:
+                continue
+            stat_result = stat_results[result.path]
+            files[os.path.basename(result.path)] = {
+                'mtime': stat_result.st_mtime_ns,
+                'size': stat_result.st_size,
+                'hash': result.hash,
+                'problems': [list(p) for p in result.problems],
+                'questions': result.question_keys}
+        temporary_filename = self.cache_filename + '.tmp'
+        try:
+            with open(temporary_filename, 'w', encoding='utf8') as cache_file:
+                json.dump({'version': VALIDATOR_CACHE_VERSION, 'files': files},
+                          cache_file, separators=(',', ':'))
+            os.replace(temporary_filename, self.cache_filename)
+        except OSError as e:
+            logger.warning('Could not save validator cache: {}'.format(e))
+
+    def get_round_files(self):
+        return sorted(entry.path for entry in os.scandir(self.directory)
+                      if entry.name.endswith(ROUND_DATA_EXTENSION) and entry.is_file())
+
+    def validate(self):
+        """Checks all round data files of the directory.
+
+        :returns: list of ValidationResult sorted by path
+        """
+        cache = self.load_cache()
+        cache_by_hash = {entry['hash']: entry for entry in cache.values()}
+        results = []
+        stat_results = {}
+        files_to_check = []
+        for path in self.get_round_files():
+            try:
+                stat_result = os.stat(path)
+            except OSError as e:
+                # file was removed after the directory was read
+                results.append(ValidationResult(path, None, [Problem(
+                    ERROR, 'File can not be read: {}'.format(e))], []))
+                continue
+            stat_results[path] = stat_result
+            entry = cache.get(os.path.basename(path))
+            if (entry and entry['mtime'] == stat_result.st_mtime_ns and
+                    entry['size'] == stat_result.st_size):
+                results.append(self.result_from_cache(path, entry))
+            else:
+                files_to_check.append(path)
+        results.extend(self.check_files(files_to_check, cache_by_hash))
+        self.save_cache(results, stat_results)
+        self.add_duplicate_warnings(results)
+        results.sort(key=lambda r: r.path)
+        return results
+
+    def result_from_cache(self, path, entry):
+        self.cached_files += 1
+        return ValidationResult(path, entry['hash'],
+                                [Problem(*p) for p in entry['problems']],
+                                entry['questions'], cached=True)
+
+    def check_files(self, paths, cache_by_hash=None):
+        """Checks the given files in worker processes. The workers hash the
+        files, so files whose content was already checked under another name
+        or before it was touched are taken from the cache instead.
+
+        :param cache_by_hash: dictionary mapping hashes to cache entries
+        """
+        cache_by_hash = cache_by_hash or {}
+        check = functools.partial(check_file, known_hashes=frozenset(cache_by_hash))
+        if len(paths) < 2 or self.jobs == 1:
+            file_results = [check(path) for path in paths]
+        else:
+            chunksize = max(1, len(paths) // (self.jobs * 4))
+            with concurrent.futures.ProcessPoolExecutor(self.jobs) as executor:
+                file_results = list(executor.map(check, paths, chunksize=chunksize))
+        results = []
+        for path, content_hash, problems, keys in file_results:
+            if problems is None:
+                results.append(self.result_from_cache(path, cache_by_hash[content_hash]))
+            else:
+                self.checked_files += 1
+                results.append(ValidationResult(path, content_hash, problems, keys))
+        return results
+
+    def add_duplicate_warnings(self, results):
+        """Adds a warning to every file containing a question that is also
+        used in another file."""
+        files_by_question = collections.defaultdict(list)
+        for result in results:
+            for key in result.question_keys:
+                files_by_question[key].append(result)
+        for key, files in files_by_question.items():
+            if len(files) < 2:
+                continue
+            names = [os.path.basename(r.path) for r in files[:MAXIMUM_LISTED_FILES + 1]]
+            for index, result in enumerate(files):
+                # only the first files are listed, so the work per file does
+                # not grow with the number of duplicates
+                others = [name for i, name in enumerate(names) if i != index]
+                text = ', '.join(others[:MAXIMUM_LISTED_FILES])
+                if len(files) - 1 > MAXIMUM_LISTED_FILES:
+                    text += ' and {} other files'.format(len(files) - 1 - MAXIMUM_LISTED_FILES)
+                result.problems.append(Problem(WARNING, 'Question "{}" is also used in {}.'
+                                                        .format(key, text)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Checks all round data files in a directory.')
+    parser.add_argument('directory', nargs='?', default='rounds',
+                        help='directory with round data files')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of worker processes, default is one per CPU core')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='check all files, even if they did not change')
+    parser.add_argument('--errors-only', action='store_true',
+                        help='do not report warnings')
+    args = parser.parse_args(argv)
+    validator = RoundValidator(args.directory, args.jobs, not args.no_cache)
+    results = validator.validate()
+    error_count = 0
+    warning_count = 0
+    for result in results:
+        problems = [p for p in result.problems
+                    if not args.errors_only or p.severity == ERROR]
+        if not problems:
+            continue
+        print(result.path)
+        for problem in problems:
+            print('    {}: {}'.format(problem.severity, problem.message))
+            if problem.severity == ERROR:
+                error_count += 1
+            else:
+                warning_count += 1
+    print('{} files ({} checked, {} from cache): {} errors, {} warnings'
+          .format(len(results), validator.checked_files, validator.cached_files,
+                  error_count, warning_count))
+    return 1 if error_count else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
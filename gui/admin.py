@@ -7,6 +7,7 @@ Administrative widgets of pyPardy.
 @author: Christian Wichmann
 """
 
+import os
 import logging
 from functools import partial
 from PyQt4 import QtGui
@@ -16,7 +17,9 @@ from PyQt4 import QtDeclarative
 
 from data import round
 from data import config
+from data import snapshot
 from gui import helper
+from gui import theme
 
 
 logger = logging.getLogger('pyPardy.gui')
@@ -30,23 +33,19 @@ class BuzzerConfigPanel(QtGui.QWidget):
         self.game_data = game_data
         self.team_label_list = []
         self.currently_highlighted_team = 0
-        self.STYLE_HIGHLIGHTED = 'border: none; background: none; color: red'
-        self.STYLE_NONHIGHLIGHTED = 'border: none; background: none; color: black'
+        self.STYLE_HIGHLIGHTED = theme.get_theme().get_style('buzzer team highlighted')
+        self.STYLE_NONHIGHLIGHTED = theme.get_theme().get_style('buzzer team normal')
 
+        self.buzzer_connector = None
         self.setFixedSize(width, height)
         self.create_fonts()
         self.setup_ui()
         if config.HIGH_CONTRAST:
             helper.whitefy(self)
-        self.set_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.label_font = QtGui.QFont(config.BASE_FONT)
-            self.label_font.setPointSize(22)
-        else:
-            self.label_font = QtGui.QFont(config.BASE_FONT)
-            self.label_font.setPointSize(30)
+        current_theme = theme.get_theme()
+        self.label_font = current_theme.get_font('label')
 
     def setup_ui(self):
         #self.setSizePolicy(QtGui.QSizePolicy.Expanding,
@@ -82,13 +81,30 @@ class BuzzerConfigPanel(QtGui.QWidget):
         new_team_name = self.team_label_list[team_id].text()
         config.TEAM_NAMES[team_id] = new_team_name
 
+    def activate(self):
+        """Starts the assignment with the first team, every time the panel is
+        shown."""
+        self.currently_highlighted_team = 0
+        for team_id, team_label in enumerate(self.team_label_list):
+            team_label.setText(config.TEAM_NAMES[team_id])
+            team_label.setStyleSheet(self.STYLE_NONHIGHLIGHTED)
+        self.team_label_list[0].setStyleSheet(self.STYLE_HIGHLIGHTED)
+        self.set_signals_and_slots()
+
+    def release(self):
+        self.close_connection_to_buzzer()
+
     def set_signals_and_slots(self):
         """Sets all signals and slots for buzzer configuation window."""
+        if self.buzzer_connector:
+            return
         self.buzzer_connector = helper.get_buzzer_connector()
         self.buzzer_connector.flush_connection()
         self.buzzer_connector.buzzing.connect(self.on_buzzer_pressed)
 
     def close_connection_to_buzzer(self):
+        if not self.buzzer_connector:
+            return
         self.buzzer_connector.buzzing.disconnect(self.on_buzzer_pressed)
         self.buzzer_connector = None
 
@@ -97,7 +113,6 @@ class BuzzerConfigPanel(QtGui.QWidget):
             return
         key = event.key()
         if key == QtCore.Qt.Key_Escape:
-            self.close_connection_to_buzzer()
             self.main_gui.show_available_rounds_panel()
 
     @QtCore.pyqtSlot(int)
@@ -118,7 +133,6 @@ class BuzzerConfigPanel(QtGui.QWidget):
         else:
             # unhighlight all team names and return
             self.team_label_list[self.currently_highlighted_team].setStyleSheet(self.STYLE_NONHIGHLIGHTED)
-            self.close_connection_to_buzzer()
             self.main_gui.show_available_rounds_panel()
 
 
@@ -135,16 +149,9 @@ class AvailableRoundPanel(QtGui.QWidget):
         helper.whitefy(self)
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(32)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(24)
-        else:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(42)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(36)
+        current_theme = theme.get_theme()
+        self.title_font = current_theme.get_font('rounds title')
+        self.button_font = current_theme.get_font('rounds button')
 
     def setup_ui(self):
         self.setSizePolicy(QtGui.QSizePolicy.Expanding,
@@ -174,6 +181,14 @@ class AvailableRoundPanel(QtGui.QWidget):
             new_button.clicked.connect(self.on_button_click)
             self.button_box.addWidget(new_button)
             self.button_box.addStretch(1)
+        # add button for resuming the last game after a crash
+        self.resume_button = QtGui.QPushButton()
+        self.resume_button.setText(_('Resume last game'))
+        self.resume_button.setFont(self.button_font)
+        self.resume_button.clicked.connect(self.on_resume_button)
+        self.button_box.addStretch(1)
+        self.button_box.addWidget(self.resume_button)
+        self.update_resume_button()
         # add button for assigning team buzzer
         buzzer_config_button = QtGui.QPushButton()
         buzzer_config_button.setText(_('Change buzzer assignment'))
@@ -221,6 +236,19 @@ class AvailableRoundPanel(QtGui.QWidget):
         logger.info('File "{}" should be loaded...'.format(filename_to_load))
         self.main_gui.show_round_table(filename_to_load)
 
+    def activate(self):
+        self.update_resume_button()
+
+    def update_resume_button(self):
+        """Shows the button for resuming the last game only if a snapshot of
+        an unfinished game exists."""
+        self.resume_button.setVisible(os.path.exists(snapshot.SNAPSHOT_FILE))
+
+    @QtCore.pyqtSlot()
+    def on_resume_button(self):
+        logger.info('Resuming last game...')
+        self.main_gui.resume_last_game()
+
     @QtCore.pyqtSlot()
     def on_buzzer_config_button(self):
         logger.info('Changing buzzer configuration...')
@@ -247,16 +275,11 @@ class ConfigurationPanel(QtGui.QWidget):
         self.create_fonts()
         self.setup_data()
         self.setup_ui()
-        self.fill_options()
         self.set_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.label_font = QtGui.QFont(config.BASE_FONT)
-            self.label_font.setPointSize(22)
-        else:
-            self.label_font = QtGui.QFont(config.BASE_FONT)
-            self.label_font.setPointSize(30)
+        current_theme = theme.get_theme()
+        self.label_font = current_theme.get_font('label')
 
     def setup_data(self):
         self.game_options = { 'ADD_ROUND_POINTS': None,
@@ -334,6 +357,10 @@ class ConfigurationPanel(QtGui.QWidget):
         vbox.addLayout(button_box)
         self.setLayout(vbox)
 
+    def activate(self):
+        # the settings may have been changed since the panel was built
+        self.fill_options()
+
     def fill_options(self):
         # fill in game options
         for option_name, option_widget in self.game_options.items():
@@ -383,6 +410,7 @@ class ConfigurationPanel(QtGui.QWidget):
     def on_back_button(self, save_options=False):
         if save_options:
             self.store_options()
+            self.main_gui.settings_changed()
         self.main_gui.show_available_rounds_panel()
 
 
@@ -398,12 +426,8 @@ class InformationPanel(QtGui.QWidget):
         self.set_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.label_font = QtGui.QFont(config.BASE_FONT)
-            self.label_font.setPointSize(22)
-        else:
-            self.label_font = QtGui.QFont(config.BASE_FONT)
-            self.label_font.setPointSize(30)
+        current_theme = theme.get_theme()
+        self.label_font = current_theme.get_font('label')
 
     def setup_ui(self):
         vbox = QtGui.QVBoxLayout()
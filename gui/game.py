@@ -14,7 +14,9 @@ from PyQt4.phonon import Phonon
 
 from data import config
 from gui import helper
+from gui import theme
 import data.helper
+import data.game
 
 
 logger = logging.getLogger('pyPardy.gui')
@@ -22,21 +24,21 @@ logger = logging.getLogger('pyPardy.gui')
 
 # time before a buzzer press has any effect
 STARTUP_TIME = 0
-# step that will be used to decrease game time
-GAME_TIME_STEP = 100
-# factor to divide given time in seconds into part of that
+# factor to divide given time in seconds into part of that, the timer shows
+# tenths of a second
 GAME_TIME_FACTOR = 10
 
 
 class QuestionTablePanel(QtGui.QWidget):
     """Panel showing all questions of a chosen round.
 
+    The panel listens to the changes of the game. Completed questions are
+    collected while the panel is hidden and only their buttons are changed
+    when it is shown again, so only these buttons have to be repainted.
+
     :param round_data_file_name: filename of data file containing all round
                                  data
     """
-    # define signal to be used to update widgets inside this QuestionTablePanel
-    table_shown = QtCore.pyqtSignal()
-    
     # define a QT signal to react on buzzer presses
     question_button_pressed = QtCore.pyqtSignal(int, int)
 
@@ -52,11 +54,18 @@ class QuestionTablePanel(QtGui.QWidget):
         """
         super(QuestionTablePanel, self).__init__(parent)
         logger.info('Generating question table for round "{}"'
-                    .format(game_data.current_round_data['title']))
+                    .format(game_data.current_round_data.title))
         self.game_data = game_data
         self.main_gui = parent
         self.add_team_panel = add_team_panel
         self.button_list = []
+        # buttons for all questions, indexed by tuple (topic, question)
+        self.button_dict = {}
+        # questions as tuple (topic, question) that were completed since the
+        # table was updated the last time
+        self.dirty_cells = list(game_data.played_questions)
+        # whether all buttons have to be updated, e.g. after a reset
+        self.update_all_cells = False
         self.setFixedSize(width, height)
         self.create_fonts()
         self.setup_ui()
@@ -64,20 +73,10 @@ class QuestionTablePanel(QtGui.QWidget):
         self.set_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(32)
-            self.topic_font = QtGui.QFont(config.BASE_FONT)
-            self.topic_font.setPointSize(16)
-            self.question_font = QtGui.QFont(config.BASE_FONT)
-            self.question_font.setPointSize(36)
-        else:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(46)
-            self.topic_font = QtGui.QFont(config.BASE_FONT)
-            self.topic_font.setPointSize(24)
-            self.question_font = QtGui.QFont(config.BASE_FONT)
-            self.question_font.setPointSize(56)
+        current_theme = theme.get_theme()
+        self.title_font = current_theme.get_font('table title')
+        self.topic_font = current_theme.get_font('table topic')
+        self.question_font = current_theme.get_font('table question')
 
     def setup_ui(self):
         self.box_layout = QtGui.QHBoxLayout()
@@ -99,22 +98,22 @@ class QuestionTablePanel(QtGui.QWidget):
         margin = 40
         self.button_grid.setContentsMargins(margin, margin, margin, margin)
         # add title label
-        title_label = QtGui.QLabel(self.game_data.current_round_data['title'])
+        title_label = QtGui.QLabel(self.game_data.current_round_data.title)
         title_label.setFont(self.title_font)
         title_label.setAlignment(QtCore.Qt.AlignTop |
                                  QtCore.Qt.AlignHCenter)
         self.button_grid.addWidget(title_label, 0, 0, 1, 8)
         # add questions and labels  for all topics
-        for topic_count, topic in enumerate(self.game_data.current_round_data['topics']):
+        for topic_count, topic in enumerate(self.game_data.current_round_data.topics):
             # add topic title label
-            topic_label = QtGui.QLabel(topic['title'])
+            topic_label = QtGui.QLabel(topic.title)
             topic_label.setAlignment(QtCore.Qt.AlignCenter |
                                      QtCore.Qt.AlignHCenter)
             topic_label.setFont(self.topic_font)
             self.button_grid.addWidget(topic_label, 1, topic_count)
             # add buttons for all questions
             points = 0
-            for question_count, question in enumerate(topic['questions']):
+            for question_count, question in enumerate(topic.questions):
                 points += config.QUESTION_POINTS
                 button_text = str(points)
                 # create new button for question
@@ -126,17 +125,36 @@ class QuestionTablePanel(QtGui.QWidget):
                 # set topic and question number inside each QButton
                 new_button.topic_count = topic_count
                 new_button.question_count = question_count
+                new_button.points_text = button_text
                 new_button.setFont(self.question_font)
                 new_button.clicked.connect(self.on_button_click)
                 self.button_list.append(new_button)
+                self.button_dict[(topic_count, question_count)] = new_button
                 self.button_grid.addWidget(new_button, question_count+2,
                                            topic_count)
         return self.button_grid
 
     def set_signals_and_slots(self):
         """Sets all signals and slots for question table panel."""
+        self.game_data.add_listener(self.on_game_changed)
+
+    def dispose(self):
+        """Stops listening to the game before the panel is deleted."""
+        self.game_data.remove_listener(self.on_game_changed)
         if self.add_team_panel:
-            self.table_shown.connect(self.team_view_panel.on_update_points)
+            self.team_view_panel.dispose()
+
+    def on_game_changed(self, event, *args):
+        """Collects the questions that have to be updated in the table."""
+        if event == data.game.QUESTION_COMPLETED:
+            self.dirty_cells.append(args)
+        elif event == data.game.GAME_RESET:
+            self.dirty_cells = []
+            self.update_all_cells = True
+        else:
+            return
+        if self.isVisible():
+            self.update_widgets()
 
     def keyPressEvent(self, event):
         """Handle key events for cursor keys to navigate questions."""
@@ -160,8 +178,6 @@ class QuestionTablePanel(QtGui.QWidget):
                 # add or subtract points for given team depending on whether
                 # the CONTROL key was pressed
                 self.game_data.correct_points_by_100(i, not (modifiers == QtCore.Qt.ControlModifier))
-                if self.add_team_panel:
-                    self.team_view_panel.on_update_points()
         if key == QtCore.Qt.Key_D:
             self.focus_specific_button(topic + 1, question)
         elif key == QtCore.Qt.Key_A:
@@ -197,14 +213,21 @@ class QuestionTablePanel(QtGui.QWidget):
                 break
 
     def update_widgets(self):
-        # check which questions were played already
-        for button in self.button_list:
-            if self.game_data.was_question_completed(button.topic_count,
-                                                     button.question_count):
+        """Disables only the buttons of questions that were completed since
+        the last update. The points of the teams are updated by the team view
+        panel itself."""
+        if self.update_all_cells:
+            self.update_all_cells = False
+            for (topic, question), button in self.button_dict.items():
+                played = self.game_data.was_question_completed(topic, question)
+                button.setEnabled(not played)
+                button.setText('' if played else button.points_text)
+        for cell in self.dirty_cells:
+            button = self.button_dict.get(cell)
+            if button:
                 button.setEnabled(False)
                 button.setText('')
-        # update points for teams by emitting a signal 'table_shown'
-        self.table_shown.emit()
+        self.dirty_cells = []
 
     @QtCore.pyqtSlot()
     def on_button_click(self):
@@ -220,7 +243,12 @@ class QuestionTablePanel(QtGui.QWidget):
 
 
 class QuestionViewPanel(QtGui.QWidget):
-    """Panel showing one question including a timer counting the time."""
+    """Panel showing one question including a timer counting the time.
+
+    The panel is built only once and reused for all questions. Every time it
+    is shown, activate() resets all widgets to the current question of the
+    game, release() stops timers and sounds when it is left.
+    """
     def __init__(self, parent, game_data, width, height):
         """Initialize panel for displaying one question including its timer.
 
@@ -234,14 +262,17 @@ class QuestionViewPanel(QtGui.QWidget):
         # set data for this panel
         self.game_data = game_data
         self.main_gui = parent
-        self.topic = game_data.get_topic_name()
-        self.points = game_data.get_points_for_current_question()
+        self.topic = ''
+        self.points = 0
+        # remaining time in parts of a second that is shown by the timer
         self.current_time = config.QUESTION_TIME * GAME_TIME_FACTOR
+        self.countdown = data.helper.Countdown(config.QUESTION_TIME)
         # identifier for id of the team that buzzed
         self.last_buzzed_team = -1
         # identifier for buzzer ids of all teams that have already buzzed for
         # this question
         self.already_buzzed_teams = list()
+        self.buzzer_connector = None
         self.setFixedSize(width, height)
         # build gui and slots
         self.create_fonts()
@@ -249,26 +280,56 @@ class QuestionViewPanel(QtGui.QWidget):
         self.setup_ui()
         helper.whitefy(self)
         self.set_signals_and_slots()
-        self.start_timer()
         # audio methods
         self.init_audio()
+
+    def activate(self):
+        """Resets all widgets and starts the timer for the current question
+        of the game."""
+        self.topic = self.game_data.get_topic_name()
+        self.points = self.game_data.get_points_for_current_question()
+        self.last_buzzed_team = -1
+        self.already_buzzed_teams = list()
+        self.topic_button.setText(helper.replace_line_breaks(self.topic))
+        self.points_button.setText(helper.replace_line_breaks(str(self.points)))
+        self.question_label.setText(self.game_data.get_current_question())
+        helper.show_widget(self.question_label)
+        self.press_order_label.setText('')
+        self.show_answer_button.setText(_('Answer...'))
+        self.answer_correct_button.setText(_('Correct!'))
+        for button in (self.show_answer_button, self.answer_correct_button,
+                       self.answer_incorrect_button):
+            button.setEnabled(False)
+            helper.hide_widget(button)
+        self.team_view_panel.reset()
+        self.setFocus()
+        self.startup_timer.start(STARTUP_TIME)
+        self.start_timer()
         self.play_background_music()
         self.read_question()
 
-    def __del__(self):
+    def dispose(self):
+        self.team_view_panel.dispose()
+
+    def release(self):
+        """Stops all timers and sounds and disconnects from the buzzer API
+        when another panel is shown."""
+        self.startup_timer.stop()
+        self.timer.stop()
+        self.countdown.pause()
+        self.log_timer_jitter()
+        self.background_music.stop()
+        # hooks of running animations must not change the panel after it
+        # was left
+        for widget in (self.question_label, self.show_answer_button,
+                       self.answer_correct_button, self.answer_incorrect_button):
+            helper.cancel_animation(widget)
         self.remove_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.question_font = QtGui.QFont(config.BASE_FONT)
-            self.question_font.setPointSize(30)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(18)
-        else:
-            self.question_font = QtGui.QFont(config.BASE_FONT)
-            self.question_font.setPointSize(42)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(24)
+        current_theme = theme.get_theme()
+        self.question_font = current_theme.get_font('question')
+        self.button_font = current_theme.get_font('question button')
 
     def set_background(self):
         """Paints a color gradient over the background.
@@ -284,9 +345,7 @@ class QuestionViewPanel(QtGui.QWidget):
         #gradient.setColorAt(1.0, QtGui.QColor(13, 92, 166))
         #palette.setBrush(QtGui.QPalette.Background, QtGui.QBrush(gradient))
         #self.setPalette(palette)
-        self.setStyleSheet("""background-color: qlineargradient(
-                              x1: 0, y1: 0, x2: 0, y2: 1,
-                              stop: 0 #ffffff, stop: 1 #eeeeee);""")
+        self.setStyleSheet(theme.get_theme().get_style('question background'))
 
     def setup_ui(self):
         self.setSizePolicy(QtGui.QSizePolicy.Expanding,
@@ -306,20 +365,17 @@ class QuestionViewPanel(QtGui.QWidget):
         """Builds and add buttons to this panel for showing currently chosen
         topic as well as the currently played questions points."""
         # set style according to high contrast setting
-        if config.HIGH_CONTRAST:        
-            INFO_BUTTON_STYLE = 'color: black;'
-        else:
-            INFO_BUTTON_STYLE = 'background-color: yellow; color: black;'
-        topic_button = QtGui.QPushButton(helper.replace_line_breaks(self.topic))
-        topic_button.setEnabled(False)
-        topic_button.setFont(self.button_font)
-        topic_button.setStyleSheet(INFO_BUTTON_STYLE)
-        self.grid.addWidget(topic_button, 0, 0, QtCore.Qt.AlignTop)
-        points_button = QtGui.QPushButton(helper.replace_line_breaks(str(self.points)))
-        points_button.setEnabled(False)
-        points_button.setFont(self.button_font)
-        points_button.setStyleSheet(INFO_BUTTON_STYLE)
-        self.grid.addWidget(points_button, 0, 1, QtCore.Qt.AlignTop)
+        INFO_BUTTON_STYLE = theme.get_theme().get_style('info button')
+        self.topic_button = QtGui.QPushButton()
+        self.topic_button.setEnabled(False)
+        self.topic_button.setFont(self.button_font)
+        self.topic_button.setStyleSheet(INFO_BUTTON_STYLE)
+        self.grid.addWidget(self.topic_button, 0, 0, QtCore.Qt.AlignTop)
+        self.points_button = QtGui.QPushButton()
+        self.points_button.setEnabled(False)
+        self.points_button.setFont(self.button_font)
+        self.points_button.setStyleSheet(INFO_BUTTON_STYLE)
+        self.grid.addWidget(self.points_button, 0, 1, QtCore.Qt.AlignTop)
 
     def build_control_buttons(self):
         # add button for showing the answer of the question
@@ -345,10 +401,10 @@ class QuestionViewPanel(QtGui.QWidget):
 
     def build_labels(self):
         # add question label
-        self.question_label = QtGui.QLabel(self.game_data.get_current_question())
+        self.question_label = QtGui.QLabel()
         self.question_label.setFont(self.question_font)
         self.question_label.setLineWidth(25)
-        self.question_label.setStyleSheet('background-color: none;')
+        self.question_label.setStyleSheet(theme.get_theme().get_style('transparent'))
         self.question_label.setWordWrap(True)
         self.question_label.setAlignment(QtCore.Qt.AlignTop |
                                          QtCore.Qt.AlignHCenter)
@@ -359,6 +415,12 @@ class QuestionViewPanel(QtGui.QWidget):
                                              TeamViewPanel.HORIZONTAL_ORIENTATION)
         self.grid.addWidget(self.team_view_panel, 0, 2, 1, 2,
                             QtCore.Qt.AlignTop | QtCore.Qt.AlignRight)
+        # add label showing the order of near-simultaneous buzzer presses
+        self.press_order_label = QtGui.QLabel()
+        self.press_order_label.setFont(self.button_font)
+        self.press_order_label.setStyleSheet(theme.get_theme().get_style('transparent'))
+        self.press_order_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.press_order_label, 3, 0, 1, 4)
 
     def build_timer_widgets(self):
         # add timer
@@ -367,7 +429,7 @@ class QuestionViewPanel(QtGui.QWidget):
         #self.timer_lcd.resize(300, 200)
         self.timer_lcd.setSegmentStyle(QtGui.QLCDNumber.Flat)
         self.timer_lcd.setFrameStyle(QtGui.QFrame.NoFrame)
-        self.timer_lcd.setStyleSheet('background-color: none;')
+        self.timer_lcd.setStyleSheet(theme.get_theme().get_style('transparent'))
         #self.set_lcd_colors()
         self.grid.addWidget(self.timer_lcd, 2, 3,
                             QtCore.Qt.AlignBottom | QtCore.Qt.AlignRight)
@@ -387,28 +449,31 @@ class QuestionViewPanel(QtGui.QWidget):
         self.show_answer_button.clicked.connect(self.on_show_answer_button)
         self.answer_incorrect_button.clicked.connect(lambda: self.on_back_button(False))
         self.answer_correct_button.clicked.connect(lambda: self.on_back_button(True))
-        self.startup_timer = QtCore.QTimer()
+        self.startup_timer = QtCore.QTimer(self)
+        self.startup_timer.setSingleShot(True)
         self.startup_timer.timeout.connect(self.on_startup_timer)
-        self.startup_timer.start(STARTUP_TIME)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.on_update_lcd)
 
     def on_startup_timer(self):
         """Handles initialization of buzzer API and connects buzzer connector
         instance with slot in this class. After this the question view panel
         will react on all buzzer presses.
         """
-        self.startup_timer.stop()
+        if self.buzzer_connector:
+            return
         self.buzzer_connector = helper.get_buzzer_connector()
         self.buzzer_connector.flush_connection()
-        self.buzzer_connector.buzzing.connect(self.on_buzzer_pressed)
+        self.buzzer_connector.buzzing_ordered.connect(self.on_buzzer_pressed)
 
     def remove_signals_and_slots(self):
-        """Sets all signals and slots for question view. Closes also the
-        connection between the BuzzerConnector and the callable method
-        'on_buzzer_pressed' on this class."""
-        self.show_answer_button.clicked.disconnect()
-        self.answer_incorrect_button.clicked.disconnect()
-        self.answer_correct_button.clicked.disconnect()
-        self.buzzer_connector.buzzing.disconnect(self.on_buzzer_pressed)
+        """Closes the connection between the BuzzerConnector and the
+        callable method 'on_buzzer_pressed' on this class. The buttons stay
+        connected, because the panel is reused for the next question."""
+        if not self.buzzer_connector:
+            return
+        self.buzzer_connector.buzzing_ordered.disconnect(self.on_buzzer_pressed)
         self.buzzer_connector = None
 
     def keyPressEvent(self, event):
@@ -426,49 +491,108 @@ class QuestionViewPanel(QtGui.QWidget):
     ##### game timer methods #####
 
     def start_timer(self):
-        """Builds timer that will update game time depending on the value of
-        GAME_TIME_STEP. Each time the lcd widget will be updated and decreased
-        by GAME_TIME_STEP. The maximum game time is defined as seconds in the
-        config file and multiplied by GAME_TIME_FACTOR to show part of seconds.
+        """Starts the countdown for the current question. The maximum game
+        time is defined as seconds in the config file. The remaining time is
+        computed from a deadline on the monotonic clock, so a stalled event
+        loop does not make the countdown slower. The timer only wakes up when
+        the value shown in the lcd widget changes, which has a resolution of
+        1/GAME_TIME_FACTOR seconds.
         """
-        self.timer = QtCore.QTimer(self)
-        self.timer.timeout.connect(self.on_update_lcd)
-        self.timer.start(GAME_TIME_STEP)
+        self.countdown = data.helper.Countdown(config.QUESTION_TIME)
+        self.countdown.start()
+        self.current_time = None
         self.on_update_lcd()
 
     def stop_timer(self):
-        self.timer_lcd.display('{0:01}'.format(self.current_time / GAME_TIME_FACTOR))
+        """Pauses the countdown, the remaining time is kept exactly."""
         self.timer.stop()
+        self.countdown.pause()
+        self.update_lcd()
+
+    def resume_timer(self):
+        self.countdown.resume()
+        self.on_update_lcd()
+
+    def update_lcd(self):
+        """Repaints the lcd widget only if the shown value changes."""
+        current_time = self.countdown.get_steps(GAME_TIME_FACTOR)
+        if current_time != self.current_time:
+            self.current_time = current_time
+            self.timer_lcd.display('{0:01}'.format(current_time / GAME_TIME_FACTOR))
+
+    def log_timer_jitter(self):
+        jitter = self.countdown.get_jitter()
+        if jitter['ticks']:
+            logger.info('Timer jitter for question: {ticks} ticks, mean {mean:.1f} ms, '
+                        'maximum {maximum:.1f} ms'.format(**jitter))
 
     ##### slot methods #####
 
-    @QtCore.pyqtSlot(int)
-    def on_buzzer_pressed(self, buzzer_id):
+    @QtCore.pyqtSlot(int, list)
+    def on_buzzer_pressed(self, buzzer_id, ordered_presses=None):
         """Handles a pressed buzzer and registers the team.
 
-        :param buzzer_id: buzzer id delivered by BuzzerReader()"""
+        :param buzzer_id: buzzer id delivered by BuzzerReader()
+        :param ordered_presses: list of all presses within the arbitration
+                                window as tuples (buzzer id, delta in seconds
+                                to the first press) ordered by time"""
+        if ordered_presses is None:
+            ordered_presses = [(buzzer_id, 0.0)]
         logger.info('Buzzer ({}) was pressed.'.format(buzzer_id))
         logger.info('Already pressed buzzers: {}'.format(self.already_buzzed_teams))
-        if self.last_buzzed_team == -1 and buzzer_id not in self.already_buzzed_teams:
-            # stop background music and play buzzer sound
-            self.background_music.stop()
-            self.play_buzzer_sound()
-            # get team id from buzzer id
-            team_id = self.game_data.get_team_by_buzzer_id(buzzer_id)
-            self.last_buzzed_team = team_id
-            # update gui widgets
-            self.team_view_panel.highlight_team(team_id)
-            if self.timer.isActive():
-                self.on_question_time_end()
+        if self.last_buzzed_team != -1:
+            return
+        # choose the first press of a team that is still allowed to answer
+        eligible_presses = [(b, delta) for b, delta in ordered_presses
+                            if b not in self.already_buzzed_teams]
+        if not eligible_presses:
+            return
+        buzzer_id = eligible_presses[0][0]
+        # stop background music and play buzzer sound
+        self.background_music.stop()
+        self.play_buzzer_sound()
+        # get team id from buzzer id
+        team_id = self.game_data.get_team_by_buzzer_id(buzzer_id)
+        self.last_buzzed_team = team_id
+        # update gui widgets
+        self.team_view_panel.highlight_team(team_id)
+        self.show_press_order(eligible_presses)
+        if self.countdown.is_running():
+            self.on_question_time_end()
+
+    def show_press_order(self, presses):
+        """Shows by how much time the first team has beaten the other teams
+        that have pressed their buzzer within the arbitration window.
+
+        :param presses: list of tuples (buzzer id, delta in seconds) ordered by
+                        time, the first entry is the winner
+        """
+        winner_id, winner_delta = presses[0]
+        messages = []
+        for buzzer_id, delta in presses[1:]:
+            messages.append(_('{winner} beat {loser} by {delta:.0f} ms').format(
+                winner=self.get_buzzer_name(winner_id),
+                loser=self.get_buzzer_name(buzzer_id),
+                delta=(delta - winner_delta) * 1000))
+        for message in messages:
+            logger.info(message)
+        self.press_order_label.setText(', '.join(messages))
+
+    def get_buzzer_name(self, buzzer_id):
+        team_id = self.game_data.get_team_by_buzzer_id(buzzer_id)
+        if team_id == -1:
+            return _('Buzzer {}').format(buzzer_id)
+        return config.TEAM_NAMES[team_id]
 
     @QtCore.pyqtSlot()
     def on_update_lcd(self):
-        if self.current_time > 0:
-            # decrement time when not yet expired
-            self.current_time -= 1
-            self.timer_lcd.display('{0:01}'.format(self.current_time / GAME_TIME_FACTOR))
-        else:
+        self.countdown.tick()
+        self.update_lcd()
+        if self.countdown.is_expired():
             self.on_question_time_end()
+        else:
+            # wake up again when the shown value changes next
+            self.timer.start(self.countdown.schedule_tick(GAME_TIME_FACTOR))
 
     def on_question_time_end(self):
         # stop timer and fade question out only when buzzered before end of
@@ -582,7 +706,6 @@ class QuestionViewPanel(QtGui.QWidget):
                     self.game_data.add_points_to_team(self.last_buzzed_team)
                     # update user interface
                     self.hide_evaluation_buttons()
-                    self.team_view_panel.on_update_points()
                     self.fade_in_answer_button(_('Back'))
                 else:
                     logger.info('Question was answered incorrectly!')
@@ -599,14 +722,13 @@ class QuestionViewPanel(QtGui.QWidget):
                     # has already answered the current question
                     self.team_view_panel.highlight_team(-1)
                     self.team_view_panel.deactivate_team(self.last_buzzed_team)
-                    self.team_view_panel.on_update_points()
                     # reset id of team that has buzzered
                     self.last_buzzed_team = -1
                     # hide buttons
                     self.hide_evaluation_buttons()
                     # resume game timer and bg music if game has not ended yet
                     if len(self.already_buzzed_teams) < config.MAX_TEAM_NUMBER:
-                        self.timer.start()
+                        self.resume_timer()
                         self.play_background_music()
                         self.setFocus()
                     else:
@@ -683,6 +805,9 @@ class TeamViewPanel(QtGui.QWidget):
         self.main_gui = parent
         self.points_label_dict = {}
         self.team_label_dict = {}
+        # style sheets currently set for all team labels, so that only
+        # changed styles have to be parsed again
+        self.team_label_styles = {}
         # data for styling the team labels correctly
         self.highlighted_team = -1
         self.deactivated_teams = list()
@@ -697,24 +822,31 @@ class TeamViewPanel(QtGui.QWidget):
         self.setup_ui()
         # set style sheet for all team labels
         self.highlight_team(-1)
+        # points are updated when they change in the game
+        self.game_data.add_listener(self.on_game_changed)
+
+    def dispose(self):
+        """Stops listening to the game before the panel is deleted."""
+        self.game_data.remove_listener(self.on_game_changed)
+
+    def on_game_changed(self, event, *args):
+        """Updates only the points of the team that has changed."""
+        if event == data.game.POINTS_CHANGED:
+            team_id, points = args
+            points_label = self.points_label_dict.get(team_id)
+            if points_label:
+                points_label.display(str(points))
+        elif event == data.game.GAME_RESET:
+            self.on_update_points()
 
     def create_fonts(self):
-        # set point size depending on settings and orientation
+        # set font depending on settings and orientation
         if self.orientation == self.VERTICAL_ORIENTATION:
-            if config.LOW_RESOLUTION:
-                point_size = 20
-            else:
-                point_size = 26
+            self.team_font = theme.get_theme().get_font('team vertical')
         elif self.orientation == self.HORIZONTAL_ORIENTATION:
-            if config.LOW_RESOLUTION:
-                point_size = 26
-            else:
-                point_size = 32
+            self.team_font = theme.get_theme().get_font('team horizontal')
         else:
             raise NotImplementedError()
-        # set font with specified name and size
-        self.team_font = QtGui.QFont(config.BASE_FONT)
-        self.team_font.setPointSize(point_size)
 
     def setup_ui(self):
         if self.orientation == self.VERTICAL_ORIENTATION:
@@ -796,16 +928,28 @@ class TeamViewPanel(QtGui.QWidget):
         self.deactivated_teams.append(team_id)
         self.update_styles()
 
+    def reset(self):
+        """Removes all highlights and shows the current names of all teams,
+        e.g. before a reused panel shows the next question. The points are
+        kept up to date by on_game_changed()."""
+        self.highlighted_team = -1
+        self.deactivated_teams = list()
+        for team_id, team_label in self.team_label_dict.items():
+            team_label.setText(config.TEAM_NAMES[team_id])
+        self.update_styles()
+
     def update_styles(self):
-        SELECTED_STYLE = 'background: red; color: white; border-radius: 15px; border-width: 4px;'
-        DEACTIVATED_STYLE = 'background: grey; color: grey; border-radius: 15px; border-width: 4px;'
+        current_theme = theme.get_theme()
         for id, team_label in self.team_label_dict.items():
             if id in self.deactivated_teams:
-                team_label.setStyleSheet(DEACTIVATED_STYLE)
+                style = current_theme.get_style('team deactivated')
             elif id == self.highlighted_team:
-                team_label.setStyleSheet(SELECTED_STYLE)
+                style = current_theme.get_style('team selected')
             else:
-                team_label.setStyleSheet('')
+                style = current_theme.get_style('team normal')
+            if self.team_label_styles.get(id) != style:
+                team_label.setStyleSheet(style)
+                self.team_label_styles[id] = style
     
     @QtCore.pyqtSlot()
     def on_update_points(self):
@@ -839,26 +983,16 @@ class GameOverDialog(QtGui.QDialog):
         self.set_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(30)
-            self.team_font = QtGui.QFont(config.BASE_FONT)
-            self.team_font.setPointSize(26)
-            self.points_font = QtGui.QFont(config.BASE_FONT)
-            self.points_font.setPointSize(20)
-        else:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(36)
-            self.team_font = QtGui.QFont(config.BASE_FONT)
-            self.team_font.setPointSize(26)
-            self.points_font = QtGui.QFont(config.BASE_FONT)
-            self.points_font.setPointSize(20)
+        current_theme = theme.get_theme()
+        self.title_font = current_theme.get_font('game over title')
+        self.team_font = current_theme.get_font('game over team')
+        self.points_font = current_theme.get_font('game over points')
 
     def set_signals_and_slots(self):
         self.close_button.clicked.connect(self.close)
 
     def setup_ui(self):
-        self.place_style = 'background: yellow; border:1px solid grey;'
+        self.place_style = theme.get_theme().get_style('game over place')
         self.grid = QtGui.QGridLayout()
         center_box = QtGui.QVBoxLayout()
         title_label = QtGui.QLabel(self.game_data.get_round_title())
@@ -16,6 +16,7 @@ from PyQt4.phonon import Phonon
 from data import round
 from data import game
 from data import config
+from data import snapshot
 
 from gui import game as game_ui
 from gui import admin
@@ -35,19 +36,17 @@ class PyPardyGui(QtGui.QMainWindow):
         logger.info('Building main window of pyPardy...')
         QtGui.QMainWindow.__init__(self, parent)
         self.set_window_size()
-        # define all panels that are used inside the QStackedWidget
-        self.available_rounds_panel = None
-        self.current_round_question_panel = None
-        self.current_question_panel = None
+        # all panels inside the QStackedWidget are managed by a panel pool
+        self.panels = None
         self.current_game = None
-        self.buzzer_config_panel = None
         # build and config all widgets
         self.setup_ui()
         helper.center_on_screen(self)
         self.set_signals_and_slots()
         # create instance of Game class for saving all necessary data
-        self.current_game = game.Game()
+        self.current_game = game.Game(game.JOURNAL_FILE)
         self.init_audio()
+        self.init_snapshots()
 
     # FIXME Handle game ending and release all resources from buzzer API!
     def __del__(self):
@@ -72,6 +71,7 @@ class PyPardyGui(QtGui.QMainWindow):
         # build stacked widget for all current and coming panels
         self.stackedWidget = QtGui.QStackedWidget()
         self.stackedWidget.setFixedSize(self.WIDTH, self.HEIGHT)
+        self.panels = helper.PanelPool(self.stackedWidget)
         self.show_available_rounds_panel()
         # set central widget for main window
         self.setCentralWidget(self.stackedWidget)
@@ -87,46 +87,99 @@ class PyPardyGui(QtGui.QMainWindow):
         Phonon.createPath(self.game_end_sound, self.audio_output)
         self.game_end_sound.setCurrentSource(Phonon.MediaSource('./sounds/temple_bell.wav'))
 
+    def init_snapshots(self):
+        """Starts writing snapshots of the running game periodically."""
+        self.snapshot_writer = snapshot.SnapshotWriter()
+        self.snapshot_timer = QtCore.QTimer(self)
+        self.snapshot_timer.timeout.connect(self.on_snapshot_timer)
+        self.snapshot_timer.start(config.SNAPSHOT_INTERVAL)
+
     ##### slot methods #####
 
+    @QtCore.pyqtSlot()
+    def on_snapshot_timer(self):
+        # only running rounds are saved, the snapshot of the last game must
+        # not be overwritten while the available rounds are shown
+        if self.current_game.current_round_data:
+            self.snapshot_writer.save(self.current_game)
+
     @QtCore.pyqtSlot()
     def on_click_something(self):
         logger.info('Loading file...')
 
     ##### methods creating and selecting panels within QStackedWidget #####
 
-    def show_round_table(self, filename):
+    @property
+    def current_round_question_panel(self):
+        return self.panels.get('round_table')
+
+    @property
+    def current_question_panel(self):
+        return self.panels.get('question')
+
+    def create_round_table_panel(self):
+        panel = game_ui.QuestionTablePanel(self, self.current_game, self.WIDTH, self.HEIGHT)
+        panel.question_button_pressed.connect(self.show_question)
+        return panel
+
+    def settings_changed(self):
+        """Disposes all panels except the configuration panel, so that they
+        are built again with the new settings."""
+        self.panels.dispose_all([name for name in self.panels.panels
+                                 if name != 'configuration'])
+
+    def show_round_table(self, filename, new_game=True):
         # save filename in Game class
         self.current_game.filename = filename
         # load round data from file
         self.current_game.current_round_data = round.load_round_data_file(filename)
-        # remove old question table if it exists
-        if self.current_round_question_panel:
-            self.stackedWidget.removeWidget(self.current_round_question_panel)
-        # create new question table and connect it to method of this class
-        self.current_round_question_panel = game_ui.QuestionTablePanel(self, self.current_game,
-                                                                       self.WIDTH, self.HEIGHT)
-        self.current_round_question_panel.question_button_pressed.connect(self.show_question)
-        self.stackedWidget.addWidget(self.current_round_question_panel)
-        self.stackedWidget.setCurrentWidget(self.current_round_question_panel)
+        if new_game:
+            self.current_game.start_game()
+        # the question table depends on the number of topics and questions,
+        # so it is built again for every round
+        self.panels.replace('round_table', self.create_round_table_panel)
+        self.panels.show('round_table')
+
+    def resume_last_game(self):
+        """Restores the game from the last snapshot and shows its question
+        table."""
+        state = snapshot.load_snapshot()
+        if not state or not state.get('filename'):
+            logger.warning('No game to resume.')
+            return
+        logger.info('Resuming game with round data file "{}".'.format(state['filename']))
+        try:
+            self.show_round_table(state['filename'], new_game=False)
+        except (OSError, ValueError) as e:
+            logger.error('Could not resume last game: {}'.format(e))
+            self.show_available_rounds_panel()
+            return
+        self.current_game.restore_state(state)
+        self.current_round_question_panel.update_widgets()
 
     def back_to_round_table(self):
         """Handles the transition from question view panel back to the table
         with all questions of the round."""
-        # show the rounds question table
-        self.stackedWidget.setCurrentWidget(self.current_round_question_panel)
+        # show the rounds question table, the question view is released and
+        # kept for the next question
+        self.panels.show('round_table')
         self.current_round_question_panel.update_widgets()
-        # remove old question view widget
-        if self.current_question_panel:
-            self.current_question_panel = None
-            #del self.current_question_panel
+        # save state after every question instead of waiting for the timer
+        self.snapshot_writer.save(self.current_game)
         # handle end of round
         if self.current_game.is_round_complete():
             logger.info('Round was completed.')
             self.round_complete()
 
+    def round_complete(self):
+        self.quit_round()
+
     def quit_round(self):
         self.current_game.quit_round()
+        logger.debug('Animations after round: {}'.format(
+            helper.get_animation_manager().get_statistics()))
+        # game has ended, so there is nothing left to resume
+        self.snapshot_writer.clear()
         if config.AUDIO_SFX:
             self.game_end_sound.play()
         dialog = game_ui.GameOverDialog(self, self.current_game)
@@ -134,62 +187,37 @@ class PyPardyGui(QtGui.QMainWindow):
         self.show_available_rounds_panel()
 
     def show_question(self, topic, question):
-        # remove old question view if it exists
-        if self.current_question_panel:
-            self.stackedWidget.removeWidget(self.current_question_panel)
-            self.current_question_panel.remove_signals_and_slots()
         # save chosen topic and question in Game class
         self.current_game.current_topic = topic
         self.current_game.current_question = question
-        # create new question view
-        self.current_question_panel = game_ui.QuestionViewPanel(self,
-                                                                self.current_game,
-                                                                self.WIDTH,
-                                                                self.HEIGHT)
-        self.stackedWidget.addWidget(self.current_question_panel)
-        self.stackedWidget.setCurrentWidget(self.current_question_panel)
+        # the question view is built once and rebound to the chosen question
+        self.panels.show('question',
+                         lambda: game_ui.QuestionViewPanel(self, self.current_game,
+                                                           self.WIDTH, self.HEIGHT))
 
     def show_available_rounds_panel(self):
-        # delete buzzer config panel if it exists already to unhook buzzer API
-        if self.buzzer_config_panel:
-            self.stackedWidget.removeWidget(self.buzzer_config_panel)
+        # the question table of the last round is not needed anymore
+        self.panels.dispose('round_table')
         # reset all internal state of game object
         if self.current_game:
             self.current_game.reset_game()
-        # build and display available rounds
-        if not self.available_rounds_panel:
-            self.available_rounds_panel = admin.AvailableRoundPanel(self, self.WIDTH,
-                                                                    self.HEIGHT)
-            self.stackedWidget.addWidget(self.available_rounds_panel)
-        self.stackedWidget.setCurrentWidget(self.available_rounds_panel)
+        self.panels.show('available_rounds',
+                         lambda: admin.AvailableRoundPanel(self, self.WIDTH, self.HEIGHT))
 
     def show_buzzer_config_panel(self):
-        # remove old buzzer config panel
-        if self.buzzer_config_panel:
-            self.stackedWidget.removeWidget(self.buzzer_config_panel)
-        # create new buzzer config panel
-        self.buzzer_config_panel = admin.BuzzerConfigPanel(self,
-                                                           self.current_game,
-                                                           self.WIDTH,
-                                                           self.HEIGHT)
-        self.stackedWidget.addWidget(self.buzzer_config_panel)
-        self.stackedWidget.setCurrentWidget(self.buzzer_config_panel)
+        self.panels.show('buzzer_config',
+                         lambda: admin.BuzzerConfigPanel(self, self.current_game,
+                                                         self.WIDTH, self.HEIGHT))
 
     def show_config_panel(self):
-        config_panel = admin.ConfigurationPanel(self,
-                                                self.current_game,
-                                                self.WIDTH,
-                                                self.HEIGHT)
-        self.stackedWidget.addWidget(config_panel)
-        self.stackedWidget.setCurrentWidget(config_panel)
+        self.panels.show('configuration',
+                         lambda: admin.ConfigurationPanel(self, self.current_game,
+                                                          self.WIDTH, self.HEIGHT))
 
     def show_information_panel(self):
-        info_panel = admin.InformationPanel(self,
-                                            self.current_game,
-                                            self.WIDTH,
-                                            self.HEIGHT)
-        self.stackedWidget.addWidget(info_panel)
-        self.stackedWidget.setCurrentWidget(info_panel)
+        self.panels.show('information',
+                         lambda: admin.InformationPanel(self, self.current_game,
+                                                        self.WIDTH, self.HEIGHT))
 
 
 def handle_exit():
@@ -8,13 +8,17 @@ Helper classes for the gui of pyPardy.
 """
 
 import logging
-import time
 
 from PyQt4 import QtCore
 from PyQt4 import QtGui
 
 from buzzer import buzzer
+from buzzer import pressqueue
+from buzzer import debounce
+from buzzer import network
+from buzzer import recording
 from data import config
+from gui import theme
 
 
 logger = logging.getLogger('pyPardy.gui')
@@ -24,14 +28,15 @@ logger = logging.getLogger('pyPardy.gui')
 ANIMATION_TIME = 750
 # singleton instance that is returned by get_buzzer_connector() function
 STATIC_INSTANCE_OF_BUZZER_CONNECTOR = None
+# singleton instance that is returned by get_animation_manager() function
+STATIC_INSTANCE_OF_ANIMATION_MANAGER = None
 # whether to debounce buzzers
 DEBOUNCE_BUZZER = True
 # debounce interval in s
 DEBOUNCE_INTERVAL = 0.500
-
-
-# list of all animation objects
-animation_list = []
+# debounce policy (see buzzer.debounce), one of 'leading', 'trailing' or
+# 'lockout'
+DEBOUNCE_POLICY = debounce.LEADING_EDGE
 
 
 class BuzzerConnector(QtCore.QObject):
@@ -42,29 +47,80 @@ class BuzzerConnector(QtCore.QObject):
     BuzzerConnector the module-level function get_buzzer_connector() should
     be used.
 
-    By using the constants DEBOUNCE_BUZZER and DEBOUNCE_INTERVAL it is possible
-    to define the behaviour of the connected buzzers. If DEBOUNCE_BUZZER is
-    True a signal from the buzzer will only emitted when the current buzzer id
-    is different than the last buzzed id or the given interval is elapsed!
-
-    NOTE: Debouncing uses time.monotonic() which is only part of Python since
-    version 3.3!
+    By using the constants DEBOUNCE_BUZZER, DEBOUNCE_INTERVAL and
+    DEBOUNCE_POLICY it is possible to define the behaviour of the connected
+    buzzers. If DEBOUNCE_BUZZER is True every buzzer is debounced on its own
+    with the given policy (see buzzer.debounce.BuzzerDebouncer). The number of
+    suppressed presses per buzzer can be read with get_suppressed_presses().
+
+    All presses are stamped by the buzzer API when the USB transfer completes.
+    After the first press all presses within config.BUZZER_ARBITRATION_WINDOW
+    are collected and ordered by their timestamp. Only the earliest press is
+    emitted by the signal 'buzzing', the signal 'buzzing_ordered' delivers
+    additionally a list of all presses as tuples (buzzer id, delta in seconds
+    to the earliest press).
+
+    The buzzer threads only push presses into a bounded PressQueue. The queue
+    is drained in one batch by the thread of this object, so all debounce and
+    arbitration state is only touched by the GUI thread.
     """
     # define a QT signal to react on buzzer presses
     buzzing = QtCore.pyqtSignal(int)
-
-    def __init__(self):
+    # define a QT signal delivering the winner and all presses in order
+    buzzing_ordered = QtCore.pyqtSignal(int, list)
+    # internal signal to wake up the GUI thread when presses are queued
+    presses_available = QtCore.pyqtSignal()
+
+    def __init__(self, buzzer_reader_factory=None):
+        """Initialize connector and start reading the buzzers.
+
+        :param buzzer_reader_factory: callable that gets the callback for the
+                                      buzzer API and returns a reader object,
+                                      if not given the reader is chosen
+                                      depending on config.BUZZER_SOURCE and
+                                      the operating system
+        """
         super(BuzzerConnector, self).__init__()
+        self.debouncer = debounce.BuzzerDebouncer(DEBOUNCE_POLICY,
+                                                  DEBOUNCE_INTERVAL)
+        # timer for reporting presses held back by trailing edge debouncing
+        self.debounce_timer = QtCore.QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self.on_debounce_timer)
+        # presses collected in the current arbitration window
+        self.arbitration_presses = []
+        self.arbitration_timer = QtCore.QTimer(self)
+        self.arbitration_timer.setSingleShot(True)
+        self.arbitration_timer.timeout.connect(self.on_arbitration_finished)
+        # presses arrive from the buzzer thread and are handled in the thread
+        # of this object
+        self.press_queue = pressqueue.PressQueue(wakeup=self.presses_available.emit)
+        self.reported_overflows = 0
+        self.presses_available.connect(self.on_presses_available,
+                                       QtCore.Qt.QueuedConnection)
+        # all presses are recorded in the buzzer threads as they come from
+        # the buzzers, before the press queue may drop them
+        self.recorder = None
+        if config.BUZZER_RECORD_FILE:
+            self.recorder = recording.PressRecorder(config.BUZZER_RECORD_FILE)
         # install callback for buzzer API
         import platform
-        if platform.system() == 'Linux':
+        if buzzer_reader_factory:
+            self.buzzer_reader = buzzer_reader_factory(self.on_buzzer_pressed)
+        elif config.BUZZER_SOURCE == 'replay':
+            self.buzzer_reader = recording.BuzzerReplayer(self.on_buzzer_pressed,
+                                                          config.BUZZER_REPLAY_FILE,
+                                                          config.BUZZER_REPLAY_SPEED / 100)
+        elif config.BUZZER_SOURCE == 'network':
+            self.buzzer_reader = network.BuzzerGateway(self.on_buzzer_pressed,
+                                                       udp_port=config.NETWORK_BUZZER_UDP_PORT,
+                                                       websocket_port=config.NETWORK_BUZZER_WEBSOCKET_PORT)
+        elif platform.system() == 'Linux':
             self.buzzer_reader = buzzer.BuzzerReader(self.on_buzzer_pressed)
         elif platform.system() == 'Windows':
             self.buzzer_reader = buzzer.BuzzerReaderPoller(self.on_buzzer_pressed)
         else:
             logger.error('Your OS is not supported!')
-        self.last_buzzer_id = -1
-        self.last_buzzer_time = 0
 
     def __del__(self):
         self.buzzer_reader.stop()
@@ -73,22 +129,80 @@ class BuzzerConnector(QtCore.QObject):
         self.buzzer_reader.stop()
         self.buzzer_reader.join()
         del self.buzzer_reader
+        if self.recorder:
+            self.recorder.close()
 
     def flush_connection(self):
-        self.last_buzzer_id = -1
+        self.debouncer.reset()
+        self.debounce_timer.stop()
+        self.arbitration_timer.stop()
+        self.arbitration_presses = []
+        self.press_queue.drain()
         self.buzzer_reader.flush_all_devices()
 
-    def on_buzzer_pressed(self, buzzer_id):
+    def on_buzzer_pressed(self, press):
+        """Callback for the buzzer API. Is called inside the buzzer thread!"""
+        # record the press before the queue may drop it
+        if self.recorder:
+            self.recorder.record(press)
+        self.press_queue.push(press)
+
+    @QtCore.pyqtSlot()
+    def on_presses_available(self):
+        """Handles all presses that were queued since the last call."""
+        presses = self.press_queue.drain()
+        for press in presses:
+            self.handle_press(press)
+        if self.press_queue.overflows != self.reported_overflows:
+            logger.warning('Buzzer press queue overflowed, {} presses dropped.'
+                           .format(self.press_queue.overflows - self.reported_overflows))
+            self.reported_overflows = self.press_queue.overflows
+
+    def handle_press(self, press):
         if DEBOUNCE_BUZZER:
-            # get current time and check if DEBOUNCE_INTERVAL has elapsed
-            current_time = time.monotonic()
-            time_difference = current_time - self.last_buzzer_time
-            if buzzer_id != self.last_buzzer_id or time_difference > DEBOUNCE_INTERVAL:
-                self.last_buzzer_time = current_time
-                self.last_buzzer_id = buzzer_id
-                self.buzzing.emit(buzzer_id)
-        else:
-            self.buzzing.emit(buzzer_id)
+            press = self.debouncer.process(press)
+            if not press:
+                self.schedule_debounce_timer()
+                return
+        self.arbitrate_press(press)
+
+    def schedule_debounce_timer(self):
+        deadline = self.debouncer.next_deadline()
+        if deadline is not None:
+            remaining = max(deadline - buzzer.get_timestamp(), 0)
+            self.debounce_timer.start(int(remaining * 1000) + 1)
+
+    @QtCore.pyqtSlot()
+    def on_debounce_timer(self):
+        for press in self.debouncer.poll(buzzer.get_timestamp()):
+            self.arbitrate_press(press)
+        self.schedule_debounce_timer()
+
+    def get_suppressed_presses(self):
+        """Returns a dictionary with the number of presses that were suppressed
+        by debouncing for every buzzer id."""
+        return self.debouncer.get_suppressed_presses()
+
+    def arbitrate_press(self, press):
+        self.arbitration_presses.append(press)
+        if not self.arbitration_timer.isActive():
+            # close the window relative to the time the first press happened
+            first_press = min(p.timestamp for p in self.arbitration_presses)
+            window_end = first_press + config.BUZZER_ARBITRATION_WINDOW / 1000
+            remaining = max(window_end - buzzer.get_timestamp(), 0)
+            self.arbitration_timer.start(int(remaining * 1000))
+
+    @QtCore.pyqtSlot()
+    def on_arbitration_finished(self):
+        presses = sorted(self.arbitration_presses, key=lambda p: p.timestamp)
+        self.arbitration_presses = []
+        if not presses:
+            return
+        winner = presses[0]
+        ordered_presses = [(p.buzzer_id, p.timestamp - winner.timestamp)
+                           for p in presses]
+        self.buzzing.emit(winner.buzzer_id)
+        self.buzzing_ordered.emit(winner.buzzer_id, ordered_presses)
 
 
 def get_buzzer_connector():
@@ -98,8 +212,98 @@ def get_buzzer_connector():
     return STATIC_INSTANCE_OF_BUZZER_CONNECTOR
 
 
+##### Lifecycle of the panels inside the main window
+
+class PanelPool(object):
+    """Manages all panels shown in a QStackedWidget. Every panel is built
+    only once and then reused. Panels can define three methods that are called
+    by the pool:
+
+        activate()  when the panel is shown, to rebind it to the current game
+                    state
+        release()   when another panel is shown or the panel is disposed, to
+                    stop timers and disconnect from the buzzer API
+        dispose()   before the panel is deleted, to stop listening to the
+                    game
+
+    :param stacked_widget: QStackedWidget containing all panels
+    """
+    def __init__(self, stacked_widget):
+        self.stacked_widget = stacked_widget
+        self.panels = {}
+        self.current_name = None
+        self.created_panels = 0
+
+    def get(self, name, factory=None):
+        """Returns the panel with the given name. If it does not exist yet,
+        it is built by calling the factory.
+
+        :param name: name of the panel
+        :param factory: callable returning a new panel, None if the panel
+                        should not be built
+        :returns: the panel or None, if it does not exist and no factory was
+                  given
+        """
+        panel = self.panels.get(name)
+        if panel is None and factory:
+            panel = factory()
+            self.created_panels += 1
+            self.panels[name] = panel
+            self.stacked_widget.addWidget(panel)
+        return panel
+
+    def show(self, name, factory=None):
+        """Shows the panel with the given name after releasing the currently
+        shown panel.
+
+        :returns: the shown panel
+        """
+        panel = self.get(name, factory)
+        if panel is None:
+            raise KeyError('No panel with name "{}".'.format(name))
+        if self.current_name and self.current_name != name:
+            self.release(self.current_name)
+        self.current_name = name
+        if hasattr(panel, 'activate'):
+            panel.activate()
+        self.stacked_widget.setCurrentWidget(panel)
+        return panel
+
+    def replace(self, name, factory):
+        """Disposes the panel with the given name and builds a new one, e.g.
+        for panels that depend on the layout of a round."""
+        self.dispose(name)
+        return self.get(name, factory)
+
+    def release(self, name):
+        panel = self.panels.get(name)
+        if panel is not None and hasattr(panel, 'release'):
+            panel.release()
+
+    def dispose(self, name):
+        """Releases the panel with the given name, removes it from the
+        stacked widget and deletes it."""
+        panel = self.panels.pop(name, None)
+        if panel is None:
+            return
+        if hasattr(panel, 'release'):
+            panel.release()
+        if hasattr(panel, 'dispose'):
+            panel.dispose()
+        if self.current_name == name:
+            self.current_name = None
+        self.stacked_widget.removeWidget(panel)
+        panel.deleteLater()
+
+    def dispose_all(self, names=None):
+        """Disposes the given panels or all panels, e.g. after changing the
+        settings they were built with."""
+        for name in list(names if names is not None else self.panels):
+            self.dispose(name)
+
+
 ##### Miscellaneous functions for GUI
- 
+
 class HoverButton(QtGui.QPushButton):
     mouseHover = QtCore.pyqtSignal(bool)
 
@@ -135,45 +339,133 @@ def replace_line_breaks(string):
 
 ##### Functions for animating, hiding and showing widgets with opaycity effects
 
-def animate_widget(widget, fade_out, hook=None):
-    """Creates an opacity effect for the question label and fades it in or
-    out.
+class AnimationManager(object):
+    """Fades widgets in and out with opacity effects.
 
     Per default JLabel has no property 'opacity' so that QPropertyAnimation
     can not be used without adding a graphics effect from the QT library
-    (QGraphicsOpacityEffect).
+    (QGraphicsOpacityEffect). Every widget gets only one effect, which is
+    reused for all later animations and opacity changes. Running animations
+    are kept until they have finished and are deleted afterwards. A new
+    animation of a widget replaces the running one, so a fade in directly
+    after a fade out starts from the current opacity and the hook of the
+    replaced animation is not called.
+    """
+    def __init__(self):
+        # running animations, indexed by id of their effect
+        self.animations = {}
+        self.live_effects = 0
+        self.created_effects = 0
+        self.finished_animations = 0
+        self.replaced_animations = 0
+
+    def get_effect(self, widget):
+        """Returns the opacity effect of the widget and creates it, if the
+        widget has none yet."""
+        effect = widget.graphicsEffect()
+        if isinstance(effect, QtGui.QGraphicsOpacityEffect):
+            return effect
+        effect = QtGui.QGraphicsOpacityEffect(widget)
+        key = id(effect)
+        effect.destroyed.connect(lambda: self.on_effect_destroyed(key))
+        widget.setGraphicsEffect(effect)
+        self.live_effects += 1
+        self.created_effects += 1
+        return effect
+
+    def animate(self, widget, fade_out, hook=None):
+        """Fades a widget in or out.
+
+        :param widget: widget that should be faded out or in
+        :param fade_out: whether to fade out or in
+        :param hook: method that should be called when animation is over
+        """
+        effect = self.get_effect(widget)
+        key = id(effect)
+        start_value = effect.opacity()
+        if self.stop(key):
+            self.replaced_animations += 1
+        else:
+            # a new fade always starts fully visible or fully hidden
+            start_value = 1.0 if fade_out else 0.0
+        anim = QtCore.QPropertyAnimation(effect, 'opacity')
+        anim.setDuration(ANIMATION_TIME)
+        anim.setStartValue(start_value)
+        anim.setEndValue(0.0 if fade_out else 1.0)
+        anim.setEasingCurve(QtCore.QEasingCurve.InOutBack)
+        anim.finished.connect(lambda: self.on_animation_finished(key, anim, hook))
+        self.animations[key] = anim
+        anim.start()
+
+    def set_opacity(self, widget, opacity):
+        """Sets the opacity of a widget at once and stops a running animation
+        of the widget.
+
+        :param opacity: value between 0.0 and 1.0
+        """
+        effect = self.get_effect(widget)
+        self.stop(id(effect))
+        effect.setOpacity(float(opacity))
+
+    def cancel(self, widget):
+        """Stops a running animation of a widget without calling its hook."""
+        effect = widget.graphicsEffect()
+        if effect is not None:
+            self.stop(id(effect))
+
+    def stop(self, key):
+        anim = self.animations.pop(key, None)
+        if anim is None:
+            return False
+        anim.stop()
+        anim.deleteLater()
+        return True
+
+    def on_animation_finished(self, key, anim, hook):
+        # the animation may have been replaced while its last frame was shown
+        if self.animations.get(key) is anim:
+            del self.animations[key]
+        anim.deleteLater()
+        self.finished_animations += 1
+        if hook:
+            hook()
+
+    def on_effect_destroyed(self, key):
+        self.live_effects -= 1
+        anim = self.animations.pop(key, None)
+        if anim is not None:
+            anim.deleteLater()
+
+    def get_statistics(self):
+        """Returns the number of running animations and live effects for
+        monitoring."""
+        return {'animations': len(self.animations),
+                'effects': self.live_effects,
+                'created effects': self.created_effects,
+                'finished animations': self.finished_animations,
+                'replaced animations': self.replaced_animations}
+
+
+def get_animation_manager():
+    global STATIC_INSTANCE_OF_ANIMATION_MANAGER
+    if not STATIC_INSTANCE_OF_ANIMATION_MANAGER:
+        STATIC_INSTANCE_OF_ANIMATION_MANAGER = AnimationManager()
+    return STATIC_INSTANCE_OF_ANIMATION_MANAGER
+
+
+def animate_widget(widget, fade_out, hook=None):
+    """Fades a widget in or out, see AnimationManager.animate().
 
     :param widget: widget that should be faded out or in
     :param fade_out: whether to fade out or in
     :param hook: method that should be called when animation is over
     """
-    # set start and stop opacity
-    if fade_out:
-        start_value = 1.0
-        stop_value = 0.0
-    else:
-        start_value = 0.0
-        stop_value = 1.0
-    # generate effect class
-    effect = QtGui.QGraphicsOpacityEffect(widget)
-    widget.setGraphicsEffect(effect)
-    # fade question in/out
-    anim = QtCore.QPropertyAnimation(effect, "opacity")
-    anim.setDuration(ANIMATION_TIME)
-    anim.setStartValue(start_value)
-    anim.setEndValue(stop_value)
-    anim.setEasingCurve(QtCore.QEasingCurve.InOutBack)
-    ###
-    # Add currently constructed animation object to list of all animations
-    # so that they are not destroyed when this method is through. After the
-    # animation has run the objects can live happily ever after in the
-    # list!
-    ###
-    global animation_list
-    animation_list.append(anim)
-    anim.start()
-    if hook:
-        anim.finished.connect(hook)
+    get_animation_manager().animate(widget, fade_out, hook)
+
+
+def cancel_animation(widget):
+    """Stops a running animation of a widget without calling its hook."""
+    get_animation_manager().cancel(widget)
 
 
 def hide_widget(widget):
@@ -187,8 +479,7 @@ def show_widget(widget):
 def set_opacity_for_widget(widget, opacity):
     """Sets opacity for a given widget. Not all widgets provide an opacity
     property that can be changed by using stylesheets. For those widgets
-    this function provides a QGraphicsOpacityEffect and sets the opacity of
-    the effect object to the given value.
+    the opacity of the QGraphicsOpacityEffect of the widget is changed.
 
     It should work with all pyQt widgets?!
 
@@ -196,15 +487,10 @@ def set_opacity_for_widget(widget, opacity):
     :param opacity: value for the opacity that should be set, should be a float
                     between 0.0 and 1.0.
     """
-    # generate effect class
-    effect = QtGui.QGraphicsOpacityEffect(widget)
-    widget.setGraphicsEffect(effect)
-    # set opacity
-    effect.setOpacity(float(opacity))
+    get_animation_manager().set_opacity(widget, opacity)
+
 
 def whitefy(widget):
     if config.HIGH_CONTRAST:
-        p = widget.palette()
         widget.setAutoFillBackground(True)
-        p.setColor(widget.backgroundRole(), QtCore.Qt.white)
-        widget.setPalette(p)
+        widget.setPalette(theme.get_theme().get_white_palette(widget))
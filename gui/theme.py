@@ -0,0 +1,123 @@
+"""
+pyPardy
+
+Shared fonts, style sheets and palettes for all panels. A theme is built once
+for every combination of base font, resolution and contrast setting and its
+fonts and styles are handed out to all panels, so building a panel does not
+resolve the same fonts again.
+
+@author: Christian Wichmann
+"""
+
+import logging
+
+from PyQt4 import QtGui
+from PyQt4 import QtCore
+
+from data import config
+
+
+logger = logging.getLogger('pyPardy.gui')
+
+
+# point sizes of all fonts as tuple (normal resolution, low resolution)
+FONT_SIZES = {
+    # question table
+    'table title': (46, 32),
+    'table topic': (24, 16),
+    'table question': (56, 36),
+    # question view
+    'question': (42, 30),
+    'question button': (24, 18),
+    # team view in both orientations
+    'team vertical': (26, 20),
+    'team horizontal': (32, 26),
+    # game over dialog
+    'game over title': (36, 30),
+    'game over team': (26, 26),
+    'game over points': (20, 20),
+    # available rounds
+    'rounds title': (42, 32),
+    'rounds button': (36, 24),
+    # buzzer config, configuration and information panel
+    'label': (30, 22),
+    # editor
+    'editor title': (30, 18),
+    'editor button': (20, 14),
+}
+
+# style sheets as tuple (normal contrast, high contrast)
+STYLES = {
+    'info button': ('background-color: yellow; color: black;', 'color: black;'),
+    'transparent': ('background-color: none;', 'background-color: none;'),
+    'question background': ("""background-color: qlineargradient(
+                               x1: 0, y1: 0, x2: 0, y2: 1,
+                               stop: 0 #ffffff, stop: 1 #eeeeee);""",) * 2,
+    'team normal': ('', ''),
+    'team selected': ('background: red; color: white; border-radius: 15px; border-width: 4px;',) * 2,
+    'team deactivated': ('background: grey; color: grey; border-radius: 15px; border-width: 4px;',) * 2,
+    'buzzer team normal': ('border: none; background: none; color: black',) * 2,
+    'buzzer team highlighted': ('border: none; background: none; color: red',) * 2,
+    'game over place': ('background: yellow; border:1px solid grey;',) * 2,
+}
+
+# themes that were already built, indexed by their settings
+themes = {}
+
+
+class Theme(object):
+    """Fonts, style sheets and palettes for one combination of settings.
+    Fonts are built when they are first requested and then shared.
+
+    :param base_font: family of all fonts
+    :param low_resolution: whether the smaller fonts should be used
+    :param high_contrast: whether the styles for high contrast should be used
+    """
+    def __init__(self, base_font, low_resolution, high_contrast):
+        self.base_font = base_font
+        self.low_resolution = low_resolution
+        self.high_contrast = high_contrast
+        self.styles = {name: styles[1 if high_contrast else 0]
+                       for name, styles in STYLES.items()}
+        self.__fonts = {}
+        self.__palettes = {}
+
+    def get_font(self, name):
+        """Returns the font with the given name from FONT_SIZES."""
+        font = self.__fonts.get(name)
+        if font is None:
+            font = QtGui.QFont(self.base_font)
+            font.setPointSize(FONT_SIZES[name][1 if self.low_resolution else 0])
+            self.__fonts[name] = font
+        return font
+
+    def get_style(self, name):
+        """Returns the style sheet with the given name from STYLES."""
+        return self.styles[name]
+
+    def get_white_palette(self, widget):
+        """Returns a palette for the widget with a white background. The
+        palette is shared by all widgets of the same class."""
+        key = (type(widget), widget.backgroundRole())
+        palette = self.__palettes.get(key)
+        if palette is None:
+            palette = QtGui.QPalette(widget.palette())
+            palette.setColor(widget.backgroundRole(), QtCore.Qt.white)
+            self.__palettes[key] = palette
+        return palette
+
+
+def get_theme():
+    """Returns the theme for the current settings. A new theme is only built
+    if the settings were changed."""
+    key = (config.BASE_FONT, config.LOW_RESOLUTION, config.HIGH_CONTRAST)
+    theme = themes.get(key)
+    if theme is None:
+        logger.info('Building theme for font "{}", low resolution: {}, high contrast: {}'
+                    .format(*key))
+        theme = themes[key] = Theme(*key)
+    return theme
+
+
+if __name__ == '__main__':
+    pass
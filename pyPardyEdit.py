@@ -16,9 +16,12 @@ from PyQt4 import QtGui
 from PyQt4 import QtCore
 
 from data import round
+from data import saver
+from data.model import Question
 from data import config
 import data.game
 from gui import helper
+from gui import theme
 from gui import game
 
 
@@ -34,19 +37,14 @@ class AvailableRoundPanel(QtGui.QMainWindow):
         self.setup_ui()
         self.set_signals_and_slots()
         self.current_game = data.game.Game()
+        self.round_saver = None
+        self.undo_journal = saver.UndoJournal()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(18)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(14)
-        else:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(30)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(20)
-            
+        current_theme = theme.get_theme()
+        self.title_font = current_theme.get_font('editor title')
+        self.button_font = current_theme.get_font('editor button')
+
     def setup_ui(self):
         self.resize(self.WIDTH, self.HEIGHT)
         self.setWindowTitle(config.APP_NAME)
@@ -65,7 +63,8 @@ class AvailableRoundPanel(QtGui.QMainWindow):
         self.button_box.addWidget(title_label)
         self.button_box.addStretch(2)
         # add buttons for all available rounds
-        data = round.get_available_round_data()
+        # the editor only works with round data files, not with bundles
+        data = round.get_available_round_data(include_bundles=False)
         for title, filename in data:
             new_button = QtGui.QPushButton(title)
             new_button.title = title
@@ -99,12 +98,21 @@ class AvailableRoundPanel(QtGui.QMainWindow):
 
     def set_signals_and_slots(self):
         """Sets all signals and slots for main window."""
-        pass
+        undo_shortcut = QtGui.QShortcut(QtGui.QKeySequence.Undo, self)
+        undo_shortcut.activated.connect(self.on_undo)
+
+    def closeEvent(self, event):
+        # write the last edits before the editor is closed
+        if self.round_saver:
+            self.round_saver.close()
+        event.accept()
 
     @QtCore.pyqtSlot()
     def on_button_click(self):
         self.last_loaded_file = self.sender().filename
         logger.info('Round data file "{}" loaded.'.format(self.last_loaded_file))
+        self.round_saver = saver.RoundSaver(self.last_loaded_file)
+        self.undo_journal = saver.UndoJournal()
         self.current_game.current_round_data = round.load_round_data_file(self.last_loaded_file)
         # create new question table and connect it to method of this class
         self.current_round_question_panel = game.QuestionTablePanel(self, self.current_game,
@@ -121,15 +129,35 @@ class AvailableRoundPanel(QtGui.QMainWindow):
                                     topic, question)
         dialog.exec_()
         if dialog.data_has_changed:
-            logger.info('Round data saved to file.')
-            round.save_round_data_file(self.last_loaded_file,
-                                       self.current_game.current_round_data)
+            self.change_round_data(dialog.data)
+
+    def change_round_data(self, round_data, undoable=True):
+        """Replaces the edited round and saves it in the background.
+
+        :param round_data: Round object with the changed round
+        :param undoable: whether the previous version should be kept in the
+                         undo journal
+        """
+        if undoable:
+            self.undo_journal.record(self.current_game.current_round_data)
+        self.current_game.update_round_data(round_data)
+        self.round_saver.schedule(round_data)
+
+    @QtCore.pyqtSlot()
+    def on_undo(self):
+        if not self.round_saver:
+            return
+        round_data = self.undo_journal.undo()
+        if round_data:
+            logger.info('Undoing last change of round data.')
+            self.change_round_data(round_data, undoable=False)
 
 
 class EditQuestionDialog(QtGui.QDialog):
     """Panel showing all available rounds.
 
-    :param data: round data qith the question that should be edited
+    :param data: Round object with the question that should be edited,
+                 after the dialog was closed it contains the changed round
     :param topic: number of the topic that should be edited
     :param question: number of question of the given that should be edited
     """
@@ -145,17 +173,10 @@ class EditQuestionDialog(QtGui.QDialog):
         self.set_signals_and_slots()
 
     def create_fonts(self):
-        if config.LOW_RESOLUTION:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(18)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(14)
-        else:
-            self.title_font = QtGui.QFont(config.BASE_FONT)
-            self.title_font.setPointSize(30)
-            self.button_font = QtGui.QFont(config.BASE_FONT)
-            self.button_font.setPointSize(20)
-            
+        current_theme = theme.get_theme()
+        self.title_font = current_theme.get_font('editor title')
+        self.button_font = current_theme.get_font('editor button')
+
     def setup_ui(self):
         self.setWindowTitle(config.APP_NAME + ' - Frage editieren...')
         self.setWindowIcon(QtGui.QIcon('icons/buzzer.png'))
@@ -165,8 +186,8 @@ class EditQuestionDialog(QtGui.QDialog):
         margin = 10
         self.layout.setSpacing(margin)
         # extract correct question data from round data        
-        question_data = self.data['topics'][self.topic]['questions'][self.question]        
-        topic_text = self.data['topics'][self.topic]['title']
+        question_data = self.data.get_question(self.topic, self.question)
+        topic_text = self.data.topics[self.topic].title
         question_text = (self.question + 1) * config.QUESTION_POINTS
         # add title for dialog (and remove line breaks in topic names!)
         title_text = '{} - {}'.format(topic_text, question_text).replace('<br>', '')
@@ -177,12 +198,12 @@ class EditQuestionDialog(QtGui.QDialog):
         # add text fields for question and answer
         self.layout.addWidget(QtGui.QLabel('Frage: '), 1, 0, QtCore.Qt.AlignTop)
         self.question_text_field = QtGui.QTextEdit()
-        self.question_text_field.setText(question_data['question'])
+        self.question_text_field.setText(question_data.question)
         self.question_text_field.setMaximumHeight(75)
         self.layout.addWidget(self.question_text_field, 1, 1)
         self.layout.addWidget(QtGui.QLabel('Antwort: '), 2, 0, QtCore.Qt.AlignTop)
         self.answer_text_field = QtGui.QTextEdit()
-        self.answer_text_field.setText(question_data['answer'])
+        self.answer_text_field.setText(question_data.answer)
         self.answer_text_field.setMaximumHeight(75)
         self.layout.addWidget(self.answer_text_field, 2, 1)
         # add close button
@@ -208,12 +229,15 @@ class EditQuestionDialog(QtGui.QDialog):
         # save data
         if save_data:
             self.data_has_changed = True
-            question_data = self.data['topics'][self.topic]['questions'][self.question]
+            old_question = self.data.get_question(self.topic, self.question)
             # use method 'toHtml()' to get line breaks from text fields
-            text = self.question_text_field.toPlainText().replace('\n', '<br>')
-            question_data['question'] = text
-            text = self.answer_text_field.toPlainText().replace('\n', '<br>')
-            question_data['answer'] = text
+            question_text = self.question_text_field.toPlainText().replace('\n', '<br>')
+            answer_text = self.answer_text_field.toPlainText().replace('\n', '<br>')
+            new_question = Question(question_text, answer_text,
+                                    old_question.comment, old_question.extra)
+            # round data is immutable, so a new round is created
+            self.data = self.data.replace_question(self.topic, self.question,
+                                                   new_question)
         # close dialog
         self.close()
 